@@ -0,0 +1,77 @@
+"""
+Set up shared by the benchmarks & checks.
+
+Each runs against a temporary db, made by temporary_db(), so leaves any real
+podcasts.db untouched.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import db
+import plaintext
+# Before episode, which can't be imported first as the two import each other
+from feed import Feed
+
+from typing import(
+    Callable,
+    Optional,
+    Tuple,
+)
+
+
+def temporary_db(**pragmas) -> str:
+    """
+    Point the db at a new, empty file in a temporary directory.
+    :param pragmas: Pragmas to set as well, see db.configure()
+    :return: Path to the db file
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    db.configure(path, **pragmas)
+    return path
+
+
+def populate(episodes: int, feeds: int = 1,
+             published: Callable[[int], float] = lambda i: i,
+             played: Callable[[int], Optional[float]] = lambda i: None,
+             description: Optional[str] = 'x' * 200,
+             guid: str = 'guid-{i}',
+             url: str = 'http://bench/{feed}/{i}.mp3',
+             title: str = 'Episode {i}') -> Tuple[Feed, ...]:
+    """
+    Fill the db with synthetic feeds & episodes, written directly rather
+    than through Feed, so quick to make in bulk.
+    Episode i belongs to feed i % feeds, so each feed's episodes are spread
+    over the whole range of publish dates.
+    :param published: Publish timestamp of episode i
+    :param played: When episode i was played, None if it wasn't
+    :param description: HTML description of every episode, None for none
+    :param guid: Format of each episode's GUID, given i & feed
+    :param url: Format of each episode's url, given i & feed
+    :param title: Format of each episode's title, given i & feed
+    :return: The feeds
+    """
+    c = db.cursor()
+    ids = []
+    for f in range(feeds):
+        c.execute('INSERT INTO feeds(url, title) VALUES(?,?);', ('http://bench/%d' % f, 'Feed %d' % f))
+        ids.append(c.lastrowid)
+    c.executemany(
+        'INSERT INTO episodes(feedID, guid, url, title, published, played) VALUES(?,?,?,?,?,?);',
+        ((ids[i % feeds],
+          guid.format(i=i, feed=i % feeds),
+          url.format(i=i, feed=i % feeds),
+          title.format(i=i, feed=i % feeds),
+          published(i),
+          played(i))
+         for i in range(episodes)),
+    )
+    if description is not None:
+        c.execute(
+            'INSERT INTO descriptions(episodeID, html, text) SELECT id, ?, ? FROM episodes;',
+            (db.compress(description), plaintext.render(description)),
+        )
+    db.connection.commit()
+    return tuple(Feed(id) for id in ids)
@@ -0,0 +1,164 @@
+"""
+Check AudioCache against a local HTTP server serving episode audio.
+Downloads an episode whole, resumes one from a partial download with a Range
+request, evicts the least recently played to stay within budget, and stops
+with downloads queued & in progress, timing how long stopping takes and
+checking the queued downloads never start.
+Exits non-zero if any check fails.
+Downloads to a temporary cache directory, so leaves any real cache untouched.
+
+Usage: python benchmarks/audio_cache.py [--max-ms MS]
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+from _fixtures import temporary_db
+
+import db
+from episode import Episode
+from cache import AudioCache
+
+_size = 256 * 1024
+# Bytes the server writes at a time, pausing AudioServer.pause between each
+_piece = 16 * 1024
+
+
+def _audio(i: int) -> bytes:
+    return bytes((i + j) % 251 for j in range(_size))
+
+
+class AudioServer:
+    """
+    Serves _audio(i) at /i.mp3, honouring Range requests, writing slowly
+    while pause is set, in a background thread.
+    """
+    def __init__(self):
+        self.pause    : float = 0
+        self.requests : list = []
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def url(self, i: int) -> str:
+        return 'http://127.0.0.1:{}/{}.mp3'.format(self._server.server_address[1], i)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = _audio(int(self.path.strip('/').split('.')[0]))
+                wanted = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range', ''))
+                start = int(wanted.group(1)) if wanted else 0
+                server.requests.append((self.path, start))
+                self.send_response(206 if wanted else 200)
+                self.send_header('Content-Type', 'audio/mpeg')
+                self.send_header('Content-Length', str(len(body) - start))
+                if wanted:
+                    self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, len(body) - 1, len(body)))
+                self.end_headers()
+                try:
+                    for i in range(start, len(body), _piece):
+                        self.wfile.write(body[i:i + _piece])
+                        time.sleep(server.pause)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _episodes(server: AudioServer, n: int):
+    c = db.cursor()
+    c.execute('INSERT INTO feeds(url, title) VALUES(?,?);', ('http://bench/feed', 'Feed'))
+    c.executemany(
+        'INSERT INTO episodes(id, feedID, guid, url, title, published) VALUES(?,?,?,?,?,?);',
+        ((i, 1, 'guid-%d' % i, server.url(i), 'Episode %d' % i, i) for i in range(1, n + 1)),
+    )
+    db.connection.commit()
+    return [Episode(i) for i in range(1, n + 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-ms', type=float, default=100, help='Longest stop() may take')
+    args = parser.parse_args()
+
+    temporary_db()
+    cache = AudioCache(directory=tempfile.mkdtemp(), workers=1)
+    failed = []
+
+    def check(ok: bool, name: str):
+        print('%-4s %s' % ('ok' if ok else 'FAIL', name))
+        if not ok:
+            failed.append(name)
+
+    with AudioServer() as server:
+        e = _episodes(server, 8)
+
+        path = cache.download(e[0]).result()
+        check(open(path, 'rb').read() == _audio(1), 'a download is whole')
+        check(cache.path(e[0]) == path, 'a downloaded episode is played from the cache')
+        check(cache.path(e[1]) is None, 'an episode not downloaded is streamed')
+
+        # Half a file left from an earlier download
+        with open(cache._file(2, e[1].url) + '.part', 'wb') as f:
+            f.write(_audio(2)[:_size // 2])
+        server.requests.clear()
+        path = cache.download(e[1]).result()
+        check(server.requests == [('/2.mp3', _size // 2)], 'a partial download resumes from where it was')
+        check(open(path, 'rb').read() == _audio(2), 'a resumed download is whole')
+
+        # Room for two, with the first played least recently
+        cache.budget = 2 * _size
+        db.write(lambda: db.connection.execute('UPDATE downloads SET accessed=0 WHERE episodeID=1;')).result()
+        cache.download(e[2]).result()
+        check(cache.path(e[0]) is None and cache.path(e[1]) and cache.path(e[2]),
+              'the least recently played download is evicted')
+
+        server.pause = 0.05
+        server.requests.clear()
+        futures = [cache.download(x) for x in e[3:]]
+        time.sleep(0.3)
+        start = perf_counter()
+        cache.stop()
+        elapsed = (perf_counter() - start) * 1000
+        print('stopped in %.1f ms' % elapsed)
+        check(elapsed <= args.max_ms, 'stopping doesn\'t wait on downloads')
+        # Within a chunk or so of stopping
+        try:
+            futures[0].result(timeout=1)
+            abandoned = False
+        except AudioCache.Stopped:
+            abandoned = True
+        check(abandoned, 'the download in progress is abandoned')
+        check(os.path.exists(cache._file(4, e[3].url) + '.part') and cache.path(e[3]) is None,
+              'an abandoned download is left to resume')
+        check(all(f.cancelled() for f in futures[1:]), 'queued downloads are cancelled')
+        check(len(server.requests) == 1, 'queued downloads never start')
+        check(cache.download(e[7]).cancelled(), 'nothing is downloaded once stopped')
+
+    for f in failed:
+        print('FAILED: ' + f, file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""
+Benchmark the memory & time taken to hold a large library in memory through
+Episode.getall(), measured with tracemalloc.
+
+Usage: python benchmarks/episode_memory.py [episodes] [feeds]
+"""
+import gc
+import sys
+import tracemalloc
+from time import perf_counter, time
+
+from _fixtures import populate, temporary_db
+
+from episode import Episode
+
+
+def main(episodes: int = 100000, feeds: int = 100):
+    temporary_db()
+    now = int(time())
+    # Urls & GUIDs about as long as real ones, a third of episodes played
+    populate(
+        episodes, feeds,
+        published=lambda i: now - (episodes - i) * 3600,
+        played=lambda i: now if i % 3 == 0 else None,
+        description='<p>' + 'x' * 500 + '</p>',
+        guid='tag:podcasts.example.com,2020:episode/{i:08d}',
+        url='https://media.example.com/podcasts/feed-{feed}/episodes/{i:08d}/audio.mp3',
+        title='Episode {i}: a title of a typical sort of length',
+    )
+
+    start = perf_counter()
+    all = Episode.getall()
+    elapsed = perf_counter() - start
+    del all
+    Episode.invalidate()
+    gc.collect()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    all = Episode.getall()
+    gc.collect()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    held -= before
+    peak -= before
+
+    print('{} episodes across {} feeds, through Episode.getall()'.format(len(all), feeds))
+    print('%-24s %9.1f ms' % ('time', elapsed * 1000))
+    print('%-24s %9.1f MB' % ('held', held / 2 ** 20))
+    print('%-24s %9.1f MB' % ('peak', peak / 2 ** 20))
+    print('%-24s %9.0f B' % ('held per episode', held / len(all)))
+
+
+if __name__ == '__main__':
+    main(*(int(x) for x in sys.argv[1:]))
@@ -0,0 +1,186 @@
+"""
+Synthetic RSS feeds, served from a local HTTP server, for benchmarks.
+
+Feeds are generated deterministically from their name & size, and served
+with ETag & Last-Modified headers, answering conditional GETs with 304 Not
+Modified, so refreshes behave as they would against a well behaved host.
+"""
+import gzip
+import hashlib
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+from typing import(
+    Dict,
+    Tuple,
+)
+
+# Publish dates of generated episodes are a day apart, counting up from here
+_epoch = 1500000000
+_day = 24 * 60 * 60
+
+_words = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+    'tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam'
+).split()
+
+
+def rss(name: str, episodes: int, description: int = 200, start: int = 0,
+        base: str = 'http://127.0.0.1') -> bytes:
+    """
+    Generate an RSS 2.0 feed, newest episode first.
+    :param name: Feed name, used in its title & GUIDs
+    :param episodes: Number of episodes
+    :param description: Length of each episode's description, in characters
+    :param start: Number of the oldest episode, so feeds can 'publish' new
+                  episodes by generating from a later start
+    :param base: Base url of the episodes' enclosures
+    """
+    items = []
+    for i in reversed(range(start, start + episodes)):
+        text = ' '.join(_words[(i + j) % len(_words)] for j in range(description // 5 + 1))
+        items.append(
+            '<item>'
+            '<title>{name} episode {i}</title>'
+            '<guid isPermaLink="false">{name}-{i}</guid>'
+            '<description>{text}</description>'
+            '<pubDate>{date}</pubDate>'
+            '<enclosure url="{base}/{name}/{i}.mp3" type="audio/mpeg" length="1"/>'
+            '</item>'.format(
+                name=escape(name),
+                i=i,
+                text=escape(text[:description]),
+                date=formatdate(_epoch + i * _day),
+                base=base,
+            )
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0"><channel>'
+        '<title>{0}</title><description>Synthetic feed {0}</description><link>{1}</link>'
+        '{2}'
+        '</channel></rss>'.format(escape(name), base, ''.join(items))
+    ).encode()
+
+
+class FeedServer:
+    """
+    Serves feeds from memory on a local port, in a background thread.
+    Use as a context manager, or call start() & stop().
+    """
+    def __init__(self, port: int = 0, delay: float = 0, conditional: bool = True):
+        """
+        :param port: Port to listen on, 0 for any free port
+        :param delay: Seconds to wait before answering each request, to
+                      stand in for network latency or a slow host
+        :param conditional: Whether to answer conditional GETs with 304s, as
+                            plenty of hosts don't
+        """
+        self.requests     : int = 0
+        self.not_modified : int = 0
+        self.connections  : int = 0
+        self.delay        : float = delay
+        self.conditional  : bool = conditional
+
+        self._feeds : Dict[str, Tuple[bytes, str, str]] = {}
+        self._lock  : threading.Lock = threading.Lock()
+        self._version = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def base(self) -> str:
+        return 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    def url(self, path: str) -> str:
+        return '{}/{}'.format(self.base, path)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def set(self, path: str, body: bytes):
+        """
+        Serve body at path, with a new ETag & Last-Modified if it has changed.
+        """
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        with self._lock:
+            if path in self._feeds and self._feeds[path][1] == etag:
+                return
+            # Each change is a second after the last, so Last-Modified always moves on
+            self._version += 1
+            self._feeds[path] = (body, etag, formatdate(_epoch + self._version, usegmt=True))
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keeps connections open between requests, as real hosts do
+            protocol_version = 'HTTP/1.1'
+            # Otherwise each header goes out in its own small write, and
+            # delayed ACKs hold a kept alive connection up by ~40ms a request
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def do_GET(self):
+                if server.delay:
+                    time.sleep(server.delay)
+                with server._lock:
+                    server.requests += 1
+                    feed = server._feeds.get(self.path.lstrip('/'))
+                if feed is None:
+                    self.send_error(404)
+                    return
+                body, etag, modified = feed
+                if server.conditional and self._not_modified(etag, modified):
+                    with server._lock:
+                        server.not_modified += 1
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/rss+xml')
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    body = gzip.compress(body, mtime=0)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', modified)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _not_modified(self, etag: str, modified: str) -> bool:
+                # If-None-Match takes precedence, as per RFC 7232
+                if 'If-None-Match' in self.headers:
+                    return etag in (x.strip() for x in self.headers['If-None-Match'].split(','))
+                since = self.headers.get('If-Modified-Since')
+                if since:
+                    try:
+                        return parsedate_to_datetime(since) >= parsedate_to_datetime(modified)
+                    except (TypeError, ValueError):
+                        return False
+                return False
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,52 @@
+"""
+Benchmark loading a feed's episodes, comparing the old query-per-object path
+with the bulk hydration used by Episode.getbyfeed().
+
+Usage: python benchmarks/load_episodes.py [sizes...]
+"""
+import sys
+from timeit import timeit
+
+from _fixtures import populate, temporary_db
+
+import db
+from feed import Feed
+from episode import Episode
+
+_sizes = (100, 500, 1000, 2000, 5000)
+_repeat = 5
+
+
+def _forget():
+    """Drop cached Episodes, so each run has to hydrate every object."""
+    Episode.invalidate()
+
+
+def _per_id(f: Feed):
+    """The old N+1 path: one query for the ids, then one per object."""
+    c = db.connection.execute('SELECT id FROM episodes WHERE feedID=? ORDER BY published ASC;', (f.id,))
+    return tuple(Episode(x['id']) for x in c.fetchall())
+
+
+def _time(fn, f: Feed) -> float:
+    def run():
+        _forget()
+        fn(f)
+    return timeit(run, number=_repeat) / _repeat * 1000
+
+
+def main(sizes):
+    print('%10s %12s %12s %12s' % ('episodes', 'per-id ms', 'bulk ms', 'cached ms'))
+    for n in sizes:
+        temporary_db()
+        _forget()
+        f, = populate(n)
+        before = _time(_per_id, f)
+        after = _time(Episode.getbyfeed, f)
+        Episode.getbyfeed(f)
+        cached = timeit(lambda: Episode.getbyfeed(f), number=_repeat) / _repeat * 1000
+        print('%10d %12.2f %12.2f %12.2f' % (n, before, after, cached))
+
+
+if __name__ == '__main__':
+    main(tuple(int(x) for x in sys.argv[1:]) or _sizes)
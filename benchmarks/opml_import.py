@@ -0,0 +1,90 @@
+"""
+Benchmark importing subscriptions from OPML, comparing adding each feed in
+turn with Feed.add() against the parallel, batched opml.import_feeds().
+Feeds are served locally with a delay standing in for network latency, and
+the OPML lists some feeds twice (spelt differently) and some that 404, to
+check they're reported as duplicates & failures.
+Runs against temporary dbs, so leaves any real podcasts.db untouched.
+
+Usage: python benchmarks/opml_import.py [feeds] [episodes] [latency in ms]
+"""
+import io
+import os
+import sys
+import tempfile
+from time import perf_counter
+from xml.sax.saxutils import quoteattr
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import db
+import opml
+from feed import Feed
+from episode import Episode
+from feedserver import FeedServer, rss
+
+
+def _fresh():
+    db.configure(os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    Feed.invalidate()
+    Episode.invalidate()
+
+
+def _opml(urls) -> bytes:
+    outlines = ''.join('<outline type="rss" text="x" xmlUrl={}/>'.format(quoteattr(u)) for u in urls)
+    return '<?xml version="1.0"?><opml version="2.0"><body><outline text="Podcasts">{}</outline></body></opml>'.format(
+        outlines,
+    ).encode()
+
+
+def main(feeds: int = 100, episodes: int = 50, latency: float = 50):
+    with FeedServer(delay=latency / 1000) as server:
+        names = ['feed%d' % i for i in range(feeds)]
+        for name in names:
+            server.set(name, rss(name, episodes, base=server.base))
+        urls = [server.url(name) for name in names]
+        # Some listed twice, differently spelt, and some that don't exist
+        doubled = [u.replace('http://', 'HTTP://') + '#again' for u in urls[:feeds // 10]]
+        missing = [server.url('missing%d' % i) for i in range(feeds // 20)]
+
+        _fresh()
+        start = perf_counter()
+        for u in urls:
+            Feed.add(u)
+        sequential = perf_counter() - start
+
+        _fresh()
+        done = []
+        start = perf_counter()
+        # Every feed is on the one local host, so the per host limit is
+        # lifted to stand in for subscriptions spread over many hosts
+        report = opml.import_feeds(
+            io.BytesIO(_opml(urls + doubled + missing)),
+            progress=lambda n, total, r: done.append(n),
+            per_host=8,
+        )
+        parallel = perf_counter() - start
+
+        assert len(report.added) == feeds, report
+        assert len(report.duplicates) == len(doubled), report.duplicates
+        assert len(report.failed) == len(missing), report.failed
+        assert done == list(range(1, len(urls + doubled + missing) + 1))
+        count = db.connection.execute('SELECT COUNT(*) FROM episodes;').fetchone()[0]
+        assert count == feeds * episodes, count
+
+        # Exporting & importing again into an empty db gets every feed back
+        out = io.StringIO()
+        assert opml.export(out) == feeds
+        _fresh()
+        again = opml.import_feeds(io.BytesIO(out.getvalue().encode()))
+        assert len(again.added) == feeds and not again.failed, again
+
+    print('{} feeds of {} episodes, {:g} ms latency'.format(feeds, episodes, latency))
+    print('%-28s %10.2f s' % ('Feed.add() each in turn', sequential))
+    print('%-28s %10.2f s' % ('opml.import_feeds()', parallel))
+    print('added {}, duplicates {}, failed {}'.format(len(report.added), len(report.duplicates), len(report.failed)))
+
+
+if __name__ == '__main__':
+    main(*(float(x) if i == 2 else int(x) for i, x in enumerate(sys.argv[1:])))
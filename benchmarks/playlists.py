@@ -0,0 +1,95 @@
+"""
+Benchmark opening & scrolling the smart playlists of a large library,
+comparing keyset pagination (Episode.page()) with LIMIT/OFFSET paging, and
+with loading the whole library through Episode.getall().
+
+Usage: python benchmarks/playlists.py [episodes] [feeds]
+"""
+import sys
+from time import perf_counter, time
+
+from _fixtures import populate, temporary_db
+
+import db
+from episode import Episode
+
+_page = 64
+_repeat = 5
+
+
+def _populate(episodes: int, feeds: int):
+    temporary_db()
+    now = int(time())
+    # Published an hour apart, newest now, with every few sharing a time so
+    # pages have to break ties on id; a third of them played
+    populate(
+        episodes, feeds,
+        published=lambda i: now - (episodes - i) // 3 * 3600,
+        played=lambda i: now if i % 3 == 0 else None,
+        description=None,
+    )
+
+
+def _offset(where: str, newest: bool, limit: int, offset: int):
+    """The OFFSET equivalent of Episode.page()."""
+    sql = 'SELECT * FROM episodes WHERE {0} ORDER BY published {1}, id {1} LIMIT ? OFFSET ?;'.format(
+        where, 'DESC' if newest else 'ASC',
+    )
+    return tuple(Episode(x['id'], x) for x in db.connection.execute(sql, (limit, offset)))
+
+
+def _time(fn) -> float:
+    total = 0.0
+    for _ in range(_repeat):
+        Episode.invalidate()
+        start = perf_counter()
+        fn()
+        total += perf_counter() - start
+    return total / _repeat * 1000
+
+
+def main(episodes: int = 200000, feeds: int = 200):
+    _populate(episodes, feeds)
+    print('{} episodes across {} feeds, {} per page'.format(episodes, feeds, _page))
+    print('%-12s %12s %14s %14s %14s' % ('playlist', 'first page', 'middle, key', 'middle, offset', 'last, offset'))
+    for name, (where, newest) in Episode.playlists.items():
+        total = db.connection.execute('SELECT COUNT(*) FROM episodes WHERE {};'.format(where)).fetchone()[0]
+        middle = total // 2
+        # The key of the row before the middle, as a list scrolled that far holds
+        before = _offset(where, newest, 1, middle - 1) if middle else ()
+        first = _time(lambda: Episode.page(name, None, _page))
+        if before:
+            key = _time(lambda: Episode.page(name, before[0].key, _page))
+            offset = _time(lambda: _offset(where, newest, _page, middle))
+            last = _time(lambda: _offset(where, newest, _page, total - _page))
+            print('%-12s %9.2f ms %11.2f ms %11.2f ms %11.2f ms' % (name, first, key, offset, last))
+        else:
+            print('%-12s %9.2f ms %14s %14s %14s' % (name, first, '-', '-', '-'))
+
+    # Check paging by key visits every episode exactly once, in order
+    ids, after = [], None
+    while True:
+        page = Episode.page('All', after, 5000)
+        if not page:
+            break
+        ids.extend(e.id for e in page)
+        after = page[-1].key
+    sql = 'SELECT id FROM episodes ORDER BY published, id;'
+    assert ids == [x[0] for x in db.connection.execute(sql)], 'keyset paging missed or repeated episodes'
+    assert len(ids) == Episode.count('All'), 'Episode.count() disagrees with paging'
+
+    # And backwards from the end, as jumping to the end of a list does
+    back, before = [], None
+    while True:
+        page = Episode.page('All', before, 5000, backward=True)
+        if not page:
+            break
+        back[:0] = [e.id for e in page]
+        before = page[0].key
+    assert back == ids, 'backward keyset paging missed or repeated episodes'
+
+    print('%-40s %9.2f ms' % ('Episode.getall(), the whole library', _time(Episode.getall)))
+
+
+if __name__ == '__main__':
+    main(*(int(x) for x in sys.argv[1:]))
@@ -0,0 +1,78 @@
+"""
+Check the queries the indexes in sql/ were added for still use them.
+Runs each query through the code that makes it, capturing the statement
+with its values as sqlite sees it, and asserts EXPLAIN QUERY PLAN names the
+expected index. Queries run on the db writer thread are given as SQL.
+Exits non-zero if any doesn't use its index.
+
+Usage: python benchmarks/query_plans.py
+"""
+import os
+import sys
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import db
+from feed import Feed
+from episode import Episode
+from playlists import _populate
+
+
+def _statements(fn):
+    """
+    :return: The statements fn ran on this thread's connection, values filled in
+    """
+    if isinstance(fn, str):
+        return [fn]
+    statements = []
+    db.connection.set_trace_callback(statements.append)
+    try:
+        fn()
+    finally:
+        db.connection.set_trace_callback(None)
+    return [s for s in statements if not s.startswith(('BEGIN', 'COMMIT', 'SAVEPOINT', 'RELEASE'))]
+
+
+def _plan(sql: str) -> str:
+    return '; '.join(x['detail'] for x in db.connection.execute('EXPLAIN QUERY PLAN ' + sql))
+
+
+def _checks(f: Feed):
+    """
+    :return: (name, what runs the query, the index it should use) of each query
+    """
+    return (
+        ('Episode.getbyfeed()',         lambda: Episode.getbyfeed(f),               'episodes__feed_published_index'),
+        ('Episode.page() of a feed',    lambda: Episode.page(f),                    'episodes__feed_published_index'),
+        ('Episode.page(), backward',    lambda: Episode.page(f, backward=True),     'episodes__feed_published_index'),
+        ('Episode.page() of All',       lambda: Episode.page('All'),                'episodes__published_index'),
+        ('Episode.page() of Recent',    lambda: Episode.page('Recent'),             'episodes__published_index'),
+        ('Episode.page() of Unplayed',  lambda: Episode.page('Unplayed'),           'episodes__unplayed_published_index'),
+        ('Episode.count() of Unplayed', lambda: Episode.count('Unplayed'),          'episodes__unplayed_published_index'),
+        ('Feed._guids()',               f._guids,                                   'COVERING INDEX episodes__feed_guid_index'),
+        ('Feed.maxtitlelength()',       Feed.maxtitlelength,                        'feeds__title_length_index'),
+        # As written by WriteBuffer.flush() & AudioCache's eviction
+        ('Feed.setplayed()',
+         'UPDATE episodes SET played={} WHERE feedID={} AND played IS NULL;'.format(int(time()), f.id),
+         'episodes__feed_published_index'),
+        ('AudioCache eviction',
+         'SELECT * FROM downloads ORDER BY accessed ASC;',
+         'downloads__accessed_index'),
+    )
+
+
+def main() -> int:
+    _populate(20000, 50)
+    failed = 0
+    for name, fn, index in _checks(Feed(1)):
+        statements = _statements(fn)
+        plans = [_plan(s) for s in statements]
+        ok = bool(plans) and all(index in p for p in plans)
+        failed += not ok
+        print('%-4s %-28s %s' % ('ok' if ok else 'FAIL', name, ' | '.join(plans) or 'no statements ran'))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""
+Benchmark scrolling through a 10k row SelectionList, packing and rendering
+it on every step as the feeds column does, for both the eager and lazy
+list walkers. The old full-scan pack() is timed alongside for comparison.
+
+Usage: python benchmarks/render_list.py [rows] [steps]
+"""
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from urwid_widgets import SelectionList
+
+_size = (60, 40)
+
+
+def _scan(l: SelectionList, size):
+    """The old pack(): asks every row for its size."""
+    col = 0
+    row = 0
+    for x in l.listwalker:
+        p = x.pack(size)
+        col = max(col, p[0])
+        row += p[1]
+    return col, row
+
+
+def _scroll(l: SelectionList, steps: int, pack) -> float:
+    start = perf_counter()
+    for _ in range(steps):
+        l.keypress(_size, 'down')
+        pack(l, _size[:1])
+        l.render(_size, focus=True)
+    return (perf_counter() - start) / steps * 1000
+
+
+def main(rows: int, steps: int):
+    items = tuple(('Row %d %s' % (i, 'x' * (i % 40)), i) for i in range(rows))
+
+    start = perf_counter()
+    eager = SelectionList('normal', 'focussed', 'selected', items)
+    print('%-24s %10.2f ms' % ('eager build', (perf_counter() - start) * 1000))
+    print('%-24s %10.3f ms/frame' % ('eager, cached pack', _scroll(eager, steps, SelectionList.pack)))
+    print('%-24s %10.3f ms/frame' % ('eager, full scan pack', _scroll(eager, steps, _scan)))
+
+    start = perf_counter()
+    lazy = SelectionList('normal', 'focussed', 'selected', lazy=True)
+    lazy.listwalker.reset(lambda limit, offset: items[offset:None if limit < 0 else offset + limit])
+    print('%-24s %10.2f ms' % ('lazy build', (perf_counter() - start) * 1000))
+    print('%-24s %10.3f ms/frame' % ('lazy, no pack', _scroll(lazy, steps, lambda *_: None)))
+
+
+if __name__ == '__main__':
+    args = [int(x) for x in sys.argv[1:]]
+    main(*(args + [10000, 1000][len(args):]))
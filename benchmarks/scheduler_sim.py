@@ -0,0 +1,188 @@
+"""
+Simulate refreshing a mix of feeds for a few months, comparing the adaptive
+schedule of scheduler.next_check() with checking every feed on a fixed
+interval (i.e. `blether refresh` from cron).
+For each kind of feed, reports the number of requests made and how long
+new episodes took to be seen (the lag between being published & fetched).
+Exits non-zero if the adaptive schedule makes more requests than the fixed
+interval for any kind of feed.
+Runs entirely in memory, without the db or network.
+
+Usage: python benchmarks/scheduler_sim.py [days] [fixed interval in minutes]
+"""
+import heapq
+import os
+import random
+import sys
+from bisect import bisect_right
+from statistics import mean
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import scheduler
+from feed import Feed
+
+_day = 24 * 60 * 60
+_hour = 60 * 60
+
+
+def _daily(rng, start, end):
+    """Every morning, give or take 20 minutes."""
+    return [d * _day + 6 * _hour + rng.gauss(0, 20 * 60) for d in range(start // _day, end // _day)]
+
+
+def _weekdays(rng, start, end):
+    """Weekday evenings, give or take 10 minutes."""
+    return [d * _day + 17 * _hour + rng.gauss(0, 10 * 60)
+            for d in range(start // _day, end // _day) if d % 7 < 5]
+
+
+def _weekly(rng, start, end):
+    """Once a week, give or take 3 hours."""
+    return [d * _day + 12 * _hour + rng.gauss(0, 3 * _hour) for d in range(start // _day, end // _day, 7)]
+
+
+def _irregular(rng, start, end):
+    """Every 10-18 days, at any time of day."""
+    t, times = start, []
+    while t < end:
+        t += rng.uniform(10, 18) * _day
+        times.append(t)
+    return times
+
+
+def _random(rng, start, end):
+    """At random, every 2 days on average."""
+    t, times = start, []
+    while t < end:
+        t += rng.expovariate(1 / (2 * _day))
+        times.append(t)
+    return times
+
+
+def _dormant(rng, start, end):
+    """Weekly, until stopping half a year ago."""
+    return [t for t in _weekly(rng, start, end) if t < -180 * _day]
+
+
+def _broken(rng, start, end):
+    """Weekly, but the server always errors."""
+    return _weekly(rng, start, end)
+
+
+_kinds = (
+    ('daily', _daily, 20),
+    ('weekdays', _weekdays, 10),
+    ('weekly', _weekly, 40),
+    ('irregular', _irregular, 15),
+    ('random', _random, 10),
+    ('dormant', _dormant, 10),
+    ('broken', _broken, 5),
+)
+
+
+class _Feed:
+    def __init__(self, kind: str, published, broken: bool):
+        self.kind      = kind
+        self.published = published
+        self.broken    = broken
+
+    def check(self, last: float, now: float):
+        """
+        :return: Publish times of the episodes new since the check at last,
+                 or None if the check failed
+        """
+        if self.broken:
+            return None
+        return self.published[bisect_right(self.published, last):bisect_right(self.published, now)]
+
+
+def _fixed(feeds, end: float, interval: float):
+    requests, lags = {}, {}
+    for f in feeds:
+        last = -interval
+        t = random.uniform(0, interval)
+        while t < end:
+            requests[f.kind] = requests.get(f.kind, 0) + 1
+            new = f.check(last, t)
+            if new is not None:
+                lags.setdefault(f.kind, []).extend(t - p for p in new)
+                last = t
+            t += interval
+    return requests, lags
+
+
+def _adaptive(feeds, end: float):
+    requests, lags = {}, {}
+    state = {}
+    queue = []
+    for i, f in enumerate(feeds):
+        # Episodes published before the run are already known
+        state[i] = (0, 0, 0.0)
+        heapq.heappush(queue, (random.uniform(0, _hour), i))
+    while queue:
+        t, i = heapq.heappop(queue)
+        if t >= end:
+            break
+        f = feeds[i]
+        failures, unchanged, last = state[i]
+        requests[f.kind] = requests.get(f.kind, 0) + 1
+        new = f.check(last, t)
+        if new is None:
+            result = Feed.Result(None, Feed.Result.FAILED, None, 0, 0, None)
+        else:
+            lags.setdefault(f.kind, []).extend(t - p for p in new)
+            last = t
+            result = Feed.Result(None, Feed.Result.UPDATED, None, 0, len(new), None)
+        failures, unchanged = scheduler.counters(result, failures, unchanged)
+        known = f.published[:bisect_right(f.published, last)][-scheduler.history:]
+        state[i] = (failures, unchanged, last)
+        heapq.heappush(queue, (scheduler.next_check(t, known, failures, unchanged), i))
+    return requests, lags
+
+
+def _report(name: str, requests, lags):
+    print(name)
+    print('  {:<10} {:>9} {:>10} {:>10} {:>10}'.format('kind', 'requests', 'mean lag', 'p95 lag', 'max lag'))
+    for kind, _, _ in _kinds + (('total', None, None),):
+        if kind == 'total':
+            r = sum(requests.values())
+            l = sorted(x for v in lags.values() for x in v)
+        else:
+            r = requests.get(kind, 0)
+            l = sorted(lags.get(kind, ()))
+        if l:
+            stats = (mean(l) / 60, l[int(0.95 * (len(l) - 1))] / 60, l[-1] / 60)
+            print('  {:<10} {:>9} {:>8.1f} m {:>8.1f} m {:>8.1f} m'.format(kind, r, *stats))
+        else:
+            print('  {:<10} {:>9} {:>10} {:>10} {:>10}'.format(kind, r, '-', '-', '-'))
+
+
+def main(days: int = 90, interval: float = 60):
+    rng = random.Random(1)
+    random.seed(1)
+    end = int(days * _day)
+    # Feeds due an episode are checked as often as they would be on the fixed
+    # interval, so freshness can be compared like for like
+    scheduler.patience = interval * 60
+    feeds = []
+    for kind, generate, count in _kinds:
+        for _ in range(count):
+            # A year of history before the run, so the cadence can be learned
+            published = sorted(generate(rng, -365 * _day, end))
+            feeds.append(_Feed(kind, published, kind == 'broken'))
+
+    fixed = _fixed(feeds, end, interval * 60)
+    adaptive = _adaptive(feeds, end)
+    _report('fixed, every {:g} minutes'.format(interval), *fixed)
+    _report('adaptive', *adaptive)
+
+    failed = [kind for kind, _, _ in _kinds if adaptive[0].get(kind, 0) > fixed[0].get(kind, 0)]
+    for kind in failed:
+        print('FAILED: {} feeds get {} requests, more than {} on the fixed interval'.format(
+            kind, adaptive[0][kind], fixed[0].get(kind, 0)), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*(float(x) for x in sys.argv[1:])))
@@ -0,0 +1,72 @@
+"""
+Regression benchmark for time-to-first-frame.
+Runs `blether.py --profile-startup` against a temporary db of the given
+size several times, reporting the median of each startup phase plus the
+wall time of the whole process. Exits non-zero if the median wall time is
+over --max-ms, or if vlc/feedparser get loaded at startup.
+
+Usage: python benchmarks/startup.py [--feeds N] [--episodes N] [--runs N] [--max-ms MS]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from statistics import median
+from time import perf_counter
+
+from _fixtures import populate, temporary_db
+
+import db
+
+_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def _run(path: str):
+    start = perf_counter()
+    p = subprocess.run(
+        (sys.executable, os.path.join(_root, 'blether.py'), '--db', path, '--profile-startup'),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    wall = (perf_counter() - start) * 1000
+    phases = {}
+    eager = ''
+    for line in p.stderr.splitlines():
+        if line.endswith(' ms'):
+            phases[line[:24].strip()] = float(line[24:-3])
+        elif line.startswith('eagerly loaded'):
+            eager = line[24:].strip()
+    return wall, phases, eager
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--feeds', type=int, default=400)
+    p.add_argument('--episodes', type=int, default=500, help='per feed')
+    p.add_argument('--runs', type=int, default=10)
+    p.add_argument('--max-ms', type=float, help='fail if median wall time exceeds this')
+    args = p.parse_args()
+
+    path = temporary_db()
+    populate(args.feeds * args.episodes, args.feeds)
+    db.close()
+    _run(path)  # warm the OS caches
+
+    runs = [_run(path) for _ in range(args.runs)]
+    for phase in runs[0][1]:
+        print('%-24s %8.2f ms' % (phase, median(r[1][phase] for r in runs)))
+    wall = median(r[0] for r in runs)
+    print('%-24s %8.2f ms' % ('wall (incl. interpreter)', wall))
+    print('%-24s %s' % ('eagerly loaded', runs[0][2]))
+
+    failed = runs[0][2] != 'none'
+    if args.max_ms is not None and wall > args.max_ms:
+        print('Regression: median wall time over %.0f ms' % args.max_ms)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Check streamed refreshes (see feedstream.py) give the same episodes as full
+ones, for feeds with awkward but valid items: empty or self-closing titles,
+titles, GUIDs & descriptions padded with whitespace, and so on.
+Compares feedstream's parse of such a feed with feedparser's, then adds it
+twice & refreshes one copy in full and the other streamed, after some more
+such episodes are published, comparing the episodes each ends up with.
+Exits non-zero if anything differs.
+
+Usage: python benchmarks/stream_parse.py
+"""
+import sys
+from email.utils import formatdate
+
+from _fixtures import temporary_db
+
+import feedparser
+
+import db
+import feedstream
+from feed import Feed
+from feedserver import FeedServer
+
+_epoch = 1500000000
+_day = 24 * 60 * 60
+
+# Each item is one of these in turn, by its number
+_items = (
+    '<title></title><guid isPermaLink="false">{name}-{i}</guid>',
+    '<title>  Padded {i}  </title><guid isPermaLink="false">  {name}-padded-{i} \n</guid>'
+    '<description>  Padded  </description>',
+    '<title>\n Split\n title {i} </title><guid>  http://example.com/{name}/{i}  </guid>'
+    '<description>  <![CDATA[ <p>Episode <b>{i}</b></p> ]]>  </description>',
+    '<title/><guid isPermaLink="false">{name}-Mixed-Case-{i}</guid><description></description>',
+)
+
+
+def _rss(name: str, episodes: int) -> bytes:
+    items = ''.join(
+        '<item>{}<pubDate>{}</pubDate><enclosure url="http://example.com/{}/{}.mp3"/></item>'.format(
+            _items[i % len(_items)].format(name=name, i=i), formatdate(_epoch + i * _day), name, i)
+        for i in reversed(range(episodes))
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+        '<title>  Awkward  </title><description></description>{}</channel></rss>'.format(items)
+    ).encode()
+
+
+def _parsed(rss) -> list:
+    def get(x, name):
+        return x.get(name) if isinstance(x, dict) else getattr(x, name, None)
+    return [(rss.feed.get('title') if isinstance(rss.feed, dict) else rss.feed.title,
+             get(rss.feed, 'description'))] + [
+        (get(e, 'id'), get(e, 'title'), get(e, 'description'), get(e, 'published_parsed'),
+         [x.href for x in e.enclosures])
+        for e in rss.entries
+    ]
+
+
+def _episodes(f: Feed) -> list:
+    sql = '''
+        SELECT replace(guid, ?, ''), episodes.title, replace(url, ?, ''), published, text
+        FROM episodes
+        LEFT JOIN descriptions ON descriptions.episodeID=episodes.id
+        WHERE feedID=? ORDER BY published, guid;
+    '''
+    # Less the feed's name, as GUIDs & urls have to differ between feeds
+    name = f.url.rsplit('/', 1)[1]
+    return [tuple(x) for x in db.connection.execute(sql, (name, name, f.id))]
+
+
+def main():
+    temporary_db()
+    failed = []
+
+    def check(ok: bool, name: str):
+        print('%-4s %s' % ('ok' if ok else 'FAIL', name))
+        if not ok:
+            failed.append(name)
+
+    with FeedServer() as server:
+        server.set('full', _rss('full', 8))
+        server.set('stream', _rss('stream', 8))
+        url = server.url('full')
+        check(_parsed(feedstream.parse(url, set())) == _parsed(feedparser.parse(url)),
+              'feedstream parses items as feedparser does')
+
+        full = Feed.add(server.url('full'))
+        stream = Feed.add(server.url('stream'))
+        check(len(_episodes(full)) == 8 and _episodes(full) == _episodes(stream), 'both copies are added alike')
+
+        server.set('full', _rss('full', 12))
+        server.set('stream', _rss('stream', 12))
+        full.update()
+        stream.update(stream=True)
+        check(len(_episodes(full)) == 12, 'a full refresh adds the new episodes')
+        check(_episodes(full) == _episodes(stream), 'a streamed refresh adds the same episodes')
+
+    for f in failed:
+        print('FAILED: ' + f, file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
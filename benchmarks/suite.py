@@ -0,0 +1,226 @@
+"""
+Reproducible end to end benchmark suite.
+
+Generates synthetic feeds (feeds x episodes x description length), serves
+them from a local HTTP server supporting conditional GETs (see feedserver.py),
+and times, against a fresh temporary db each run:
+    add                  Feed.add() of every feed
+    refresh_unchanged    Feed.update_all() with nothing changed (all 304s)
+    refresh_changed      Feed.update_all() after each feed gains new episodes
+    refresh_ignored      Feed.update_all() with nothing changed, from a server
+                         ignoring conditional GETs (unchanged by body hash)
+    refresh_stream       The same, parsing incrementally (stream=True)
+    list                 Episode.getbyfeed() of every feed, from a cold cache
+    display              EpisodesList.display() & render of every feed
+
+Results (medians over the runs) are written as JSON, and can be compared
+against a saved baseline, flagging any stage that got slower by more than
+the threshold; the exit status is 1 if anything regressed.
+
+Usage:
+    python benchmarks/suite.py [--feeds N] [--episodes N] [--description N]
+                               [--new N] [--runs N] [--output FILE]
+                               [--compare BASELINE] [--threshold FRACTION]
+    python benchmarks/suite.py --results FILE --compare BASELINE
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from statistics import median
+from time import perf_counter, time
+
+from typing import(
+    Callable,
+    Dict,
+    List,
+)
+
+_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, _root)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import db
+from feed import Feed
+from episode import Episode
+from feedserver import FeedServer, rss
+
+_stages = ('add', 'refresh_unchanged', 'refresh_changed', 'refresh_ignored', 'refresh_stream', 'list', 'display')
+
+_size = (100, 40)
+
+
+def _timed(fn: Callable) -> float:
+    start = perf_counter()
+    fn()
+    return (perf_counter() - start) * 1000
+
+
+def _check(results, status: str, new: int):
+    """Make sure a refresh did what it was meant to, so its time means something."""
+    for r in results:
+        if r.status != status or r.new != new:
+            raise RuntimeError('{} refreshed as {} with {} new, expected {} with {}'.format(
+                r.feed.url, r.status, r.new, status, new))
+
+
+def _run(args: argparse.Namespace, server: FeedServer) -> Dict[str, float]:
+    """
+    One run of every stage, against a fresh db.
+    :return: Time taken by each stage, in ms
+    """
+    from ui_urwid import EpisodesList
+
+    db.configure(os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    db.connect()
+    Feed.invalidate()
+    Episode.invalidate()
+
+    names = ['feed%d' % i for i in range(args.feeds)]
+    for name in names:
+        server.set(name, rss(name, args.episodes, args.description, base=server.base))
+
+    times = {}
+    times['add'] = _timed(lambda: [Feed.add(server.url(name)) for name in names])
+
+    times['refresh_unchanged'] = _timed(
+        lambda: _check(Feed.update_all(), Feed.Result.UNMODIFIED, 0)
+    )
+
+    for name in names:
+        server.set(name, rss(name, args.episodes, args.description, start=args.new, base=server.base))
+    times['refresh_changed'] = _timed(
+        lambda: _check(Feed.update_all(), Feed.Result.UPDATED, args.new)
+    )
+
+    server.conditional = False
+    try:
+        times['refresh_ignored'] = _timed(
+            lambda: _check(Feed.update_all(), Feed.Result.UNMODIFIED, 0)
+        )
+    finally:
+        server.conditional = True
+
+    for name in names:
+        server.set(name, rss(name, args.episodes, args.description, start=args.new * 2, base=server.base))
+    times['refresh_stream'] = _timed(
+        lambda: _check(Feed.update_all(stream=True), Feed.Result.UPDATED, args.new)
+    )
+
+    feeds = Feed.getall()
+    Episode.invalidate()
+    times['list'] = _timed(lambda: [Episode.getbyfeed(f) for f in feeds])
+
+    Episode.invalidate()
+    l = EpisodesList('normal', 'focussed', 'selected', lazy=True)
+
+    def display():
+        for f in feeds:
+            l.display(f)
+            l.render(_size, focus=True)
+    times['display'] = _timed(display)
+
+    db.close()
+    return times
+
+
+def run(args: argparse.Namespace) -> dict:
+    runs : Dict[str, List[float]] = {s: [] for s in _stages}
+    with FeedServer() as server:
+        for i in range(args.runs):
+            for stage, t in _run(args, server).items():
+                runs[stage].append(t)
+            print('run {}/{} done'.format(i + 1, args.runs), file=sys.stderr)
+    return {
+        'meta': {
+            'feeds'       : args.feeds,
+            'episodes'    : args.episodes,
+            'description' : args.description,
+            'new'         : args.new,
+            'runs'        : args.runs,
+            'python'      : platform.python_version(),
+            'sqlite'      : db.sqlite3.sqlite_version,
+            'platform'    : platform.platform(),
+            'time'        : int(time()),
+        },
+        'results': {
+            stage: {
+                'median_ms' : round(median(times), 3),
+                'min_ms'    : round(min(times), 3),
+                'runs_ms'   : [round(t, 3) for t in times],
+            }
+            for stage, times in runs.items()
+        },
+    }
+
+
+def report(results: dict):
+    for stage, r in results['results'].items():
+        print('{:<20} {:>10.2f} ms  (min {:.2f} ms)'.format(stage, r['median_ms'], r['min_ms']))
+
+
+def compare(baseline: dict, results: dict, threshold: float) -> bool:
+    """
+    Print how each stage compares to the baseline.
+    :param threshold: Fraction slower than the baseline a stage may be
+                      before it's flagged as a regression
+    :return: Whether anything regressed
+    """
+    sizes = ('feeds', 'episodes', 'description', 'new')
+    if any(baseline['meta'].get(k) != results['meta'].get(k) for k in sizes):
+        print('warning: baseline was run at a different size', file=sys.stderr)
+
+    regressed = False
+    print('{:<20} {:>12} {:>12} {:>8}'.format('stage', 'baseline', 'current', 'change'))
+    for stage, r in results['results'].items():
+        if stage not in baseline['results']:
+            print('{:<20} {:>12} {:>9.2f} ms {:>8}'.format(stage, '-', r['median_ms'], 'new'))
+            continue
+        before = baseline['results'][stage]['median_ms']
+        change = r['median_ms'] / before - 1 if before else 0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        elif change < -threshold:
+            flag = '  improved'
+        print('{:<20} {:>9.2f} ms {:>9.2f} ms {:>+7.1%}{}'.format(stage, before, r['median_ms'], change, flag))
+    return regressed
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description='Run the end to end benchmark suite.')
+    p.add_argument('--feeds', type=int, default=20)
+    p.add_argument('--episodes', type=int, default=500, help='episodes per feed')
+    p.add_argument('--description', type=int, default=500, help='characters per episode description')
+    p.add_argument('--new', type=int, default=5, help='episodes each feed gains per changed refresh')
+    p.add_argument('--runs', type=int, default=3)
+    p.add_argument('-o', '--output', help='file to write the results to')
+    p.add_argument('--results', help='compare this results file, rather than running the suite')
+    p.add_argument('--compare', metavar='BASELINE', help='results file to compare against')
+    p.add_argument('--threshold', type=float, default=0.2, help='slowdown flagged as a regression (default 0.2)')
+    args = p.parse_args(argv)
+
+    if args.results:
+        if not args.compare:
+            p.error('--results needs --compare')
+        with open(args.results) as f:
+            results = json.load(f)
+    else:
+        results = run(args)
+        report(results)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if compare(baseline, results, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
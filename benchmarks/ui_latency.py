@@ -0,0 +1,147 @@
+"""
+Benchmark how responsive the UI stays while a feed is being added from a
+deliberately slow local server.
+Runs the real UI against a screen that draws nowhere, pressing a key every
+few ms and timing how long each keypress waits on the event loop, first
+while nothing is happening, then while adding a feed the way the UI used
+to (on the event loop), then as it does now (see Tasks), and lastly while
+adding a feed that's cancelled part way. Exits non-zero if any keypress
+waits longer than --max-ms while a feed is added in the background, or if
+the added & cancelled feeds don't end up (or not) in the db as they should.
+
+Usage: python benchmarks/ui_latency.py [--delay SECONDS] [--max-ms MS]
+"""
+import argparse
+import sys
+from statistics import median
+from time import perf_counter
+
+from _fixtures import temporary_db
+
+import urwid
+
+import db
+from feed import Feed
+from feedserver import FeedServer, rss
+from ui_urwid import UI
+
+# Seconds between keypresses
+_interval = 0.02
+
+
+class _Screen(urwid.BaseScreen):
+    """
+    Screen that draws nowhere & takes no input, for running the UI headless.
+    """
+    def __init__(self, on_run):
+        """
+        :param on_run: Called on the event loop once the UI's main loop is running
+        """
+        super().__init__()
+        self.on_run = on_run
+
+    def get_cols_rows(self):
+        return 120, 40
+
+    def draw_screen(self, size, canvas):
+        pass
+
+    def get_input_descriptors(self):
+        return []
+
+    def hook_event_loop(self, event_loop, callback):
+        event_loop.alarm(0, self.on_run)
+
+    def unhook_event_loop(self, event_loop):
+        pass
+
+
+class _Keys:
+    """
+    Presses a key every _interval, recording how late (in ms) each was
+    handled, counting from when it was due to when the UI was done with it.
+    """
+    def __init__(self):
+        self.loop = None
+        self.latencies = []
+        self._due = 0.0
+
+    def start(self, loop: urwid.MainLoop):
+        self.loop = loop
+        self._due = perf_counter() + _interval
+        self.loop.set_alarm_in(_interval, self._press)
+
+    def _press(self, *_):
+        self.loop.process_input(['down'])
+        self.latencies.append((perf_counter() - self._due) * 1000)
+        self.start(self.loop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--delay', type=float, default=2, help='Seconds the server takes to answer')
+    parser.add_argument('--max-ms', type=float, default=100, help='Slowest keypress allowed in the background phase')
+    args = parser.parse_args()
+
+    temporary_db()
+    ui = UI()
+    keys = _Keys()
+    results = {}
+    phase = [None]
+
+    with FeedServer(delay=args.delay) as server:
+        for name in ('blocking', 'background', 'cancelled'):
+            server.set(name, rss(name, 50, base=server.base))
+
+        def begin(name):
+            # Keypresses are counted towards whichever phase is running
+            if phase[0] is not None:
+                results[phase[0]] = keys.latencies
+            keys.latencies = []
+            phase[0] = name
+
+        # Each step runs, then the next is started the given seconds later
+        steps = [
+            (lambda: begin('idle'), 1),
+            (lambda: (begin('on the loop'), Feed.add(server.url('blocking'))), 1),
+            (lambda: (begin('in the background'), ui.addfeed(server.url('background'))), args.delay + 1),
+            (lambda: (begin('cancelled'), ui.addfeed(server.url('cancelled'))), args.delay / 2),
+            (ui.canceltask, args.delay + 1),
+            (lambda: begin(None), 0),
+        ]
+
+        def step(*_):
+            if not steps:
+                raise urwid.ExitMainLoop
+            action, wait = steps.pop(0)
+            action()
+            ui.loop.set_alarm_in(wait, step)
+
+        def start():
+            keys.start(ui.loop)
+            step()
+
+        ui.runloop(screen=_Screen(start))
+
+        urls = {x['url'] for x in db.connection.execute('SELECT url FROM feeds;')}
+
+    print('%-20s %8s %12s %12s' % ('adding a feed', 'keys', 'median', 'slowest'))
+    for name, latencies in results.items():
+        print('%-20s %8d %9.1f ms %9.1f ms' % (name, len(latencies), median(latencies), max(latencies)))
+
+    failed = []
+    if max(results['in the background']) > args.max_ms:
+        failed.append('a keypress took over {} ms while adding a feed in the background'.format(args.max_ms))
+    if server.url('background') not in urls:
+        failed.append('the feed added in the background is missing')
+    if server.url('cancelled') in urls:
+        failed.append('the cancelled feed was added anyway')
+    if ui.tasks.running:
+        failed.append('tasks were left running')
+    for f in failed:
+        print('FAILED: ' + f, file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
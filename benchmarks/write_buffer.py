@@ -0,0 +1,57 @@
+"""
+Check WriteBuffer keeps playback state it failed to write.
+Flushes while another connection holds the db write lock, so the write
+fails, then updates one of the episodes again and flushes once the lock is
+released, checking everything buffered made it to the db with the newer
+update winning. Exits non-zero if any check fails.
+
+Usage: python benchmarks/write_buffer.py
+"""
+import sqlite3
+import sys
+
+from _fixtures import populate, temporary_db
+
+import db
+from writebuffer import WriteBuffer
+
+
+def main():
+    # Fail fast on the lock, rather than waiting out the usual timeout
+    path = temporary_db(busy_timeout=50)
+    # Episodes 1 to 3
+    populate(3, description=None)
+    buffer = WriteBuffer(interval=3600)
+    failed = []
+
+    def check(ok: bool, name: str):
+        print('%-4s %s' % ('ok' if ok else 'FAIL', name))
+        if not ok:
+            failed.append(name)
+
+    buffer.position(1, 1000)
+    buffer.position(2, 2000)
+    buffer.played(3, 1.0)
+
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute('BEGIN IMMEDIATE;')
+    error = buffer.flush().exception()
+    check(isinstance(error, sqlite3.OperationalError), 'a flush fails while the db is locked')
+    buffer.position(1, 1500)
+    other.execute('ROLLBACK;')
+    other.close()
+
+    check(buffer.flush().exception() is None, 'a flush succeeds once the lock is released')
+    rows = {r['id']: r for r in db.connection.execute('SELECT id, position, played FROM episodes;')}
+    check(rows[2]['position'] == 2000, 'a position from the failed flush is kept')
+    check(rows[3]['played'] == 1.0, 'a played mark from the failed flush is kept')
+    check(rows[1]['position'] == 1500, 'a newer position wins over one from the failed flush')
+    check(buffer.flush().result() is None and not buffer._positions, 'nothing is left buffered')
+
+    for f in failed:
+        print('FAILED: ' + f, file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
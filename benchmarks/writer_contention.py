@@ -0,0 +1,88 @@
+"""
+Check background db writes never fail on the db lock while feeds are being
+refreshed & added in bulk.
+Adds feeds, then refreshes them all once each has gained a lot of new
+episodes, while another thread keeps queueing small writes on the db writer
+(as WriteBuffer does for playback state). Exits non-zero if any of those
+writes, or any feed, fails.
+
+Usage: python benchmarks/writer_contention.py [feeds] [new episodes]
+"""
+import sys
+import threading
+from time import perf_counter
+
+from _fixtures import temporary_db
+
+import db
+from feed import Feed
+from feedserver import FeedServer, rss
+
+# Seconds between the background writes
+_interval = 0.005
+
+
+class _Writes:
+    """
+    Queues a small write on the db writer every _interval, on its own
+    thread, counting those that fail.
+    """
+    def __init__(self):
+        self.futures = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        for f in self.futures:
+            f.exception()
+
+    @property
+    def failed(self):
+        return [f.exception() for f in self.futures if f.exception() is not None]
+
+    def _run(self):
+        sql = 'UPDATE episodes SET position=? WHERE id=?;'
+        i = 0
+        while not self._stop.wait(_interval):
+            i += 1
+            self.futures.append(db.write(lambda i=i: db.connection.execute(sql, (i, i % 10 + 1))))
+
+
+def main(feeds: int = 40, new: int = 1450):
+    temporary_db()
+    names = ['feed%d' % i for i in range(feeds)]
+    failed = []
+
+    with FeedServer() as server:
+        for name in names:
+            server.set(name, rss(name, 10, base=server.base))
+        with _Writes() as writes:
+            start = perf_counter()
+            added = Feed.add_many(server.url(name) for name in names)
+            print('%-24s %9.1f s' % ('add_many()', perf_counter() - start))
+            failed += ['adding {}: {}'.format(r.url, r.error) for r in added if r.status != Feed.Added.ADDED]
+
+            for name in names:
+                server.set(name, rss(name, 10 + new, base=server.base))
+            start = perf_counter()
+            results = Feed.update_all()
+            print('%-24s %9.1f s' % ('update_all()', perf_counter() - start))
+            failed += ['updating {}: {}'.format(r.feed.url, r.error) for r in results if r.error is not None]
+            failed += ['{} new episodes of {}, not {}'.format(r.new, r.feed.url, new)
+                       for r in results if r.error is None and r.new != new]
+
+    print('%-24s %9d' % ('background writes', len(writes.futures)))
+    failed += ['background write: {!r}'.format(e) for e in writes.failed]
+    for f in failed:
+        print('FAILED: ' + f, file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*(int(x) for x in sys.argv[1:])))
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+blether - terminal podcast client.
+
+Run with no command to open the UI, or with one of the headless commands
+(refresh, daemon, add, list, export, import-opml, export-opml) for use from
+scripts & cron, see headless.py.
+"""
+import argparse
+import shutil
+import sys
+from time import perf_counter
+
+from typing import(
+    List,
+    Optional,
+    Tuple,
+)
+
+
+class StartupProfile:
+    """
+    Times each phase of startup, for --profile-startup.
+    """
+    def __init__(self):
+        self.phases : List[Tuple[str, float]] = []
+        self._start = perf_counter()
+        self._last = self._start
+
+    def mark(self, phase: str):
+        now = perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self, out=sys.stderr):
+        for phase, t in self.phases:
+            print('{:<24} {:8.2f} ms'.format(phase, t * 1000), file=out)
+        print('{:<24} {:8.2f} ms'.format('total', (self._last - self._start) * 1000), file=out)
+        # These should only be loaded on demand, never at startup
+        loaded = [m for m in ('vlc', 'feedparser') if m in sys.modules]
+        print('{:<24} {}'.format('eagerly loaded', ', '.join(loaded) or 'none'), file=out)
+
+
+def parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog='blether', description=__doc__.strip().splitlines()[0])
+    p.add_argument('--db', help='path to the database file')
+    p.add_argument('--metrics', action='store_true', help='time db queries & feed fetches')
+    p.add_argument(
+        '--metrics-file',
+        metavar='FILE',
+        help='append every metrics event to FILE as JSON lines (implies --metrics)',
+    )
+    p.add_argument(
+        '--profile-startup',
+        action='store_true',
+        help='report the time spent in each import & init phase up to the first frame, then exit',
+    )
+    subparsers = p.add_subparsers(title='headless commands', metavar='COMMAND')
+    _add_headless_parsers(subparsers)
+    return p
+
+
+def _add_headless_parsers(subparsers):
+    """
+    Add a subparser for each headless command, see headless.py.
+    The commands themselves are only imported when one is run.
+    """
+    p = subparsers.add_parser('refresh', help='update feeds from their RSS files')
+    p.add_argument('feeds', nargs='*', type=int, metavar='ID', help='feeds to update (default all)')
+    p.add_argument('-j', '--jobs', type=int, default=8, help='feeds fetched at once (default 8)')
+    p.add_argument('--per-host', type=int, default=2, help='feeds fetched at once per host (default 2)')
+    p.add_argument('--stream', action='store_true', help='only read feeds as far as the known episodes')
+    p.add_argument(
+        '--download',
+        type=int,
+        default=0,
+        metavar='N',
+        help='download up to N of the new episodes of each feed',
+    )
+    p.add_argument('--due', action='store_true', help='only update feeds the scheduler has due')
+    p.set_defaults(command='refresh')
+
+    p = subparsers.add_parser('daemon', help='keep updating feeds as they fall due, until interrupted')
+    p.add_argument('-j', '--jobs', type=int, default=8, help='feeds fetched at once (default 8)')
+    p.add_argument('--per-host', type=int, default=2, help='feeds fetched at once per host (default 2)')
+    p.add_argument('--full', dest='stream', action='store_false', help='always read feeds in full')
+    p.set_defaults(command='daemon')
+
+    p = subparsers.add_parser('add', help='add new feeds')
+    p.add_argument('urls', nargs='+', metavar='URL')
+    p.set_defaults(command='add')
+
+    p = subparsers.add_parser('list', help='list feeds')
+    # Feed.sorts, not imported here to keep startup fast
+    p.add_argument('--sort', choices=('id', 'title', 'unplayed', 'latest', 'played'), default='id')
+    p.set_defaults(command='list')
+
+    p = subparsers.add_parser('export', help='export episode listings')
+    p.add_argument('-f', '--format', choices=('ndjson', 'json'), default='ndjson')
+    p.add_argument('--feed', type=int, metavar='ID', help='only export episodes of this feed')
+    p.add_argument('-o', '--output', help='file to write to (default stdout)')
+    p.set_defaults(command='export')
+
+    p = subparsers.add_parser('import-opml', help='add the feeds listed in an OPML file')
+    p.add_argument('file', metavar='FILE')
+    p.add_argument('-j', '--jobs', type=int, default=8, help='feeds fetched at once (default 8)')
+    p.add_argument('--per-host', type=int, default=2, help='feeds fetched at once per host (default 2)')
+    p.set_defaults(command='import-opml')
+
+    p = subparsers.add_parser('export-opml', help='export the feeds as an OPML file')
+    p.add_argument('-o', '--output', help='file to write to (default stdout)')
+    p.set_defaults(command='export-opml')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parser().parse_args(argv)
+    profile = StartupProfile()
+
+    import db
+    profile.mark('import db')
+    if args.db:
+        db.configure(args.db)
+    if args.metrics or args.metrics_file:
+        import metrics
+        metrics.enable(args.metrics_file)
+
+    # Headless commands never load the UI, nor vlc
+    if getattr(args, 'command', None) is not None:
+        import headless
+        return headless.run(args)
+
+    # Imported here only so the profile times each on its own; ui_urwid
+    # imports them again for real
+    import feed  # noqa: F401
+    import episode  # noqa: F401
+    profile.mark('import feed/episode')
+
+    import urwid  # noqa: F401
+    profile.mark('import urwid')
+
+    from ui_urwid import UI
+    profile.mark('import ui')
+
+    db.connect()
+    profile.mark('open & migrate db')
+
+    ui = UI()
+    profile.mark('build ui')
+
+    if not args.profile_startup:
+        ui.runloop()
+        return 0
+
+    # Render as the first frame would be, without needing a terminal
+    cols, rows = shutil.get_terminal_size()
+    ui.main_widget.render((cols, rows), focus=True)
+    profile.mark('first frame')
+    profile.report()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
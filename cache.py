@@ -0,0 +1,172 @@
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Event, Lock
+from time import time
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+
+import db
+from episode import Episode
+from singleton import Singleton
+
+from typing import(
+    Dict,
+    Iterable,
+    Optional,
+)
+
+_user_agent = 'blether'
+
+_cwd = os.path.dirname(__file__) + '/'
+
+
+class AudioCache(metaclass=Singleton):
+    """
+    Local disk cache of episode audio, so playback needn't wait on (or stall
+    with) the remote server.
+    Downloads happen in the background, resuming partial downloads with HTTP
+    Range requests, and the least recently played files are evicted to keep
+    the cache within its disk budget.
+    """
+    class Stopped(Exception):
+        """
+        Raised by a download abandoned part way as the cache was stopped.
+        """
+
+    def __init__(self, directory: str = _cwd + 'cache', budget: int = 2 * 1024**3,
+                 workers: int = 2, chunk: int = 64 * 1024):
+        """
+        :param directory: Where downloaded files are kept
+        :param budget: Maximum bytes of downloaded files to keep
+        :param workers: Maximum number of downloads at once
+        :param chunk: Bytes read from the network at a time
+        """
+        self.directory = directory
+        self.budget = budget
+        self.chunk = chunk
+
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._pending : Dict[int, Future] = {}
+        self._lock = Lock()
+        self._stopping = Event()
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, e: Episode) -> Optional[str]:
+        """
+        Get the local file for an episode, if it has been downloaded,
+        marking it as recently played.
+        :return: Path to the file, or None if it isn't cached
+        """
+        sql = 'SELECT path FROM downloads WHERE episodeID=?;'
+        row = db.connection.execute(sql, (e.id,)).fetchone()
+        if row is None:
+            return None
+        if not os.path.exists(row['path']):
+            sql = 'DELETE FROM downloads WHERE episodeID=?;'
+            db.write(lambda: db.connection.execute(sql, (e.id,)))
+            return None
+        sql = 'UPDATE downloads SET accessed=? WHERE episodeID=?;'
+        db.write(lambda: db.connection.execute(sql, (int(time()), e.id)))
+        return row['path']
+
+    def download(self, e: Episode) -> Future:
+        """
+        Download an episode in the background, unless it's cached or already
+        being downloaded.
+        :return: Future resolving to the path of the downloaded file
+        """
+        with self._lock:
+            if e.id in self._pending:
+                return self._pending[e.id]
+            if self._stopping.is_set():
+                future = Future()
+                future.cancel()
+                return future
+            future = self._executor.submit(self._download, e.id, e.url)
+            self._pending[e.id] = future
+        future.add_done_callback(lambda _: self._done(e.id))
+        return future
+
+    def prefetch(self, episodes: Iterable[Episode]):
+        """
+        Download each of the given episodes in the background, in order.
+        """
+        for e in episodes:
+            self.download(e)
+
+    def stop(self):
+        """
+        Stop downloading, e.g. on quitting. Queued downloads never start, and
+        those in progress are abandoned after their current chunk, leaving
+        what they have downloaded to be resumed another time.
+        Doesn't wait for them, so returns straight away.
+        """
+        self._stopping.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _done(self, id: int):
+        with self._lock:
+            self._pending.pop(id, None)
+
+    def _file(self, id: int, url: str) -> str:
+        ext = os.path.splitext(urlsplit(url).path)[1] or '.mp3'
+        return os.path.join(self.directory, '{}{}'.format(id, ext))
+
+    def _download(self, id: int, url: str) -> str:
+        path = self._file(id, url)
+        sql = 'SELECT path FROM downloads WHERE episodeID=?;'
+        if db.connection.execute(sql, (id,)).fetchone() and os.path.exists(path):
+            return path
+
+        part = path + '.part'
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        request = Request(url, headers={'User-Agent': _user_agent})
+        if offset:
+            request.add_header('Range', 'bytes={}-'.format(offset))
+
+        with urlopen(request, timeout=30) as response:
+            # Servers ignoring the Range header send the whole file again
+            mode = 'ab' if offset and response.status == 206 else 'wb'
+            with open(part, mode) as f:
+                while not self._stopping.is_set():
+                    data = response.read(self.chunk)
+                    if not data:
+                        break
+                    f.write(data)
+        if self._stopping.is_set():
+            raise AudioCache.Stopped(url)
+        os.replace(part, path)
+
+        sql = 'INSERT OR REPLACE INTO downloads(episodeID, path, size, accessed) VALUES(?,?,?,?);'
+        values = (id, path, os.path.getsize(path), int(time()))
+        db.write(lambda: db.connection.execute(sql, values)).result()
+        self._evict()
+        return path
+
+    def _evict(self):
+        """
+        Delete the least recently played files until within the disk budget.
+        Files currently being downloaded are never evicted.
+        """
+        def evict():
+            c = db.connection
+            total = c.execute('SELECT COALESCE(SUM(size), 0) FROM downloads;').fetchone()[0]
+            if total <= self.budget:
+                return ()
+            removed = []
+            with self._lock:
+                pending = set(self._pending)
+            for row in c.execute('SELECT * FROM downloads ORDER BY accessed ASC;').fetchall():
+                if total <= self.budget:
+                    break
+                if row['episodeID'] in pending:
+                    continue
+                c.execute('DELETE FROM downloads WHERE episodeID=?;', (row['episodeID'],))
+                removed.append(row['path'])
+                total -= row['size']
+            return removed
+
+        for path in db.write(evict).result():
+            if os.path.exists(path):
+                os.remove(path)
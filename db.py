@@ -1,39 +1,382 @@
+import atexit
 import os
+import queue
 import sqlite3
+import sys
+import threading
+import zlib
+from concurrent.futures import Future
+from contextlib import contextmanager
 
-_db_file = 'podcasts.db'
+import metrics
 
-_schema_files = (
-    'feeds.sql',
-    'episodes.sql',
+from typing import(
+    Callable,
+    Optional,
 )
 
+_db_file = 'podcasts.db'
+
+
 _cwd = os.path.dirname(__file__) + '/'
 
-connection = sqlite3.connect(_cwd + _db_file)
-connection.row_factory = sqlite3.Row
+path = _cwd + _db_file
+
+# Applied to every connection as it is opened, see configure()
+pragmas = {
+    'journal_mode' : 'WAL',
+    'synchronous'  : 'NORMAL',
+    'cache_size'   : -16000,
+    'mmap_size'    : 64 * 1024 * 1024,
+    'temp_store'   : 'MEMORY',
+    'busy_timeout' : 5000,
+}
+
+_local = threading.local()
+_lock = threading.Lock()
+_setup_lock = threading.Lock()
+_connections = []
+_generation = 0
+# Whether the db at `path` has been migrated yet by this process
+_ready = False
+
+
+def connect() -> sqlite3.Connection:
+    """
+    Get the calling thread's own connection, opening it on first use.
+    """
+    c = getattr(_local, 'connection', None)
+    if c is None or _local.generation != _generation:
+        c = _open()
+    return c
+
+
+def _open() -> sqlite3.Connection:
+    global _ready
+    # Timing every statement is only paid for while metrics are enabled
+    factory = metrics.Connection if metrics.enabled else sqlite3.Connection
+    c = sqlite3.connect(path, check_same_thread=False, factory=factory)
+    c.row_factory = sqlite3.Row
+    for k, v in pragmas.items():
+        c.execute('PRAGMA {}={};'.format(k, v))
+    with _lock:
+        _connections.append(c)
+    _local.connection = c
+    _local.generation = _generation
+    # The schema is brought up to date on first use, rather than on import
+    with _setup_lock:
+        if not _ready:
+            _setup()
+            _ready = True
+    return c
+
+
+def configure(db_path: Optional[str] = None, **kwargs):
+    """
+    Change the db file and/or pragmas used for connections.
+    Open connections are closed, and each thread reopens on next use.
+    :param db_path: Path to the db file
+    :param kwargs: Pragmas to set, e.g. synchronous='FULL'; None removes one
+    """
+    global path
+    close()
+    if db_path is not None:
+        path = db_path
+    for k, v in kwargs.items():
+        if v is None:
+            pragmas.pop(k, None)
+        else:
+            pragmas[k] = v
+
+
+def close():
+    """
+    Close every thread's connection.
+    """
+    global _generation, _ready
+    with _lock:
+        for c in _connections:
+            c.close()
+        _connections.clear()
+        _generation += 1
+        _ready = False
+
+
+class _ThreadConnection:
+    """
+    Stands in for a sqlite3.Connection, forwarding everything to the calling
+    thread's own connection, so `db.connection` is safe to use from any thread.
+    """
+    def __getattr__(self, name):
+        return getattr(connect(), name)
+
+    def __setattr__(self, name, value):
+        setattr(connect(), name, value)
+
+    def __enter__(self):
+        return connect().__enter__()
+
+    def __exit__(self, *args):
+        return connect().__exit__(*args)
+
+
+connection = _ThreadConnection()
+
+
+@contextmanager
+def transaction(immediate: bool = False):
+    """
+    Context manager running a block in a transaction on the calling thread's
+    connection, committed on success and rolled back on an exception.
+    Nested uses become savepoints within the outer transaction.
+    :param immediate: Take the write lock up front, with BEGIN IMMEDIATE
+    """
+    c = connect()
+    depth = getattr(_local, 'depth', 0)
+    if c.in_transaction and depth:
+        name = 'sp{}'.format(depth)
+        c.execute('SAVEPOINT {};'.format(name))
+        _local.depth = depth + 1
+        try:
+            yield c
+        except BaseException:
+            c.execute('ROLLBACK TO {};'.format(name))
+            c.execute('RELEASE {};'.format(name))
+            raise
+        else:
+            c.execute('RELEASE {};'.format(name))
+        finally:
+            _local.depth = depth
+        return
+
+    if not c.in_transaction:
+        c.execute('BEGIN IMMEDIATE;' if immediate else 'BEGIN;')
+    _local.depth = 1
+    try:
+        yield c
+    except BaseException:
+        c.rollback()
+        raise
+    else:
+        c.commit()
+    finally:
+        _local.depth = 0
+
+
+class Writer:
+    """
+    Background thread that runs write jobs one after another on its own
+    connection, so writers never contend with each other for the db lock.
+    Jobs queued together are run as one transaction, each in its own
+    savepoint so a failing job doesn't take the others with it.
+    """
+    def __init__(self, batch: int = 64):
+        self.batch   : int = batch
+        self._queue  : queue.Queue = queue.Queue()
+        self._thread : Optional[threading.Thread] = None
+        self._lock   : threading.Lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Queue fn(*args, **kwargs) to be run on the writer thread.
+        fn can use db.connection etc. as normal, but mustn't commit itself.
+        :return: Future resolving to the return value of fn
+        """
+        future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+            self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def stop(self):
+        """
+        Finish any queued jobs, then stop the writer thread.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._queue.put(None)
+        thread.join()
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            while len(jobs) < self.batch and jobs[-1] is not None:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            work = [j for j in jobs if j is not None and j[0].set_running_or_notify_cancel()]
+            if work:
+                self._commit(work)
+            if jobs[-1] is None:
+                return
+
+    @staticmethod
+    def _commit(jobs):
+        results = []
+        try:
+            with transaction(immediate=True):
+                for future, fn, args, kwargs in jobs:
+                    try:
+                        with transaction():
+                            results.append((future, fn(*args, **kwargs), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+        except Exception as e:
+            for future, *_ in jobs:
+                future.set_exception(e)
+            return
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+writer = Writer()
+
+atexit.register(writer.stop)
+
+
+def write(fn: Callable, *args, **kwargs) -> Future:
+    """
+    Shorthand helper to queue a job on the single db writer thread.
+    """
+    return writer.submit(fn, *args, **kwargs)
 
 
 def _setup():
-    for s in _schema_files:
-        _executefile(s)
+    """
+    Apply any migrations the db hasn't had yet.
+    The db's user_version holds the number of migrations applied, so an up
+    to date db costs a single pragma read.
+    """
+    c = connect()
+    if c.execute('PRAGMA user_version;').fetchone()[0] >= len(_migrations):
+        return
+    vacuum = False
+    for version, migration in enumerate(_migrations, 1):
+        with transaction(immediate=True):
+            # Re-read now the write lock is held, in case another process got here first
+            if c.execute('PRAGMA user_version;').fetchone()[0] >= version:
+                continue
+            if callable(migration):
+                vacuum |= bool(migration(c))
+            else:
+                _executefile(c, migration)
+            c.execute('PRAGMA user_version={};'.format(version))
+    # Migrations moving or dropping data leave space behind, either as free
+    # pages or half empty ones, so can ask for the db to be rebuilt after
+    if vacuum:
+        before = os.path.getsize(path)
+        c.execute('VACUUM;')
+        c.execute('PRAGMA wal_checkpoint(TRUNCATE);')
+        print('Compacted the db from {:.1f} MB to {:.1f} MB'.format(
+            before / 1024**2, os.path.getsize(path) / 1024**2,
+        ), file=sys.stderr)
 
 
 def _delete():
-    connection.close()
-    os.remove(_cwd + _db_file)
+    close()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
 
 
-def _executefile(f: str):
-    global connection
+def _executefile(c: sqlite3.Connection, f: str):
+    """
+    Run each statement in an sql file, without committing.
+    (executescript() would commit any open transaction first)
+    """
     with open(_cwd + 'sql/' + f, 'r') as f:
-        connection.executescript(f.read())
-        connection.commit()
+        statement = ''
+        for line in f:
+            statement += line
+            if sqlite3.complete_statement(statement):
+                c.execute(statement)
+                statement = ''
+
+
+def _episodes_fts(c: sqlite3.Connection):
+    _executefile(c, '003_episodes_fts.sql')
+    # Existing dbs gain the search index empty, so it needs filling from scratch
+    c.execute("INSERT INTO episodes_fts(episodes_fts) VALUES('rebuild');")
+
+
+def _descriptions(c: sqlite3.Connection):
+    """
+    Move descriptions out of episodes into their own table, compressed, and
+    along with a plain text rendering that the search index now covers.
+    :return: Whether there were any to move, as dropping the column then
+             leaves the episodes table's pages mostly empty, which only a
+             VACUUM reclaims
+    """
+    import plaintext
+    html_size = c.execute('SELECT COALESCE(SUM(LENGTH(CAST(description AS BLOB))), 0) FROM episodes;').fetchone()[0]
+    _executefile(c, '009_descriptions.sql')
+
+    sql = 'INSERT INTO descriptions(episodeID, html, text) VALUES(?,?,?);'
+    rows = c.execute('SELECT id, description FROM episodes;')
+    while True:
+        batch = rows.fetchmany(1000)
+        if not batch:
+            break
+        c.executemany(sql, ((x[0], compress(x[1]), plaintext.render(x[1])) for x in batch))
+    # DROP COLUMN needs SQLite 3.35, so older ones keep the column, emptied,
+    # which frees just as much space once vacuumed
+    if sqlite3.sqlite_version_info >= (3, 35, 0):
+        c.execute('ALTER TABLE episodes DROP COLUMN description;')
+    else:
+        c.execute('UPDATE episodes SET description=NULL;')
+
+    sql = 'SELECT COALESCE(SUM(LENGTH(html)), 0), COALESCE(SUM(LENGTH(CAST(text AS BLOB))), 0) FROM descriptions;'
+    compressed, text = c.execute(sql).fetchone()
+    if html_size:
+        print(
+            'Moved {:.1f} MB of episode descriptions out of the episodes table, '
+            'now {:.1f} MB compressed plus {:.1f} MB of plain text'.format(
+                html_size / 1024**2, compressed / 1024**2, text / 1024**2,
+            ),
+            file=sys.stderr,
+        )
+    return html_size > 0
+
+
+def compress(text: Optional[str]) -> Optional[bytes]:
+    """Compress text for storing in a BLOB column."""
+    return None if text is None else zlib.compress(text.encode())
+
+
+def decompress(data: Optional[bytes]) -> Optional[str]:
+    return None if data is None else zlib.decompress(data).decode()
+
+
+# Schema changes, applied in order & only once each, see _setup().
+# Entries are either files in sql/, or callables taking the connection,
+# which return True if the db should be vacuumed once migrations are done.
+# Only ever append to this, as a db's position in it is stored in the db.
+_migrations = (
+    '001_feeds.sql',
+    '002_episodes.sql',
+    _episodes_fts,
+    '004_indexes.sql',
+    '005_downloads.sql',
+    '006_queue.sql',
+    '007_positions.sql',
+    '008_schedule.sql',
+    _descriptions,
+    '010_feed_stats.sql',
+    '011_playlists.sql',
+    '012_body_hash.sql',
+    '013_unplayed_index.sql',
+)
 
 
 def cursor():
     """Shorthand helper to quickly get a cursor."""
     return connection.cursor()
 
-
-_setup()
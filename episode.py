@@ -1,12 +1,18 @@
 from __future__ import annotations
 from datetime import datetime
 from time import mktime
+import sqlite3
 
 import db
 import feed
+import plaintext
 from unique import Unique
+from writebuffer import WriteBuffer
 
 from typing import(
+    Iterable,
+    Iterator,
+    NamedTuple,
     Optional,
     Tuple,
     Union,
@@ -14,30 +20,71 @@ from typing import(
 
 
 class Episode(metaclass=Unique):
-    def __init__(self, id: int):
+    # Libraries can run to a great many episodes, so instances are kept small:
+    # no __dict__, times kept as the timestamps they're stored as, and the
+    # columns list views don't need only read on first use
+    __slots__ = (
+        'id', '_feed', '_guid', '_url', 'title', '_published', '_played', 'position',
+        '_described', '_html', '_text',
+        # For the identity map, see Unique
+        '__weakref__',
+    )
+
+    # Columns bulk queries read; guid & url are read on first use, see _detail()
+    _listed = 'id, feedID, title, published, played, position'
+
+    # Number of the newest matches Episode.search() ranks ahead of the rest
+    search_candidates = 2000
+
+    # Smart playlists, paged through by Episode.page():
+    # name -> (WHERE clause, whether newest first)
+    playlists = {
+        'All'      : ('1', False),
+        'Unplayed' : ('played IS NULL', False),
+        'Recent'   : ("published >= CAST(strftime('%s', 'now') AS INTEGER) - 14 * 24 * 60 * 60", True),
+    }
+
+    def __init__(self, id: int, row: Optional[sqlite3.Row] = None):
         self.id          : int
         self._feed       : int
-        self.guid        : str
-        self.url         : str
+        self._guid       : Optional[str]
+        self._url        : Optional[str]
         self.title       : str
-        self.description : Optional[str]
-        self._published  : datetime
-        self._played      : Optional[datetime]
+        self._published  : float
+        self._played     : Optional[float]
+        self.position    : Optional[int]
 
-        sql = 'SELECT * FROM episodes WHERE id=?;'
+        # Descriptions are kept in their own table, and only read when needed
+        self._described  : bool
+        self._html       : Optional[str]
+        self._text       : Optional[str]
 
-        c = db.connection.cursor()
-        c.execute(sql, (id,))
-        row = c.fetchone()
+        # Bulk queries pass the already fetched row in, saving a query per object
+        if row is None:
+            sql = 'SELECT * FROM episodes WHERE id=?;'
+            c = db.connection.cursor()
+            c.execute(sql, (id,))
+            row = c.fetchone()
 
         self.id          = row['id']
         self._feed       = row['feedID']
-        self.guid        = row['guid']
-        self.url         = row['url']
         self.title       = row['title']
-        self.description = row['description']
         self.published   = row['published']
         self.played      = row['played']
+        self.position    = row['position']
+
+        # Unless the query read them already
+        keys = row.keys()
+        if 'url' in keys:
+            self._guid = row['guid']
+            self._url  = row['url']
+        else:
+            self._guid = None
+            self._url  = None
+        self._described = 'html' in keys
+        if self._described:
+            self._html = db.decompress(row['html'])
+            self._text = row['text']
 
 
     @property
@@ -45,26 +92,70 @@ class Episode(metaclass=Unique):
         return feed.Feed(self._feed)
 
     @property
-    def published(self):
-        return self._published
+    def guid(self) -> str:
+        if self._guid is None:
+            self._detail()
+        return self._guid
+
+    @property
+    def url(self) -> str:
+        if self._url is None:
+            self._detail()
+        return self._url
+
+    def _detail(self):
+        sql = 'SELECT guid, url FROM episodes WHERE id=?;'
+        row = db.connection.execute(sql, (self.id,)).fetchone()
+        self._guid = row['guid']
+        self._url  = row['url']
+
+    @property
+    def description(self) -> Optional[str]:
+        """
+        The description as given by the feed, usually HTML.
+        """
+        if not self._described:
+            self._describe()
+        return self._html
+
+    @property
+    def text(self) -> Optional[str]:
+        """
+        The description rendered as plain text, see plaintext.py.
+        """
+        if not self._described:
+            self._describe()
+        return self._text
+
+    def _describe(self):
+        sql = 'SELECT html, text FROM descriptions WHERE episodeID=?;'
+        row = db.connection.execute(sql, (self.id,)).fetchone()
+        self._html = None if row is None else db.decompress(row['html'])
+        self._text = None if row is None else row['text']
+        self._described = True
+
+    @property
+    def published(self) -> datetime:
+        return datetime.fromtimestamp(self._published)
 
     @published.setter
-    def published(self, v: Union[int, datetime]):
-        if isinstance(v, int):
-            self._published = datetime.fromtimestamp(v)
-        else:
-            self._published = v
+    def published(self, v: Union[int, float, datetime]):
+        self._published = v.timestamp() if isinstance(v, datetime) else v
+
+    @property
+    def key(self) -> Tuple[float, int]:
+        """
+        (published, id), the order Episode.page() pages episodes in.
+        """
+        return self._published, self.id
 
     @property
     def played(self) -> Optional[datetime]:
-        return self._played
+        return None if self._played is None else datetime.fromtimestamp(self._played)
 
     @played.setter
-    def played(self, v: Optional[Union[int, datetime]]):
-        if isinstance(v, int):
-            self._played = datetime.fromtimestamp(v)
-        else:
-            self._played = v
+    def played(self, v: Optional[Union[int, float, datetime]]):
+        self._played = v.timestamp() if isinstance(v, datetime) else v
 
 
     def __str__(self):
@@ -72,51 +163,321 @@ class Episode(metaclass=Unique):
 
 
     def setplayed(self):
+        """
+        Mark as played now, clearing any resume position.
+        Written to the db in the background, see WriteBuffer.
+        """
         self.played = datetime.utcnow()
-        sql = 'UPDATE episodes SET played=? WHERE id=?;'
-        db.cursor().execute(sql, (self.played.timestamp(), self.id))
-        db.connection.commit()
+        self.position = None
+        WriteBuffer().played(self.id, self._played)
+        WriteBuffer().position(self.id, None)
+
+    def setposition(self, position: Optional[int]):
+        """
+        Set the position to resume playback from.
+        Written to the db in the background, see WriteBuffer.
+        :param position: Milliseconds into the episode, or None to clear it
+        """
+        self.position = position
+        WriteBuffer().position(self.id, position)
 
 
     @staticmethod
     def add(rss, parent) -> Optional[Episode]:
         sql = '''
             INSERT OR IGNORE INTO
-            episodes(feedID, guid, url, title, description, published)
-            VALUES(?,?,?,?,?,?);
+            episodes(feedID, guid, url, title, published)
+            VALUES(?,?,?,?,?);
         '''
         values = (
             parent.id,
             rss.id,
             rss.enclosures[0].href,
             rss.title,
-            rss.description,
             mktime(rss.published_parsed),
         )
         c = db.connection.cursor()
         c.execute(sql, values)
-        if c.rowcount is not 0:
-            return Episode(c.lastrowid)
+        if c.rowcount != 0:
+            id = c.lastrowid
+            description = getattr(rss, 'description', None)
+            sql = 'INSERT INTO descriptions(episodeID, html, text) VALUES(?,?,?);'
+            c.execute(sql, (id, db.compress(description), plaintext.render(description)))
+            return Episode(id)
         return None
 
 
+    @staticmethod
+    def addmany(entries: Iterable, parent, build: bool = False) -> Episode.Ingested:
+        """
+        Add many RSS entries to the db at once, skipping any the feed already has.
+        Entries are filtered against the GUIDs already stored for the feed, then
+        the rest inserted one at a time, taking the id of each that goes in (any
+        added since the check are ignored), and the descriptions of those
+        written with a single executemany.
+        Like add(), this leaves committing the transaction to the caller.
+        :param entries: RSS entries, e.g. FeedParserDict.entries
+        :param parent: Feed the entries belong to
+        :param build: Whether to build Episode objects for the new rows
+        :return: Summary of the new episodes
+        """
+        sql = 'SELECT guid FROM episodes WHERE feedID=?;'
+        known = {x['guid'].lower() for x in db.connection.execute(sql, (parent.id,))}
+
+        values = []
+        descriptions = {}
+        skipped = 0
+        for rss in entries:
+            try:
+                v = (
+                    parent.id,
+                    rss.id,
+                    rss.enclosures[0].href,
+                    rss.title,
+                    mktime(rss.published_parsed),
+                )
+            # Missing guid, enclosure, date, etc.
+            except (AttributeError, IndexError, KeyError, TypeError):
+                skipped += 1
+                continue
+            guid = v[1].lower()
+            if guid in known:
+                continue
+            known.add(guid)
+            values.append(v)
+            descriptions[guid] = getattr(rss, 'description', None)
+
+        if not values:
+            return Episode.Ingested(0, (), skipped, ())
+
+        # Ids are taken from each insert rather than looked up afterwards, as
+        # another writer (e.g. the scheduler & a cron refresh) may be adding
+        # episodes to the same feed at the same time
+        c = db.connection.cursor()
+        sql = '''
+            INSERT OR IGNORE INTO
+            episodes(feedID, guid, url, title, published)
+            VALUES(?,?,?,?,?);
+        '''
+        inserted = []
+        for v in values:
+            c.execute(sql, v)
+            if c.rowcount:
+                inserted.append((c.lastrowid, descriptions[v[1].lower()]))
+        ids = tuple(id for id, _ in inserted)
+
+        # Compressed & rendered as plain text once, here, rather than when shown
+        sql = 'INSERT INTO descriptions(episodeID, html, text) VALUES(?,?,?);'
+        c.executemany(sql, ((id, db.compress(d), plaintext.render(d)) for id, d in inserted))
+        episodes = ()
+        if build and ids:
+            # The write lock has been held since the first insert, so nothing
+            # else can have added episodes in among these
+            sql = 'SELECT * FROM episodes WHERE feedID=? AND id BETWEEN ? AND ? ORDER BY id;'
+            rows = c.execute(sql, (parent.id, ids[0], ids[-1])).fetchall()
+            episodes = tuple(Episode(x['id'], x) for x in rows)
+        return Episode.Ingested(len(ids), ids, skipped, episodes)
+
+
+    @staticmethod
+    def search(query: str, limit: int = 50, offset: int = 0) -> Tuple:
+        """
+        Full-text search of episode titles & descriptions, best matches first.
+        Each word of the query is matched as a prefix, so partial words match
+        as they're typed, and FTS syntax characters are treated as plain text.
+        Only the newest Episode.search_candidates matches are ranked up front,
+        and any older ones follow them, ranked among themselves once they're
+        paged to, see Episode.search_capped().
+        :param query: Words to search for
+        :param limit: Maximum number of episodes to get, -1 for no limit
+        :param offset: Number of episodes to skip over first
+        """
+        match = Episode._match(query)
+        if match is None:
+            return ()
+        cap = Episode.search_candidates
+        rows = []
+        # Rank within the index alone, only reading the page of episodes needed.
+        # Ranking is also limited to the newest matches, as ranking every
+        # match of a very common word takes far too long on a large library
+        if offset < cap:
+            sql = '''
+                SELECT {} FROM (
+                    SELECT rowid, rank FROM (
+                        SELECT rowid, rank FROM episodes_fts
+                        WHERE episodes_fts MATCH ?
+                        ORDER BY rowid DESC
+                        LIMIT ?
+                    )
+                    ORDER BY rank
+                    LIMIT ? OFFSET ?
+                ) AS matches
+                JOIN episodes ON episodes.id = matches.rowid
+                ORDER BY matches.rank;
+            '''.format(Episode._listed)
+            first = cap - offset if limit < 0 else min(limit, cap - offset)
+            rows = db.connection.execute(sql, (match, cap, first, offset)).fetchall()
+        # Paged past the newest matches, to the older ones, which are only
+        # ranked (slowly, for a common word) when scrolled this far
+        if (limit < 0 or offset + limit > cap) and len(rows) == max(cap - offset, 0):
+            sql = '''
+                SELECT {} FROM (
+                    SELECT rowid, rank FROM episodes_fts
+                    WHERE episodes_fts MATCH ? AND rowid < (
+                        SELECT rowid FROM episodes_fts
+                        WHERE episodes_fts MATCH ?
+                        ORDER BY rowid DESC
+                        LIMIT 1 OFFSET ?
+                    )
+                    ORDER BY rank
+                    LIMIT ? OFFSET ?
+                ) AS matches
+                JOIN episodes ON episodes.id = matches.rowid
+                ORDER BY matches.rank;
+            '''.format(Episode._listed)
+            rest = -1 if limit < 0 else limit - len(rows)
+            rows += db.connection.execute(sql, (match, match, cap - 1, rest, max(offset - cap, 0))).fetchall()
+        return tuple(Episode(x['id'], x) for x in rows)
+
+    @staticmethod
+    def search_capped(query: str) -> bool:
+        """
+        Whether a search has more matches than Episode.search_candidates, so
+        only the newest of them are ranked ahead of the rest.
+        """
+        match = Episode._match(query)
+        if match is None:
+            return False
+        sql = 'SELECT rowid FROM episodes_fts WHERE episodes_fts MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?;'
+        return db.connection.execute(sql, (match, Episode.search_candidates)).fetchone() is not None
+
+    @staticmethod
+    def _match(query: str) -> Optional[str]:
+        """
+        :return: The FTS match expression for a search, None for an empty one
+        """
+        # Very short prefixes match most of the library, and ranking that many
+        # rows is slow, so short words only match whole words
+        words = query.split()
+        if not words:
+            return None
+        return ' '.join(
+            '"{}"{}'.format(w.replace('"', '""'), '*' if len(w) >= 3 else '')
+            for w in words
+        )
+
+
     @staticmethod
     def getall() -> Tuple:
         """
         Get a tuple of all the episodes from all feeds,
         in ascending order of the date they were published.
         """
-        sql = 'SELECT id FROM episodes ORDER BY published ASC;'
+        sql = 'SELECT {} FROM episodes ORDER BY published ASC;'.format(Episode._listed)
         c = db.connection.execute(sql)
-        return tuple(Episode(x['id']) for x in c.fetchall())
+        return tuple(Episode(x['id'], x) for x in c.fetchall())
+
+
+    @staticmethod
+    def iterate(f: Optional[feed.Feed] = None, descriptions: bool = False) -> Iterator[Episode]:
+        """
+        Iterate over all the episodes (from a given feed, or all feeds),
+        in ascending order of the date they were published.
+        Rows are read from the db as the iteration goes, so this can be used
+        to stream very large listings.
+        :param descriptions: Read the descriptions in the same query, rather
+                             than one at a time as they're used
+        """
+        sql = 'SELECT episodes.*{} FROM episodes{}{} ORDER BY published ASC;'.format(
+            ', descriptions.html, descriptions.text' if descriptions else '',
+            ' LEFT JOIN descriptions ON descriptions.episodeID = episodes.id' if descriptions else '',
+            '' if f is None else ' WHERE feedID=?',
+        )
+        c = db.connection.execute(sql, () if f is None else (f.id,))
+        for x in c:
+            yield Episode(x['id'], x)
 
 
     @staticmethod
-    def getbyfeed(f: feed.Feed) -> Tuple:
+    def getbyfeed(f: feed.Feed, limit: int = -1, offset: int = 0) -> Tuple:
         """
         Get a tuple of all the episodes from a given feed,
         in ascending order of the date they were published.
+        :param limit: Maximum number of episodes to get, -1 for no limit
+        :param offset: Number of episodes to skip over first
+        """
+        sql = 'SELECT {} FROM episodes WHERE feedID=? ORDER BY published ASC LIMIT ? OFFSET ?;'.format(
+            Episode._listed,
+        )
+        c = db.connection.execute(sql, (f.id, limit, offset))
+        return tuple(Episode(x['id'], x) for x in c.fetchall())
+
+
+    @staticmethod
+    def page(filter: Union[str, feed.Feed], after: Optional[Tuple[float, int]] = None,
+             limit: int = 64, backward: bool = False) -> Tuple:
+        """
+        Get a page of the episodes of a feed or smart playlist, in published
+        order (then id, for episodes published at the same time).
+        Pages follow on from the key of the last episode of the previous one
+        rather than an OFFSET, so are read straight from the index position,
+        costing the same however far into the list they are.
+        :param filter: A feed, or the name of one of Episode.playlists
+        :param after: Episode.key of the last episode of the previous page,
+                      None for the first page
+        :param limit: Maximum number of episodes to get, -1 for no limit
+        :param backward: Page backwards instead, `after` then being the key
+                         of the first episode of the following page (None for
+                         the last page); episodes are still in list order
+        """
+        where, newest, values = Episode._filter(filter)
+        # Reading backwards is reading the list in reverse, then reversing the page
+        descending = newest != backward
+        if after is not None:
+            where += ' AND (published, id) {} (?, ?)'.format('<' if descending else '>')
+            values.extend(after)
+        sql = 'SELECT {0} FROM episodes WHERE {1} ORDER BY published {2}, id {2} LIMIT ?;'.format(
+            Episode._listed, where, 'DESC' if descending else 'ASC',
+        )
+        c = db.connection.execute(sql, values + [limit])
+        rows = c.fetchall()
+        if backward:
+            rows.reverse()
+        return tuple(Episode(x['id'], x) for x in rows)
+
+
+    @staticmethod
+    def count(filter: Union[str, feed.Feed], before: Optional[Tuple[float, int]] = None) -> int:
+        """
+        Count the episodes of a feed or smart playlist, see Episode.page().
+        :param before: Only count those listed before the episode with this
+                       Episode.key, giving its position in the list
+        """
+        where, newest, values = Episode._filter(filter)
+        if before is not None:
+            where += ' AND (published, id) {} (?, ?)'.format('>' if newest else '<')
+            values.extend(before)
+        sql = 'SELECT COUNT(*) FROM episodes WHERE {};'.format(where)
+        return db.connection.execute(sql, values).fetchone()[0]
+
+
+    @staticmethod
+    def _filter(filter: Union[str, feed.Feed]) -> Tuple[str, bool, list]:
+        """
+        :return: The WHERE clause picking out the episodes of a feed or smart
+                 playlist, whether they're listed newest first, & its values
+        """
+        if isinstance(filter, feed.Feed):
+            return 'feedID=?', False, [filter.id]
+        where, newest = Episode.playlists[filter]
+        return where, newest, []
+
+
+    class Ingested(NamedTuple):
+        """
+        Outcome of Episode.addmany()
         """
-        sql = 'SELECT id FROM episodes WHERE feedID=? ORDER BY published ASC;'
-        c = db.connection.execute(sql, (f.id,))
-        return tuple(Episode(x['id']) for x in c.fetchall())
+        count    : int
+        ids      : Tuple[int, ...]
+        skipped  : int
+        episodes : Tuple[Episode, ...]
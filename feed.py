@@ -1,35 +1,72 @@
 from __future__ import annotations
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-
-import feedparser
+import hashlib
+from itertools import islice
+import queue
+import sqlite3
+from threading import Event, RLock
+from time import perf_counter
+from urllib.error import HTTPError
+from urllib.parse import urlsplit, urlunsplit
 
 import db
+import fetch
+import metrics
 from episode import Episode
 from unique import Unique
+from writebuffer import WriteBuffer
 
 from typing import(
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
     Union,
     Optional,
+    Set,
     Tuple,
+    TYPE_CHECKING,
 )
 
+# Only for annotations, as feedparser is slow to load, see Feed._get()
+if TYPE_CHECKING:
+    import feedparser
+
+
 
 class Feed(metaclass=Unique):
-    def __init__(self, id):
+    # No __dict__, as with Episode
+    __slots__ = (
+        'id', 'url', 'title', 'description', 'etag', 'modified', 'body_hash', 'stats',
+        '_updated', '_rss',
+        # For the identity map, see Unique
+        '__weakref__',
+    )
+
+    def __init__(self, id, row: Optional[sqlite3.Row] = None):
         self.id          : int
         self.url         : str
         self.title       : str
         self.description : Optional[str]
         self.etag        : str
         self.modified    : str
+        self.body_hash   : Optional[str]
+        self.stats       : Feed.Stats
 
-        self._updated : Optional[datetime]
+        self._updated : Optional[float]
         self._rss     : Optional[feedparser.FeedParserDict]
 
-        sql = 'SELECT * FROM feeds WHERE id=?;'
-        c = db.connection.cursor()
-        c.execute(sql, (id,))
-        row = c.fetchone()
+        # Bulk queries pass the already fetched row in, saving a query per object
+        if row is None:
+            sql = 'SELECT * FROM feeds LEFT JOIN feed_stats ON feedID=id WHERE id=?;'
+            c = db.connection.cursor()
+            c.execute(sql, (id,))
+            row = c.fetchone()
         self.id          = row['id']
         self.url         = row['url']
         self.title       = row['title']
@@ -37,20 +74,19 @@ class Feed(metaclass=Unique):
         self.etag        = row['etag']
         self.updated     = row['updated']
         self.modified    = row['modified']
+        self.body_hash   = row['body_hash']
+        self.stats       = Feed.Stats.fromrow(row)
 
         self._rss = None
 
 
     @property
-    def updated(self):
-        return self._updated
+    def updated(self) -> Optional[datetime]:
+        return None if self._updated is None else datetime.fromtimestamp(self._updated)
 
     @updated.setter
-    def updated(self, v: Union[int, datetime, None]):
-        if isinstance(v, int):
-            self._updated = datetime.fromtimestamp(v)
-        else:
-            self._updated = v
+    def updated(self, v: Union[int, float, datetime, None]):
+        self._updated = v.timestamp() if isinstance(v, datetime) else v
 
     @property
     def episodes(self):
@@ -61,12 +97,28 @@ class Feed(metaclass=Unique):
         return self.title
 
 
+    def setplayed(self):
+        """
+        Mark every unplayed episode of this feed as played now.
+        Written to the db in the background as a single statement, see WriteBuffer.
+        """
+        now = datetime.utcnow()
+        for e in Episode.cached():
+            if e._feed == self.id and e.played is None:
+                e.played = now
+        WriteBuffer().feedplayed(self.id, now.timestamp())
+        self.stats = self.stats._replace(unplayed=0, last_played=now)
+
+
     @staticmethod
-    def add(url: str) -> Feed:
+    def add(url: str, cancelled: Optional[Event] = None) -> Optional[Feed]:
         """
         Add new feed to the db
         :param url: RSS feed url to add
-        :return: Feed object
+        :param cancelled: Set (e.g. from another thread) to abandon adding
+                          the feed, which is checked once it's downloaded,
+                          before anything is written
+        :return: Feed object, or None if cancelled
         """
 
         # First we ensure we're not duplicating anything, checking the db
@@ -76,7 +128,10 @@ class Feed(metaclass=Unique):
         if count:
             raise Feed.Error('URL already in feed table in db')
 
-        rss = feedparser.parse(url)
+        try:
+            rss = Feed._get(url)
+        except Exception as e:
+            raise Feed.Error('The feed could not be downloaded: {}'.format(e)) from e
 
         # This will throw if the rss is malformed, but also if the url is junk
         # or the url doesn't point to an rss feed, etc.
@@ -86,49 +141,475 @@ class Feed(metaclass=Unique):
                 'There was an error parsing the given feed, and it could not be added'
             ) from rss.bozo_exception
 
+        if cancelled is not None and cancelled.is_set():
+            return None
+        # Written on the db writer thread, like every other write, so never
+        # waits on (or holds up) the scheduler's
+        return db.write(Feed._insert, url, rss).result()[0]
+
+
+    @staticmethod
+    def add_many(urls: Iterable[str], workers: int = 8, per_host: int = 2, batch: int = 25,
+                 progress: Optional[Callable[[int, int, Feed.Added], None]] = None) -> Tuple[Feed.Added]:
+        """
+        Add several new feeds at once, fetching them concurrently.
+        Urls are normalised (see Feed.normalise()), then checked against the
+        feeds already in the db, and each other, in a single query before
+        anything is fetched.
+        Only the fetch & parse happens in the worker threads; feeds are
+        written on the db writer thread (see db.Writer), one job per feed,
+        `batch` at a time, so they're written in as few transactions, each
+        in a savepoint so a failing feed doesn't take the rest with it.
+        Failures & duplicates are recorded in the results rather than raised.
+        :param urls: RSS feed urls to add
+        :param workers: Maximum number of feeds fetched at once
+        :param per_host: Maximum number of feeds fetched at once from any one host
+        :param batch: Number of feeds queued on the db writer at once
+        :param progress: Called on the calling thread as each url is dealt
+                         with, with the number dealt with so far, the total,
+                         and its result
+        :return: A Feed.Added for each url, duplicates first, then in order of completion
+        """
+        urls = [Feed.normalise(u) for u in urls]
+        results = []
+
+        def done(r: Feed.Added):
+            results.append(r)
+            if progress is not None:
+                progress(len(results), len(urls), r)
+
+        # Urls are unique regardless of case in the db, see sql/001_feeds.sql
+        sql = 'SELECT url FROM feeds;'
+        seen = {Feed.normalise(x['url']).lower() for x in db.connection.execute(sql)}
+        new = []
+        for url in urls:
+            if url.lower() in seen:
+                done(Feed.Added(url, Feed.Added.DUPLICATE, None, None))
+            else:
+                seen.add(url.lower())
+                new.append(url)
+
+        def fetch(url: str):
+            rss = Feed._get(url)
+            # This will throw if the rss is malformed, but also if the url is junk
+            # or the url doesn't point to an rss feed, etc.
+            if rss.bozo:
+                raise Feed.Error(
+                    'There was an error parsing the given feed, and it could not be added'
+                ) from rss.bozo_exception
+            return rss
+
+        completed = Feed._fetched(new, fetch, lambda url: url, workers, per_host)
+        while True:
+            chunk = tuple(islice(completed, batch))
+            if not chunk:
+                break
+            writes = []
+            for url, future in chunk:
+                try:
+                    rss = future.result()
+                except Exception as e:
+                    done(Feed.Added(url, Feed.Added.FAILED, None, e))
+                else:
+                    writes.append((url, db.write(Feed._insert, url, rss)))
+            for url, write in writes:
+                try:
+                    f, episodes = write.result()
+                except sqlite3.IntegrityError:
+                    # Added by something else since the check above
+                    done(Feed.Added(url, Feed.Added.DUPLICATE, None, None))
+                except Exception as e:
+                    done(Feed.Added(url, Feed.Added.FAILED, None, e))
+                else:
+                    done(Feed.Added(url, Feed.Added.ADDED, f, None, episodes))
+        return tuple(results)
+
+
+    @staticmethod
+    def normalise(url: str) -> str:
+        """
+        Normalise a feed url, so different spellings of the same url are
+        recognised as duplicates: surrounding whitespace, fragments & default
+        ports are dropped, the scheme & host lowercased, and the feed:// style
+        pseudo-schemes podcast directories link with turned into http.
+        """
+        url = url.strip()
+        lower = url.lower()
+        for scheme in ('feed:', 'itpc:', 'pcast:'):
+            if lower.startswith(scheme):
+                # Either feed://host/path, or feed:https://host/path
+                url = url[len(scheme):]
+                url = 'http:' + url if url.startswith('//') else url
+                break
+        parts = urlsplit(url)
+        # Bare hostnames, but not local paths
+        if not parts.scheme and not url.startswith('/'):
+            parts = urlsplit('http://' + url)
+        scheme = parts.scheme.lower()
+        netloc = parts.netloc
+        if parts.hostname is not None:
+            host = parts.hostname
+            if ':' in host:
+                host = '[{}]'.format(host)
+            try:
+                port = parts.port
+            except ValueError:
+                # Left as it is, to fail when it's fetched
+                return url
+            if port is not None and (scheme, port) not in (('http', 80), ('https', 443)):
+                host += ':{}'.format(port)
+            user = netloc.rpartition('@')[0]
+            netloc = '{}@{}'.format(user, host) if user else host
+        path = parts.path or ('/' if netloc else '')
+        return urlunsplit((scheme, netloc, path, parts.query, ''))
+
+
+    @staticmethod
+    def _insert(url: str, rss: feedparser.FeedParserDict) -> Tuple[Feed, int]:
+        """
+        Write a newly fetched feed & its episodes into the db, without
+        committing, e.g. as a job on the db writer.
+        :return: The new feed, & the number of its episodes written
+        """
         etag = rss.etag if hasattr(rss, 'etag') else None
         modified = rss.modified if hasattr(rss, 'modified') else None
 
-        sql = 'INSERT INTO feeds(url, title, description, etag, modified) VALUES(?,?,?,?,?);'
+        sql = 'INSERT INTO feeds(url, title, description, etag, modified, body_hash) VALUES(?,?,?,?,?,?);'
         c = db.cursor()
-        c.execute(sql, (url, rss.feed.title, rss.feed.description, etag, modified))
+        c.execute(sql, (url, rss.feed.title, rss.feed.get('description'), etag, modified, rss.get('hash')))
         f = Feed(c.lastrowid)
         f._rss = rss
-        f._update_episodes()
-        db.connection.commit()
-        return f
-
+        try:
+            ingested = f._update_episodes()
+        except Exception:
+            # The insert is about to be rolled back, so its id may be reused
+            Feed.invalidate(f.id)
+            raise
+        finally:
+            # Not needed once written, as in Feed._apply()
+            f._rss = None
+        return f, ingested.count
+
+
+    # ORDER BY clauses of the orders Feed.getall() can sort by
+    sorts = {
+        'id'       : 'id',
+        'title'    : 'title COLLATE NOCASE',
+        'unplayed' : 'unplayed DESC, title COLLATE NOCASE',
+        'latest'   : 'latest DESC',
+        'played'   : 'last_played DESC',
+    }
 
     @staticmethod
-    def getall() -> Tuple[Feed]:
+    def getall(sort: str = 'id') -> Tuple[Feed]:
         """
-        Get all feeds currently in the db
+        Get all feeds currently in the db, along with their stats, in a
+        single query; the stats of already loaded feeds are refreshed too.
+        :param sort: One of Feed.sorts
         :return: All current feeds
         """
-        sql = 'SELECT id FROM feeds;'
+        if sort not in Feed.sorts:
+            raise ValueError('Unknown feed order: {}'.format(sort))
+        sql = 'SELECT * FROM feeds LEFT JOIN feed_stats ON feedID=id ORDER BY {};'.format(Feed.sorts[sort])
         c = db.cursor()
         c.execute(sql)
-        return tuple(Feed(x['id']) for x in c.fetchall())
+        feeds = []
+        for x in c.fetchall():
+            f = Feed(x['id'], x)
+            f.stats = Feed.Stats.fromrow(x)
+            feeds.append(f)
+        return tuple(feeds)
 
     @staticmethod
     def maxtitlelength():
+        # Answered from the end of feeds__title_length_index, without a scan
         sql = 'SELECT MAX(LENGTH(title)) FROM feeds;'
         c = db.connection.execute(sql)
         return c.fetchone()[0]
 
 
-    def update(self):
+    def update(self, stream: bool = False):
         """
         Re-download and parse the RSS file, updating local db accordingly.
+        :param stream: Read the feed incrementally, stopping at the episodes
+                       already in the db, rather than parsing all of it
+        """
+        db.write(self._apply, self._fetch(self._guids() if stream else None)).result()
+
+
+    @staticmethod
+    def update_many(feeds: Iterable[Feed], workers: int = 8, per_host: int = 2,
+                    batch: int = 25, stream: bool = False, stop: Optional[Event] = None) -> Tuple[Feed.Result]:
+        """
+        Update several feeds at once, fetching them concurrently.
+        Only the network fetch & parse happens in the worker threads; feeds
+        are written on the db writer thread (see db.Writer), one job per feed,
+        `batch` at a time, so they're written in as few transactions, each in
+        a savepoint so a feed failing part way leaves nothing behind.
+        Failures are recorded in the results rather than raised.
+        :param feeds: Feeds to update
+        :param workers: Maximum number of feeds fetched at once
+        :param per_host: Maximum number of feeds fetched at once from any one host
+        :param batch: Number of feeds queued on the db writer at once
+        :param stream: Parse incrementally, see Feed.update()
+        :param stop: Event to set to stop part way, e.g. on quitting; no more
+                     fetches are started, nor feeds written, and those not
+                     updated are left out of the results
+        :return: A Feed.Result for each feed, in order of completion
+        """
+        feeds = tuple(feeds)
+        stop = stop or Event()
+        known = {f: f._guids() if stream else None for f in feeds}
+
+        def fetch(f: Feed):
+            start = perf_counter()
+            return f._fetch(known[f]), perf_counter() - start
+
+        def write(f: Feed, rss: feedparser.FeedParserDict):
+            start = perf_counter()
+            status, new = f._apply(rss)
+            return status, new, perf_counter() - start
+
+        results = []
+        completed = Feed._fetched(feeds, fetch, lambda f: f.url, workers, per_host, stop)
+        while not stop.is_set():
+            chunk = tuple(islice(completed, batch))
+            if not chunk:
+                break
+            writes = []
+            for f, future in chunk:
+                if stop.is_set():
+                    break
+                try:
+                    rss, fetch_time = future.result()
+                except Exception as e:
+                    results.append(Feed.Result(f, Feed.Result.FAILED, None, 0, 0, e))
+                else:
+                    writes.append((f, fetch_time, db.write(write, f, rss)))
+            for f, fetch_time, future in writes:
+                try:
+                    status, new, write_time = future.result()
+                    error = None
+                except Exception as e:
+                    # Rolled back, so the object no longer matches the db
+                    Feed.invalidate(f.id)
+                    status, new, write_time = Feed.Result.FAILED, 0, 0
+                    error = e
+                results.append(Feed.Result(f, status, fetch_time, write_time, new, error))
+        # Stops fetching, should the loop have been left part way
+        completed.close()
+        return tuple(results)
+
+
+    @staticmethod
+    def update_all(**kwargs) -> Tuple[Feed.Result]:
+        """
+        Update every feed in the db, see Feed.update_many()
         """
-        self._rss = feedparser.parse(self.url, etag=self.etag, modified=self.modified)
+        return Feed.update_many(Feed.getall(), **kwargs)
 
-        # HTTP 304 - Not Modified
-        if self._rss.status is 304:
+
+    def _fetch(self, known: Optional[Set[str]] = None) -> feedparser.FeedParserDict:
+        """
+        Download and parse the RSS file, conditional on the stored etag/modified.
+        Touches neither the db nor this object, so is safe to call from any thread.
+        :param known: If given, stream the feed, stopping at these (lowercased)
+                      GUIDs; falls back to a full parse if it can't be streamed
+        """
+        return Feed._get(self.url, self.etag, self.modified, self.body_hash, known, self.id)
+
+
+    @staticmethod
+    def _get(url: str, etag: Optional[str] = None, modified: Optional[str] = None,
+             body_hash: Optional[str] = None, known: Optional[Set[str]] = None,
+             id: Optional[int] = None) -> feedparser.FeedParserDict:
+        """
+        Download and parse an RSS file, see Feed._fetch(), which also serves
+        feeds not in the db yet.
+        http(s) feeds are downloaded through fetch.py's connection pool, and
+        only the downloaded bytes handed to feedparser; a body identical to
+        the last one (by its hash) isn't parsed at all, and like a 304 comes
+        back marked 'unchanged', without entries.
+        The download & parse are done separately, so each can be timed, see metrics.
+        :param body_hash: Hash of the body of the previous fetch
+        :param id: Feed the fetch is recorded against in the metrics, along
+                   with the url, as feeds being added have no id yet
+        """
+        # Imported on first fetch, as they're slow to load
+        import feedparser
+        import feedstream
+        start = perf_counter()
+        if known is not None:
+            try:
+                rss = feedstream.parse(url, known, etag, modified)
+            except feedstream.Unsupported:
+                pass
+            else:
+                if metrics.enabled:
+                    metrics.record(
+                        'fetch',
+                        feed=id,
+                        url=url,
+                        parser='stream',
+                        status=rss.status,
+                        fetch_ms=(perf_counter() - start) * 1000,
+                        entries=len(rss.entries),
+                    )
+                return rss
+
+        # Left to feedparser, which also reads local files etc.
+        if urlsplit(url).scheme not in ('http', 'https'):
+            return feedparser.parse(url, etag=etag, modified=modified)
+
+        try:
+            response = fetch.open(url, etag, modified)
+        except HTTPError as e:
+            if metrics.enabled:
+                metrics.record('fetch', feed=id, url=url, status=e.code, request_ms=(perf_counter() - start) * 1000)
+            raise
+        requested = perf_counter()
+        with response:
+            data = response.read()
+        transferred = perf_counter()
+
+        # HTTP 304 - Not Modified, or the same file as last time from a host
+        # ignoring the conditional headers, which then needn't be parsed
+        digest = hashlib.sha1(data).hexdigest()
+        if response.status == 304 or digest == body_hash:
+            rss = feedparser.FeedParserDict(status=response.status, href=response.url, bozo=False, entries=[])
+            rss['feed'] = feedparser.FeedParserDict()
+            rss['unchanged'] = True
+        else:
+            # Already decompressed, & relative links (so GUIDs) resolve against the final url
+            headers = {k: v for k, v in response.headers.items() if k not in ('content-encoding', 'content-length')}
+            headers['content-location'] = response.url
+            rss = feedparser.parse(data, response_headers=headers)
+            rss['status'] = response.status
+            rss['href'] = response.url
+            rss['hash'] = digest
+        if 'etag' in response.headers:
+            rss['etag'] = response.headers['etag']
+        if 'last-modified' in response.headers:
+            rss['modified'] = response.headers['last-modified']
+
+        if metrics.enabled:
+            metrics.record(
+                'fetch',
+                feed=id,
+                url=url,
+                parser=None if rss.get('unchanged') else 'feedparser',
+                status=response.status,
+                unchanged=int(response.status != 304 and bool(rss.get('unchanged'))),
+                reused=int(response.reused),
+                bytes=len(data),
+                received=response.received,
+                request_ms=(requested - start) * 1000,
+                transfer_ms=(transferred - requested) * 1000,
+                parse_ms=(perf_counter() - transferred) * 1000,
+                entries=len(rss.entries),
+            )
+        return rss
+
+
+    @staticmethod
+    def _fetched(items: Iterable, fetch: Callable[[Any], Any], url: Callable[[Any], str],
+                 workers: int, per_host: int, stop: Optional[Event] = None) -> Iterator[Tuple[Any, Future]]:
+        """
+        Run fetch(item) for each item on a pool of `workers` threads, with at
+        most per_host running at once for any one host.
+        Each host has its own queue of items, and its next item is only handed
+        to the pool once one of its fetches finishes, so no worker ever sits
+        waiting on a busy host while other hosts' feeds could be fetched.
+        :param url: Gives the url of an item, for its host
+        :param stop: Once set, no more fetches are started, those handed to
+                     the pool but not started failing with Feed.Stopped, and
+                     the items never handed over are left out
+        :return: (item, future) of each fetch, as they finish
+        """
+        stop = stop or Event()
+        hosts : Dict[Optional[str], Deque] = {}
+        for x in items:
+            hosts.setdefault(urlsplit(url(x)).hostname, deque()).append(x)
+        finished : queue.Queue = queue.Queue()
+        # Reentrant, as a fetch done by the time it's submitted calls back at once
+        lock = RLock()
+        executor = ThreadPoolExecutor(max_workers=workers)
+        # Fetches submitted but not yet taken off `finished`, & whether the
+        # pool has been shut down, both guarded by lock
+        pending = 0
+        closed = False
+
+        def run(x: Any):
+            if stop.is_set():
+                raise Feed.Stopped()
+            return fetch(x)
+
+        def submit(host: Optional[str]):
+            nonlocal pending
+            x = hosts[host].popleft()
+            pending += 1
+            executor.submit(run, x).add_done_callback(lambda future: done(host, x, future))
+
+        def done(host: Optional[str], x: Any, future: Future):
+            with lock:
+                if hosts[host] and not (closed or stop.is_set()):
+                    submit(host)
+            finished.put((x, future))
+
+        with lock:
+            for host, q in hosts.items():
+                for _ in range(min(per_host, len(q))):
+                    submit(host)
+        try:
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    pending -= 1
+                yield finished.get()
+        finally:
+            with lock:
+                closed = True
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+    def _guids(self) -> Set[str]:
+        """
+        :return: The (lowercased) GUIDs of all this feed's episodes
+        """
+        sql = 'SELECT guid FROM episodes WHERE feedID=?;'
+        return {x['guid'].lower() for x in db.connection.execute(sql, (self.id,))}
+
+
+    def _apply(self, rss: feedparser.FeedParserDict) -> Tuple[str, int]:
+        """
+        Write a freshly fetched RSS file into the db, without committing,
+        e.g. as a job on the db writer.
+        :return: Feed.Result.UNMODIFIED on HTTP 304, otherwise Feed.Result.UPDATED,
+                 along with the number of new episodes
+        """
+        start = perf_counter()
+        self._rss = rss
+        try:
+            return self._write(start)
+        finally:
+            # Not needed once written, and would otherwise be kept around
+            # with the feed, for every feed updated
+            self._rss = None
+
+    def _write(self, start: float) -> Tuple[str, int]:
+        # HTTP 304 - Not Modified, or the same file as last time, see Feed._get()
+        if getattr(self._rss, 'status', None) == 304 or getattr(self._rss, 'unchanged', False):
+            # The server may still have sent a new etag/modified, without which
+            # later fetches would be conditional on stale ones & never 304
+            self.etag = getattr(self._rss, 'etag', None) or self.etag
+            self.modified = getattr(self._rss, 'modified', None) or self.modified
             self.updated = datetime.utcnow()
-            sql = 'UPDATE feeds SET updated=? WHERE id=?;'
-            db.connection.execute(sql, (self.updated.timestamp(), self.id))
-            return
+            sql = 'UPDATE feeds SET etag=?, modified=?, updated=? WHERE id=?;'
+            db.connection.execute(sql, (self.etag, self.modified, self._updated, self.id))
+            if metrics.enabled:
+                metrics.record('apply', feed=self.id, write_ms=(perf_counter() - start) * 1000, new=0)
+            return Feed.Result.UNMODIFIED, 0
 
         # This will throw if the rss is malformed, but also if the url is junk
         # or the url doesn't point to an rss feed, etc.
@@ -137,33 +618,98 @@ class Feed(metaclass=Unique):
             raise self._rss.bozo_exception
 
         self.title = self._rss.feed.title
-        self.description = self._rss.feed.description
+        # Optional in RSS, & feedstream's channels aren't dicts, so no .get()
+        self.description = getattr(self._rss.feed, 'description', None)
         self.etag = self._rss.etag if hasattr(self._rss, 'etag') else None
-        self.modified = self._rss.modified
+        self.modified = self._rss.modified if hasattr(self._rss, 'modified') else None
+        # Streamed feeds are only hashed when read to the end, see feedstream,
+        # and otherwise keep the last hash: it can only match a body whose
+        # episodes are all in the db already
+        self.body_hash = getattr(self._rss, 'hash', None) or self.body_hash
         self.updated = datetime.utcnow()
 
-        self._update_episodes()
+        ingested = self._update_episodes()
 
-        sql = 'UPDATE feeds SET title=?, description=?, etag=?, modified=?, updated=? WHERE id=?;'
+        sql = 'UPDATE feeds SET title=?, description=?, etag=?, modified=?, body_hash=?, updated=? WHERE id=?;'
         values = (
             self.title,
             self.description,
             self.etag,
             self.modified,
+            self.body_hash,
             self.updated.timestamp(),
             self.id,
         )
 
         c = db.cursor()
         c.execute(sql, values)
+        if metrics.enabled:
+            metrics.record('apply', feed=self.id, write_ms=(perf_counter() - start) * 1000, new=ingested.count)
+        return Feed.Result.UPDATED, ingested.count
+
+
+    def _update_episodes(self) -> Episode.Ingested:
+        return Episode.addmany(self._rss.entries, self)
 
-        db.connection.commit()
 
+    class Stats(NamedTuple):
+        """
+        Aggregates of a feed's episodes, maintained by triggers in the db
+        (see sql/010_feed_stats.sql), so as cheap to read as the feed itself.
+        """
+        episodes    : int
+        unplayed    : int
+        latest      : Optional[datetime]
+        last_played : Optional[datetime]
+
+        @staticmethod
+        def fromrow(row: sqlite3.Row) -> Feed.Stats:
+            def time(v):
+                return None if v is None else datetime.fromtimestamp(v)
+            return Feed.Stats(
+                row['episodes'] or 0,
+                row['unplayed'] or 0,
+                time(row['latest']),
+                time(row['last_played']),
+            )
+
+
+    class Added(NamedTuple):
+        """
+        Outcome of adding a single feed with Feed.add_many()
+        """
+        ADDED     = 'added'
+        DUPLICATE = 'duplicate'
+        FAILED    = 'failed'
 
-    def _update_episodes(self):
-        for entry in self._rss.entries:
-            Episode.add(entry, self)
+        url      : str
+        status   : str
+        feed     : Optional[Feed]
+        error    : Optional[BaseException]
+        # Number of the feed's episodes written as it was added
+        episodes : int = 0
+
+
+    class Result(NamedTuple):
+        """
+        Outcome of updating a single feed with Feed.update_many()
+        """
+        UPDATED    = 'updated'
+        UNMODIFIED = 'unmodified'
+        FAILED     = 'failed'
+
+        feed       : Feed
+        status     : str
+        fetch_time : Optional[float]
+        write_time : float
+        new        : int
+        error      : Optional[BaseException]
 
 
     class Error(Exception):
         pass
+
+    class Stopped(Exception):
+        """
+        Raised by a fetch never started as Feed.update_many() was stopped.
+        """
@@ -0,0 +1,197 @@
+"""
+Incremental RSS parser for routine refreshes.
+
+feedparser reads and builds the whole document, but a refresh usually only
+needs the newest few items. This reads RSS 2.0 items one at a time straight
+off the HTTP response and stops as soon as it has seen a run of GUIDs the
+feed already has, so memory stays flat and work scales with the new content.
+
+Results duck-type the parts of feedparser.FeedParserDict that Feed uses.
+Anything this can't handle (not RSS 2.0, not http(s), malformed XML, items
+not in reverse-chronological order, ...) raises Unsupported, so the caller
+can fall back to feedparser.
+"""
+from email.utils import mktime_tz, parsedate_tz
+import hashlib
+from time import gmtime, struct_time
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+import xml.etree.ElementTree as ElementTree
+
+import fetch
+
+from typing import(
+    List,
+    Optional,
+    Set,
+)
+
+# How many consecutive already known items to read before stopping
+run = 3
+
+
+class Unsupported(Exception):
+    pass
+
+
+class Enclosure:
+    def __init__(self, href: str):
+        self.href = href
+
+
+class Entry:
+    def __init__(self):
+        self.id               : str
+        self.title            : str
+        self.description      : Optional[str] = None
+        self.published_parsed : Optional[struct_time] = None
+        self.enclosures       : List[Enclosure] = []
+
+
+class Channel:
+    def __init__(self):
+        self.title       : Optional[str] = None
+        self.description : Optional[str] = None
+
+
+class Result:
+    def __init__(self, status: int, etag: Optional[str], modified: Optional[str]):
+        self.status         = status
+        self.etag           = etag
+        self.modified       = modified
+        self.feed           = Channel()
+        self.entries        = []
+        self.bozo           = False
+        self.bozo_exception = None
+        # Whether the whole document was read, rather than stopping early,
+        # and if so the hash of it, as Feed._get() gives
+        self.complete       = False
+        self.hash           : Optional[str] = None
+
+
+def parse(url: str, known: Set[str], etag: Optional[str] = None,
+          modified: Optional[str] = None) -> Result:
+    """
+    Fetch and parse the RSS feed at url, stopping after `run` known items.
+    :param url: RSS feed url
+    :param known: Lowercased GUIDs the feed already has
+    :param etag: ETag of the previous fetch, for a conditional GET
+    :param modified: Last-Modified of the previous fetch, for a conditional GET
+    :return: Result holding only the items before the known run
+    """
+    if urlsplit(url).scheme not in ('http', 'https'):
+        raise Unsupported('Only http(s) feeds can be streamed')
+
+    try:
+        response = fetch.open(url, etag, modified)
+    except HTTPError as e:
+        raise Unsupported('HTTP error {}'.format(e.code)) from e
+
+    # Stopping early closes the connection rather than reading the rest
+    with response:
+        # HTTP 304 - Not Modified
+        if response.status == 304:
+            return Result(
+                304,
+                response.headers.get('etag', etag),
+                response.headers.get('last-modified', modified),
+            )
+        result = Result(
+            response.status,
+            response.headers.get('etag'),
+            response.headers.get('last-modified'),
+        )
+        stream = _Hashing(response)
+        try:
+            _read(stream, url, known, result)
+        except ElementTree.ParseError as e:
+            raise Unsupported('Malformed XML') from e
+        if result.complete:
+            # Anything after the closing tag, which the parser needn't read
+            stream.read()
+            result.hash = stream.hexdigest()
+    return result
+
+
+class _Hashing:
+    """
+    Hashes what's read from a stream, as it's read.
+    """
+    def __init__(self, stream):
+        self._stream = stream
+        self._sha1 = hashlib.sha1()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        self._sha1.update(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self._sha1.hexdigest()
+
+
+def _read(stream, url: str, known: Set[str], result: Result):
+    path = []
+    entry = None
+    seen = 0
+    previous = None
+    for event, elem in ElementTree.iterparse(stream, ('start', 'end')):
+        if event == 'start':
+            path.append(elem.tag)
+            if len(path) == 1 and elem.tag != 'rss':
+                raise Unsupported('Not an RSS 2.0 document')
+            if path[1:] == ['channel', 'item']:
+                entry = Entry()
+            continue
+
+        path.pop()
+        if entry is None:
+            if path == ['rss', 'channel'] and elem.tag in ('title', 'description'):
+                setattr(result.feed, elem.tag, _text(elem))
+            continue
+
+        if elem.tag == 'item':
+            published = entry.published_parsed
+            if published is not None:
+                if previous is not None and published > previous:
+                    raise Unsupported('Items are not in reverse-chronological order')
+                previous = published
+
+            guid = getattr(entry, 'id', None)
+            if guid is not None and guid.lower() in known:
+                seen += 1
+                if seen >= run:
+                    return
+            else:
+                seen = 0
+                result.entries.append(entry)
+            entry = None
+            elem.clear()
+        elif elem.tag == 'guid':
+            # Like feedparser, permalinks are resolved against the feed url
+            guid = _text(elem)
+            if elem.get('isPermaLink', 'true') == 'false' or not guid:
+                entry.id = guid
+            else:
+                entry.id = urljoin(url, guid)
+        elif elem.tag in ('title', 'description'):
+            setattr(entry, elem.tag, _text(elem))
+        elif elem.tag == 'pubDate':
+            entry.published_parsed = _date(elem.text)
+        elif elem.tag == 'enclosure' and 'url' in elem.attrib:
+            entry.enclosures.append(Enclosure(elem.attrib['url']))
+
+    result.complete = True
+
+
+def _text(elem: ElementTree.Element) -> str:
+    """Text of an element, stripped & empty rather than None, as feedparser gives."""
+    return (elem.text or '').strip()
+
+
+def _date(text: Optional[str]) -> Optional[struct_time]:
+    """RFC 822 date to a UTC struct_time, as feedparser gives."""
+    parsed = parsedate_tz(text or '')
+    if parsed is None:
+        return None
+    return gmtime(mktime_tz(parsed))
@@ -0,0 +1,336 @@
+"""
+HTTP fetching for feeds, over connections kept alive & pooled per host.
+
+Refreshing many feeds mostly means asking the same few hosts for a small,
+often unchanged, file each, so the connection (and TLS handshake) is the
+bulk of the cost of each request. Responses are asked for gzip/deflate
+compressed and decompressed as they're read, and permanent redirects are
+remembered, so later fetches go straight to where the feed has moved to.
+
+Responses can be read incrementally (see feedstream.py) or all at once; a
+connection is only put back in the pool once its response is read to the
+end, otherwise it's closed.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+import http.client
+import ssl
+from threading import Lock
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+from urllib.request import getproxies, proxy_bypass
+import zlib
+
+from typing import(
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+user_agent = 'blether'
+
+# Most redirects followed for one fetch
+max_redirects = 5
+
+# Redirects remembered, as permanent redirects are often only moved again
+# after a long time, if ever
+_redirects : OrderedDict = OrderedDict()
+_redirects_size = 1024
+_redirects_lock = Lock()
+
+_context : Optional[ssl.SSLContext] = None
+
+_Key = Tuple[str, str, int]
+
+
+class Pool:
+    """
+    Idle connections, kept per (scheme, host, port) for reuse.
+    """
+    def __init__(self, per_host: int = 4):
+        """
+        :param per_host: Most idle connections kept to any one host
+        """
+        self.per_host : int = per_host
+        self.opened   : int = 0
+        self.reused   : int = 0
+
+        self._idle : Dict[_Key, List[http.client.HTTPConnection]] = {}
+        self._lock : Lock = Lock()
+
+    def get(self, key: _Key, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        """
+        :return: An idle connection to the host if there is one, otherwise a
+                 new one, and whether it was reused
+        """
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self.reused += 1
+                c = idle.pop()
+                c.timeout = timeout
+                if c.sock is not None:
+                    c.sock.settimeout(timeout)
+                return c, True
+            self.opened += 1
+        return _connect(key, timeout), False
+
+    def put(self, key: _Key, c: http.client.HTTPConnection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.per_host:
+                idle.append(c)
+                return
+        c.close()
+
+    def clear(self):
+        """
+        Close every idle connection.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for c in connections:
+                c.close()
+
+
+pool = Pool()
+
+
+class Response:
+    """
+    A response, whose body is decompressed as it's read.
+    Use as a context manager, or call close(), to hand the connection back.
+    """
+    def __init__(self, url: str, key: _Key, connection: http.client.HTTPConnection,
+                 response: http.client.HTTPResponse, reused: bool):
+        self.url     : str = url
+        self.status  : int = response.status
+        # Lowercased names, as feedparser looks them up
+        self.headers : Dict[str, str] = {k.lower(): v for k, v in response.getheaders()}
+        self.reused  : bool = reused
+        # Bytes actually transferred, before decompression
+        self.received : int = 0
+
+        self._key        = key
+        self._connection = connection
+        self._response   = response
+        self._decoder    = _decoder(self.headers.get('content-encoding'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, n: int = -1) -> bytes:
+        """
+        Read up to n bytes of the (decompressed) body, or all the rest of
+        it if n is negative. Only returns nothing at the end of the body.
+        Compressed bodies are only decompressed n bytes at a time too, so a
+        reader stopping early (see feedstream.py) hasn't paid for the rest.
+        """
+        if n < 0:
+            data = self._response.read()
+            self.received += len(data)
+            if self._decoder is None:
+                return data
+            data = self._decoder.unconsumed_tail + data
+            return self._end(self._decoder.decompress(data))
+        while True:
+            if self._decoder is not None and self._decoder.unconsumed_tail:
+                out = self._decoder.decompress(self._decoder.unconsumed_tail, n)
+                if out:
+                    return out
+            data = self._response.read(n)
+            self.received += len(data)
+            if self._decoder is None:
+                return data
+            if not data:
+                return self._end(b'')
+            out = self._decoder.decompress(data, n)
+            if out:
+                return out
+
+    def _end(self, out: bytes) -> bytes:
+        # Done with, so any further reads just get the end of the response
+        out += self._decoder.flush()
+        self._decoder = None
+        return out
+
+    def close(self):
+        """
+        Put the connection back in the pool if the response was read to the
+        end & the server will keep it open, otherwise close it.
+        """
+        if self._connection is None:
+            return
+        # Nothing to read, as with a 304, still needs reading to the end
+        if self._response.length == 0:
+            self._response.read()
+        if self._response.isclosed() and not self._response.will_close:
+            pool.put(self._key, self._connection)
+        else:
+            self._connection.close()
+        self._connection = None
+
+
+
+def open(url: str, etag: Optional[str] = None, modified: Optional[str] = None,
+         timeout: float = 30) -> Response:
+    """
+    GET url, conditional on the etag/modified of a previous fetch, following
+    (& remembering permanent) redirects.
+    A 304 Not Modified is returned like any other response, but other error
+    statuses raise urllib's HTTPError, as urlopen() would.
+    :param timeout: Seconds to wait for the connection & each read
+    """
+    headers = {
+        'User-Agent'      : user_agent,
+        'Accept-Encoding' : 'gzip, deflate',
+    }
+    if etag:
+        headers['If-None-Match'] = etag
+    if modified:
+        headers['If-Modified-Since'] = modified
+
+    url = _redirected(url)
+    for _ in range(max_redirects + 1):
+        r = _request(url, headers, timeout)
+        if r.status not in (301, 302, 303, 307, 308) or 'location' not in r.headers:
+            break
+        location = urljoin(url, r.headers['location'])
+        # Drained, so the connection can be reused for the next request
+        r.read()
+        r.close()
+        if r.status in (301, 308):
+            _remember(url, location)
+        url = _redirected(location)
+    else:
+        raise HTTPError(url, r.status, 'Too many redirects', r.headers, None)
+
+    if r.status >= 400:
+        r.read()
+        r.close()
+        raise HTTPError(url, r.status, r._response.reason, r.headers, None)
+    return r
+
+
+def _request(url: str, headers: Dict[str, str], timeout: float) -> Response:
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in ('http', 'https'):
+        raise ValueError('Only http(s) urls can be fetched, not {}'.format(url))
+    key = (scheme, parts.hostname or '', parts.port or (443 if scheme == 'https' else 80))
+    target = parts.path or '/'
+    if parts.query:
+        target += '?' + parts.query
+    # Plain http through a proxy asks for the whole url
+    if scheme == 'http' and _proxy(key) is not None:
+        target = url
+
+    c, reused = pool.get(key, timeout)
+    try:
+        c.request('GET', target, headers=headers)
+        response = c.getresponse()
+    except (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionError):
+        c.close()
+        # The server may well have closed an idle connection, so a reused
+        # one gets a second chance, with a new connection
+        if not reused:
+            raise
+        c = _connect(key, timeout)
+        reused = False
+        c.request('GET', target, headers=headers)
+        response = c.getresponse()
+    except BaseException:
+        c.close()
+        raise
+    return Response(url, key, c, response, reused)
+
+
+def _connect(key: _Key, timeout: float) -> http.client.HTTPConnection:
+    global _context
+    scheme, host, port = key
+    proxy = _proxy(key)
+    if scheme == 'https':
+        if _context is None:
+            _context = ssl.create_default_context()
+        if proxy is not None:
+            c = http.client.HTTPSConnection(proxy[0], proxy[1], timeout=timeout, context=_context)
+            c.set_tunnel(host, port)
+            return c
+        return http.client.HTTPSConnection(host, port, timeout=timeout, context=_context)
+    if proxy is not None:
+        return http.client.HTTPConnection(proxy[0], proxy[1], timeout=timeout)
+    return http.client.HTTPConnection(host, port, timeout=timeout)
+
+
+def _proxy(key: _Key) -> Optional[Tuple[str, int]]:
+    """
+    :return: Host & port of the proxy to go through, as set in the
+             environment (http_proxy etc.), if any
+    """
+    scheme, host, _ = key
+    proxy = getproxies().get(scheme)
+    if not proxy or proxy_bypass(host):
+        return None
+    parts = urlsplit(proxy if '//' in proxy else '//' + proxy)
+    return parts.hostname, parts.port or 80
+
+
+def _decoder(encoding: Optional[str]):
+    encoding = (encoding or '').strip().lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return _Deflate()
+    return None
+
+
+class _Deflate:
+    """
+    Decompressor for 'deflate', which is either zlib wrapped or raw deflate
+    depending on the server.
+    """
+    def __init__(self):
+        # The extra 32 detects either a zlib or gzip header, failing if raw
+        self._d = zlib.decompressobj(32 + zlib.MAX_WBITS)
+        self._started = False
+
+    @property
+    def unconsumed_tail(self) -> bytes:
+        return self._d.unconsumed_tail
+
+    def decompress(self, data: bytes, max_length: int = 0) -> bytes:
+        if not self._started and data:
+            self._started = True
+            try:
+                return self._d.decompress(data, max_length)
+            except zlib.error:
+                self._d = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._d.decompress(data, max_length)
+
+    def flush(self) -> bytes:
+        return self._d.flush()
+
+
+def _redirected(url: str) -> str:
+    """
+    :return: Where url has permanently moved to, following any chain of moves
+    """
+    with _redirects_lock:
+        for _ in range(max_redirects):
+            if url not in _redirects:
+                break
+            url = _redirects[url]
+    return url
+
+
+def _remember(url: str, location: str):
+    with _redirects_lock:
+        _redirects[url] = location
+        _redirects.move_to_end(url)
+        while len(_redirects) > _redirects_size:
+            _redirects.popitem(last=False)
@@ -0,0 +1,353 @@
+"""
+Headless commands, for running blether from scripts & cron without a TTY.
+
+Each command writes its results to stdout as JSON, one object per line, and
+a one line JSON summary of the run to stderr. Exit codes:
+    0 - everything succeeded
+    1 - everything failed
+    2 - bad usage, e.g. an unknown feed id
+    3 - partial success, some feeds/urls failed
+
+Nothing here (or imported from here) loads urwid or vlc.
+"""
+import argparse
+import json
+import signal
+import sys
+from threading import Event
+from time import perf_counter
+from xml.etree.ElementTree import ParseError
+
+import db
+import metrics
+import opml
+from feed import Feed
+from episode import Episode
+from scheduler import Scheduler
+
+from typing import(
+    Iterable,
+    Optional,
+    TextIO,
+    Tuple,
+)
+
+OK      = 0
+FAILED  = 1
+USAGE   = 2
+PARTIAL = 3
+
+
+def run(args: argparse.Namespace) -> int:
+    """
+    Run the command chosen by the parsed args.
+    :return: Exit code
+    """
+    return commands[args.command](args)
+
+
+def refresh(args: argparse.Namespace) -> int:
+    start = perf_counter()
+    s = Scheduler(workers=args.jobs, per_host=args.per_host, stream=args.stream)
+    if args.due:
+        if args.feeds:
+            print('blether: feed ids cannot be given with --due', file=sys.stderr)
+            return USAGE
+        s.load()
+        results = s.run_once()
+    else:
+        feeds = _feeds(args.feeds)
+        if feeds is None:
+            return USAGE
+        results = Feed.update_many(feeds, workers=args.jobs, per_host=args.per_host, stream=args.stream)
+        # Keeps the schedule in step, for daemon or `refresh --due` runs
+        s.reschedule(results)
+
+    counts = dict.fromkeys((Feed.Result.UPDATED, Feed.Result.UNMODIFIED, Feed.Result.FAILED), 0)
+    for r in results:
+        counts[r.status] += 1
+        _write_result(r)
+
+    downloads = _download(results, args.download) if args.download else (0, 0)
+
+    _summary(
+        'refresh',
+        start,
+        feeds=len(results),
+        new=sum(r.new for r in results),
+        downloaded=downloads[0],
+        download_failed=downloads[1],
+        **counts,
+    )
+    failed = counts[Feed.Result.FAILED] + downloads[1]
+    return _code(failed, len(results) - counts[Feed.Result.FAILED] + downloads[0])
+
+
+def daemon(args: argparse.Namespace) -> int:
+    """
+    Keep refreshing feeds as they fall due, until interrupted.
+    """
+    start = perf_counter()
+    stop = Event()
+    updated = [0]
+
+    def on_update(results):
+        for r in results:
+            _write_result(r)
+        updated[0] += len(results)
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    s = Scheduler(on_update=on_update, workers=args.jobs, per_host=args.per_host, stream=args.stream)
+    s.start()
+    # Waited on in short steps, so signals are handled promptly
+    while not stop.wait(1):
+        pass
+    s.stop()
+    _summary('daemon', start, checks=updated[0])
+    return OK
+
+
+def add(args: argparse.Namespace) -> int:
+    start = perf_counter()
+    added = 0
+    for url in args.urls:
+        t = perf_counter()
+        try:
+            f = Feed.add(url)
+        except Exception as e:
+            _write({'url': url, 'status': 'failed', 'elapsed_ms': _ms(perf_counter() - t), 'error': _error(e)})
+            continue
+        added += 1
+        _write({
+            'url'        : url,
+            'status'     : 'added',
+            'feed'       : f.id,
+            'title'      : f.title,
+            'episodes'   : Episode.count(f),
+            'elapsed_ms' : _ms(perf_counter() - t),
+            'error'      : None,
+        })
+    _summary('add', start, urls=len(args.urls), added=added, failed=len(args.urls) - added)
+    return _code(len(args.urls) - added, added)
+
+
+def list_feeds(args: argparse.Namespace) -> int:
+    start = perf_counter()
+    feeds = Feed.getall(args.sort)
+    for f in feeds:
+        _write({
+            'id'          : f.id,
+            'url'         : f.url,
+            'title'       : f.title,
+            'updated'     : _timestamp(f.updated),
+            'episodes'    : f.stats.episodes,
+            'unplayed'    : f.stats.unplayed,
+            'latest'      : _timestamp(f.stats.latest),
+            'last_played' : _timestamp(f.stats.last_played),
+        })
+    _summary('list', start, feeds=len(feeds))
+    return OK
+
+
+def export(args: argparse.Namespace) -> int:
+    start = perf_counter()
+    f = None
+    if args.feed is not None:
+        feeds = _feeds((args.feed,))
+        if feeds is None:
+            return USAGE
+        f = feeds[0]
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        count = _export(Episode.iterate(f, descriptions=True), out, args.format == 'json')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    _summary('export', start, episodes=count, format=args.format)
+    return OK
+
+
+def import_opml(args: argparse.Namespace) -> int:
+    start = perf_counter()
+
+    def progress(done: int, total: int, r: Feed.Added):
+        _write({
+            'url'      : r.url,
+            'status'   : r.status,
+            'feed'     : None if r.feed is None else r.feed.id,
+            'title'    : None if r.feed is None else r.feed.title,
+            'episodes' : None if r.feed is None else r.episodes,
+            'done'     : done,
+            'total'    : total,
+            'error'    : _error(r.error),
+        })
+
+    try:
+        report = opml.import_feeds(args.file, progress=progress, workers=args.jobs, per_host=args.per_host)
+    except (OSError, ParseError) as e:
+        print('blether: cannot read {}: {}'.format(args.file, e), file=sys.stderr)
+        return USAGE
+    _summary(
+        'import-opml',
+        start,
+        urls=len(report.added) + len(report.duplicates) + len(report.failed),
+        added=len(report.added),
+        duplicates=len(report.duplicates),
+        failed=len(report.failed),
+    )
+    return _code(len(report.failed), len(report.added) + len(report.duplicates))
+
+
+def export_opml(args: argparse.Namespace) -> int:
+    start = perf_counter()
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        count = opml.export(out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    _summary('export-opml', start, feeds=count)
+    return OK
+
+
+def _export(episodes: Iterable[Episode], out: TextIO, array: bool) -> int:
+    """
+    Write episodes to out as they are read from the db, either as one JSON
+    array or as one JSON object per line.
+    :return: Number of episodes written
+    """
+    count = 0
+    if array:
+        out.write('[')
+    for e in episodes:
+        if array and count:
+            out.write(',')
+        out.write(json.dumps({
+            'id'          : e.id,
+            'feed'        : e._feed,
+            'guid'        : e.guid,
+            'url'         : e.url,
+            'title'       : e.title,
+            'description' : e.description,
+            'text'        : e.text,
+            'published'   : _timestamp(e.published),
+            'played'      : _timestamp(e.played),
+            'position'    : e.position,
+        }))
+        if not array:
+            out.write('\n')
+        count += 1
+    if array:
+        out.write(']\n')
+    return count
+
+
+def _write_result(r: Feed.Result):
+    _write({
+        'feed'     : r.feed.id,
+        'url'      : r.feed.url,
+        'title'    : r.feed.title,
+        'status'   : r.status,
+        'new'      : r.new,
+        'fetch_ms' : _ms(r.fetch_time),
+        'write_ms' : _ms(r.write_time),
+        'error'    : _error(r.error),
+    })
+
+
+def _download(results: Iterable[Feed.Result], n: int) -> Tuple[int, int]:
+    """
+    Download up to n of the newest episodes of each feed that has new ones,
+    waiting for them all to finish.
+    :return: Number of episodes downloaded, and number that failed
+    """
+    # Imported here so only runs that download create the cache
+    from cache import AudioCache
+    sql = 'SELECT id FROM episodes WHERE feedID=? ORDER BY published DESC LIMIT ?;'
+    downloads = []
+    for r in results:
+        if r.new:
+            for x in db.connection.execute(sql, (r.feed.id, min(r.new, n))).fetchall():
+                e = Episode(x['id'])
+                downloads.append((e, perf_counter(), AudioCache().download(e)))
+
+    downloaded = 0
+    for e, t, future in downloads:
+        try:
+            path = future.result()
+        except Exception as error:
+            _write({'episode': e.id, 'feed': e._feed, 'status': 'failed', 'error': _error(error)})
+            continue
+        downloaded += 1
+        _write({
+            'episode'    : e.id,
+            'feed'       : e._feed,
+            'status'     : 'downloaded',
+            'path'       : path,
+            'elapsed_ms' : _ms(perf_counter() - t),
+            'error'      : None,
+        })
+    return downloaded, len(downloads) - downloaded
+
+
+def _feeds(ids: Iterable[int]) -> Optional[Tuple[Feed, ...]]:
+    """
+    :return: The feeds with the given ids (all feeds if none are given),
+             or None if any don't exist
+    """
+    feeds = Feed.getall()
+    ids = tuple(ids)
+    if not ids:
+        return feeds
+    byid = {f.id: f for f in feeds}
+    missing = [i for i in ids if i not in byid]
+    if missing:
+        print('blether: no feed with id {}'.format(', '.join(map(str, missing))), file=sys.stderr)
+        return None
+    return tuple(byid[i] for i in ids)
+
+
+def _code(failed: int, succeeded: int) -> int:
+    if not failed:
+        return OK
+    return PARTIAL if succeeded else FAILED
+
+
+def _write(obj: dict):
+    print(json.dumps(obj), flush=True)
+
+
+def _summary(command: str, start: float, **kwargs):
+    summary = dict(command=command, **kwargs, elapsed_ms=_ms(perf_counter() - start))
+    if metrics.enabled:
+        sql = metrics.snapshot()['sql']
+        summary.update(sql_statements=sql['statements'], sql_ms=_ms(sql['ms'] / 1000))
+    print(json.dumps(summary), file=sys.stderr)
+
+
+def _ms(t: Optional[float]) -> Optional[float]:
+    return None if t is None else round(t * 1000, 2)
+
+
+def _timestamp(d) -> Optional[int]:
+    return None if d is None else int(d.timestamp())
+
+
+def _error(e: Optional[BaseException]) -> Optional[str]:
+    if e is None:
+        return None
+    return '{}: {}'.format(type(e).__name__, e)
+
+
+# Command names, as given on the command line, to the functions running them
+commands = {
+    'refresh'     : refresh,
+    'daemon'      : daemon,
+    'add'         : add,
+    'list'        : list_feeds,
+    'export'      : export,
+    'import-opml' : import_opml,
+    'export-opml' : export_opml,
+}
@@ -0,0 +1,175 @@
+"""
+Optional instrumentation of db queries & feed fetches.
+
+Disabled by default, when the only cost is checking `metrics.enabled` once
+per feed fetched: connections are plain sqlite3 ones, and nothing is timed.
+Once enabled (before connecting, or connections are reopened), every SQL
+statement is timed through the connection class given to sqlite3.connect(),
+and each feed fetch reports its phases (see Feed._fetch()).
+
+Totals are kept in memory for the UI to show, and every event can also be
+appended to a JSON lines file for offline analysis.
+"""
+from __future__ import annotations
+from collections import deque
+import json
+import sqlite3
+from threading import Lock
+from time import perf_counter, time
+
+from typing import(
+    Any,
+    Deque,
+    Dict,
+    Optional,
+    TextIO,
+)
+
+enabled = False
+
+_lock = Lock()
+_file : Optional[TextIO] = None
+
+# Per statement: [count, total seconds, slowest seconds]
+_sql : Dict[str, list] = {}
+_totals : Dict[str, float] = {}
+# Most recent fetch/apply events, newest last
+_recent : Deque[Dict[str, Any]] = deque(maxlen=50)
+
+
+def enable(path: Optional[str] = None):
+    """
+    Start collecting metrics, reopening db connections so they're timed.
+    :param path: JSON lines file to append every event to
+    """
+    global enabled, _file
+    import db
+    with _lock:
+        if _file is not None:
+            _file.close()
+        _file = open(path, 'a') if path else None
+        enabled = True
+    db.close()
+
+
+def disable():
+    global enabled, _file
+    import db
+    with _lock:
+        enabled = False
+        if _file is not None:
+            _file.close()
+            _file = None
+    db.close()
+
+
+def reset():
+    """
+    Forget everything collected so far.
+    """
+    with _lock:
+        _sql.clear()
+        _totals.clear()
+        _recent.clear()
+
+
+def record(event: str, **fields):
+    """
+    Record a fetch phase or the like, adding any numbers to the totals, and
+    counting each status seen.
+    """
+    with _lock:
+        _add('{}.count'.format(event), 1)
+        for k, v in fields.items():
+            if k == 'status':
+                _add('{}.status.{}'.format(event, v), 1)
+            elif k != 'feed' and isinstance(v, (int, float)):
+                _add('{}.{}'.format(event, k), v)
+        fields['event'] = event
+        _recent.append(fields)
+        _write(fields)
+
+
+def statement(sql: str, seconds: float, rows: int = 1):
+    """
+    Record the time taken to execute an SQL statement.
+    :param rows: Number of rows changed, for executemany()
+    """
+    with _lock:
+        s = _sql.get(sql)
+        if s is None:
+            s = _sql[sql] = [0, 0.0, 0.0]
+        s[0] += 1
+        s[1] += seconds
+        s[2] = max(s[2], seconds)
+        if _file is not None:
+            _write({'event': 'sql', 'sql': sql, 'ms': round(seconds * 1000, 3), 'rows': rows})
+
+
+def snapshot() -> Dict[str, Any]:
+    """
+    :return: Totals so far, the slowest statements & the most recent events
+    """
+    with _lock:
+        slowest = sorted(_sql.items(), key=lambda x: x[1][1], reverse=True)[:5]
+        return {
+            'sql': {
+                'statements' : sum(s[0] for s in _sql.values()),
+                'ms'         : sum(s[1] for s in _sql.values()) * 1000,
+                'slowest'    : [
+                    {'sql': sql, 'count': s[0], 'ms': s[1] * 1000, 'max_ms': s[2] * 1000}
+                    for sql, s in slowest
+                ],
+            },
+            'totals' : dict(_totals),
+            'recent' : list(_recent),
+        }
+
+
+def _add(key: str, v: float):
+    # Called with _lock held
+    _totals[key] = _totals.get(key, 0) + v
+
+
+def _write(fields: Dict[str, Any]):
+    # Called with _lock held
+    if _file is not None:
+        fields.setdefault('time', time())
+        _file.write(json.dumps(fields, default=str) + '\n')
+        _file.flush()
+
+
+class Cursor(sqlite3.Cursor):
+    """
+    Cursor timing each statement it executes.
+    Only the execution is timed, not fetching any further rows after the first.
+    """
+    def execute(self, sql, *args):
+        start = perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            statement(sql, perf_counter() - start)
+
+    def executemany(self, sql, seq):
+        start = perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            statement(sql, perf_counter() - start, self.rowcount)
+
+
+class Connection(sqlite3.Connection):
+    """
+    Connection whose cursors, including those of the execute() shorthands,
+    are all timed Cursors.
+    """
+    def cursor(self, factory=Cursor):
+        return super().cursor(factory)
+
+    # The built in shorthands don't go through cursor(), so are redone here
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
@@ -0,0 +1,99 @@
+"""
+OPML import & export of subscriptions, the format podcast apps exchange
+their feed lists in.
+"""
+from __future__ import annotations
+from datetime import datetime
+from email.utils import format_datetime
+from xml.etree.ElementTree import iterparse
+from xml.sax.saxutils import escape, quoteattr
+
+import db
+from feed import Feed
+
+from typing import(
+    BinaryIO,
+    Callable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    TextIO,
+    Tuple,
+    Union,
+)
+
+
+class Report(NamedTuple):
+    """
+    Outcome of import_feeds()
+    """
+    added      : Tuple[Feed, ...]
+    duplicates : Tuple[str, ...]
+    failed     : Tuple[Tuple[str, BaseException], ...]
+
+
+def read(source: Union[str, BinaryIO]) -> Iterator[Tuple[str, Optional[str]]]:
+    """
+    Read the feeds listed in an OPML file, however they're nested into
+    categories, without holding the whole document in memory.
+    :param source: Path to, or file object of, the OPML file
+    :return: (url, title) of each feed, in the order they're listed
+    """
+    for _, element in iterparse(source, events=('end',)):
+        if element.tag != 'outline':
+            continue
+        url = element.get('xmlUrl')
+        if url:
+            yield url, element.get('title') or element.get('text')
+        # Children have already been seen, so aren't needed any more
+        element.clear()
+
+
+def import_feeds(source: Union[str, BinaryIO], progress: Optional[Callable] = None, **kwargs) -> Report:
+    """
+    Add every feed listed in an OPML file that isn't already in the db.
+    :param progress: See Feed.add_many()
+    :param kwargs: Passed on to Feed.add_many(), e.g. workers & per_host
+    """
+    urls = [url for url, _ in read(source)]
+    added : List[Feed] = []
+    duplicates : List[str] = []
+    failed : List[Tuple[str, BaseException]] = []
+    for r in Feed.add_many(urls, progress=progress, **kwargs):
+        if r.status == Feed.Added.ADDED:
+            added.append(r.feed)
+        elif r.status == Feed.Added.DUPLICATE:
+            duplicates.append(r.url)
+        else:
+            failed.append((r.url, r.error))
+    return Report(tuple(added), tuple(duplicates), tuple(failed))
+
+
+def export(out: TextIO, title: str = 'blether subscriptions') -> int:
+    """
+    Write every feed in the db out as OPML, streamed from the db a row at a
+    time rather than building the document in memory.
+    :return: Number of feeds written
+    """
+    out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    out.write('<opml version="2.0">\n')
+    out.write('  <head>\n')
+    out.write('    <title>{}</title>\n'.format(escape(title)))
+    out.write('    <dateCreated>{}</dateCreated>\n'.format(format_datetime(datetime.now().astimezone())))
+    out.write('  </head>\n')
+    out.write('  <body>\n')
+    count = 0
+    sql = 'SELECT url, title, description FROM feeds ORDER BY title COLLATE NOCASE;'
+    for x in db.connection.execute(sql):
+        text = quoteattr(x['title'] or x['url'])
+        out.write('    <outline type="rss" text={} title={} xmlUrl={}{} />\n'.format(
+            text,
+            text,
+            quoteattr(x['url']),
+            '' if x['description'] is None else ' description={}'.format(quoteattr(x['description'])),
+        ))
+        count += 1
+    out.write('  </body>\n')
+    out.write('</opml>\n')
+    return count
@@ -0,0 +1,66 @@
+"""
+Plain text rendering of the (more or less) HTML in feed descriptions, done
+once as episodes are added rather than every time one is shown.
+"""
+from html.parser import HTMLParser
+import re
+
+from typing import(
+    List,
+    Optional,
+)
+
+# Tags starting a new line, & those starting a new paragraph
+_line_tags = {'br', 'li', 'tr', 'div', 'dt', 'dd'}
+_paragraph_tags = {'p', 'ul', 'ol', 'dl', 'table', 'blockquote', 'pre', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+# Tags whose content isn't text at all
+_skip_tags = {'script', 'style', 'head', 'title'}
+
+_spaces = re.compile(r'[ \t\r\f\v\n]+')
+_blank_lines = re.compile(r'\n{3,}')
+
+
+class _Renderer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts : List[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _skip_tags:
+            self._skip += 1
+        elif tag in _paragraph_tags:
+            self.parts.append('\n\n')
+        elif tag in _line_tags:
+            self.parts.append('\n')
+            if tag == 'li':
+                self.parts.append('- ')
+
+    def handle_endtag(self, tag):
+        if tag in _skip_tags:
+            self._skip = max(0, self._skip - 1)
+        elif tag in _paragraph_tags:
+            self.parts.append('\n\n')
+
+    def handle_data(self, data):
+        if not self._skip:
+            # Whitespace in HTML is collapsed, line breaks only come from tags
+            self.parts.append(_spaces.sub(' ', data))
+
+
+def render(html: Optional[str]) -> Optional[str]:
+    """
+    Render HTML as plain text: tags dropped, entities decoded, whitespace
+    collapsed, and block level tags turned into line breaks.
+    """
+    if html is None:
+        return None
+    if '<' not in html and '&' not in html:
+        # Plain text already, which is common enough to skip the parser for
+        return _spaces.sub(' ', html).strip()
+    r = _Renderer()
+    r.feed(html)
+    r.close()
+    text = ''.join(r.parts)
+    text = '\n'.join(line.strip() for line in text.split('\n'))
+    return _blank_lines.sub('\n\n', text).strip()
@@ -2,33 +2,165 @@ import vlc
 
 from singleton import Singleton
 from episode import Episode
+from cache import AudioCache
+from playqueue import PlayQueue
+from writebuffer import WriteBuffer
 
 
 class Player(metaclass=Singleton):
+    # How many upcoming episodes of a playlist to download in the background
+    prefetch = 3
+
     def __init__(self, loop):
         self.instance = vlc.Instance()
         self.player = self.instance.media_player_new()
-        self.events = self.player.event_manager()
+        self.list_player = self.instance.media_list_player_new()
+        self.list_player.set_media_player(self.player)
+        self.media_list = self.instance.media_list_new()
+        self.list_player.set_media_list(self.media_list)
         self.event_loop = loop
+        self.queue = PlayQueue()
+
+        # The next episode is kept in the media list behind the current one,
+        # so vlc has it loaded & ready to go when the current one ends
+        self._preloaded = None
+        self._preloaded_mrl = None
+
+        # Subscribed once, for the life of the player
+        self.events = self.list_player.event_manager()
+        self.events.event_attach(vlc.EventType.MediaListPlayerNextItemSet, self._vlc_cb(self._next_item))
+        self.events.event_attach(vlc.EventType.MediaListPlayerPlayed, self._vlc_cb(self._finished))
+
+        # Resume positions go through the write buffer, so needn't be deferred
+        # to the main loop, and are flushed whenever playback pauses or stops
+        self._current = None
+        player_events = self.player.event_manager()
+        player_events.event_attach(vlc.EventType.MediaPlayerTimeChanged, self._time_changed_cb)
+        player_events.event_attach(vlc.EventType.MediaPlayerPaused, lambda _: WriteBuffer().flush())
+        player_events.event_attach(vlc.EventType.MediaPlayerStopped, lambda _: WriteBuffer().flush())
 
     def play(self, playlist):
+        """
+        Replace the queue with an episode or playlist, and start playing it.
+        """
         if type(playlist) is Episode:
-            media = self.instance.media_new(playlist.url)
-            self.player.set_media(media)
-            self.player.play()
-        else: # Assume iterable representing playlist
-            def end_reached_cb(event):
-                # vlc callbacks aren't 'reentrant' so we have to
-                # inject the real callback into the main loop
-                def defer_cb():
-                    # Tag the episode as played at current time(stamp), for future sorting etc.
-                    playlist[0].setplayed()
-
-                    Player().play(playlist[1:])
-
-                self.event_loop.alarm(0, defer_cb)
-
-            self.events.event_attach(vlc.EventType.MediaPlayerEndReached, end_reached_cb)
-            media = self.instance.media_new(playlist[0].url)
-            self.player.set_media(media)
-            self.player.play()
+            playlist = (playlist,)
+        self.queue.replace(playlist)
+        self._start()
+
+    def resume(self):
+        """
+        Start playing the queue as it was left, e.g. by a previous session.
+        """
+        if self.queue.current is not None:
+            self._start()
+
+    def pause(self):
+        """
+        Toggle pausing playback.
+        """
+        self.list_player.pause()
+
+    def stop(self):
+        self.list_player.stop()
+
+    def enqueue(self, e: Episode):
+        """
+        Add an episode to the end of the queue.
+        """
+        self.queue.enqueue(e)
+        if self.queue.peek() is e:
+            self._preload()
+
+    def skip(self):
+        """
+        Move on to the next episode, without marking the current one played.
+        """
+        self.queue.advance()
+        if self.queue.current is None:
+            self.list_player.stop()
+        else:
+            self._start()
+
+    def remove(self, index: int):
+        """
+        Remove an upcoming episode from the queue, 1 being the next one.
+        """
+        if index < 1:
+            raise IndexError('Use skip() to remove the current episode')
+        e = self.queue.remove(index)
+        if e is self._preloaded:
+            self.media_list.remove_index(self.media_list.count() - 1)
+            self._preloaded = None
+            self._preloaded_mrl = None
+            self._preload()
+
+    def _start(self):
+        """
+        Play the current episode of the queue from a fresh media list.
+        """
+        self.list_player.stop()
+        self.media_list = self.instance.media_list_new()
+        self.list_player.set_media_list(self.media_list)
+        self._preloaded = None
+        self._preloaded_mrl = None
+        self.media_list.add_media(self._media(self.queue.current))
+        self._current = self.queue.current
+        self._preload()
+        self.list_player.play_item_at_index(0)
+        AudioCache().prefetch(self.queue.upcoming(self.prefetch))
+
+    def _preload(self):
+        e = self.queue.peek()
+        if e is None or e is self._preloaded:
+            return
+        media = self._media(e)
+        self.media_list.add_media(media)
+        self._preloaded = e
+        self._preloaded_mrl = media.get_mrl()
+
+    def _vlc_cb(self, cb):
+        # vlc callbacks aren't 'reentrant' so we have to
+        # inject the real callback into the main loop
+        return lambda event: self.event_loop.alarm(0, cb)
+
+    def _next_item(self):
+        # Also fired for the first item, so check vlc has really moved on
+        media = self.player.get_media()
+        if self._preloaded is None or media is None or media.get_mrl() != self._preloaded_mrl:
+            return
+        # Tag the episode as played at current time(stamp), for future sorting etc.
+        self.queue.current.setplayed()
+        self.queue.advance()
+        self._current = self.queue.current
+        self._preload()
+        AudioCache().prefetch(self.queue.upcoming(self.prefetch))
+
+    def _finished(self):
+        if self.queue.current is not None:
+            self.queue.current.setplayed()
+            self.queue.advance()
+        self._current = None
+        WriteBuffer().flush()
+
+    def _time_changed_cb(self, event):
+        # Called from vlc's thread, but the write buffer is thread-safe. Also
+        # kept on the episode itself, so playing it again resumes from here
+        # rather than wherever it was when first loaded
+        e = self._current
+        if e is not None:
+            e.setposition(event.u.new_time)
+
+    def _media(self, e: Episode):
+        """
+        Media for an episode, played from the local cache when it's been
+        downloaded and streamed from its url otherwise.
+        """
+        path = AudioCache().path(e)
+        if path is not None:
+            media = self.instance.media_new_path(path)
+        else:
+            media = self.instance.media_new(e.url)
+        if e.position:
+            media.add_option('start-time={:.3f}'.format(e.position / 1000))
+        return media
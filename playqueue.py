@@ -0,0 +1,106 @@
+from __future__ import annotations
+from collections import deque
+from itertools import islice
+
+import db
+from episode import Episode
+
+from typing import(
+    Deque,
+    Iterable,
+    Optional,
+    Tuple,
+)
+
+
+class PlayQueue:
+    """
+    Queue of episodes to play, the first being the one currently playing.
+    Advancing and enqueueing are O(1). Changes are saved to the db in the
+    background, so a restart can pick up where the last session left off.
+    """
+    def __init__(self):
+        # (position in the db, episode)
+        self._items : Deque[Tuple[int, Episode]] = deque()
+
+        # Aliased, as episodes has a position (played up to) column of its own
+        sql = '''
+            SELECT queue.position AS queued, episodes.* FROM queue
+            JOIN episodes ON episodes.id = queue.episodeID
+            ORDER BY queue.position ASC;
+        '''
+        for row in db.connection.execute(sql):
+            self._items.append((row['queued'], Episode(row['id'], row)))
+        self._last = self._items[-1][0] if self._items else 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return (e for _, e in self._items)
+
+    @property
+    def current(self) -> Optional[Episode]:
+        return self._items[0][1] if self._items else None
+
+    def peek(self) -> Optional[Episode]:
+        """
+        :return: The episode after the current one, if any
+        """
+        return self._items[1][1] if len(self._items) > 1 else None
+
+    def upcoming(self, n: Optional[int] = None) -> Tuple[Episode, ...]:
+        """
+        :return: The next n episodes after the current one (or all of them)
+        """
+        return tuple(e for _, e in islice(self._items, 1, None if n is None else n + 1))
+
+    def replace(self, episodes: Iterable[Episode]):
+        """
+        Replace the whole queue, the first of the episodes becoming current.
+        """
+        self._items.clear()
+        for e in episodes:
+            self._last += 1
+            self._items.append((self._last, e))
+        values = tuple((p, e.id) for p, e in self._items)
+
+        def write():
+            db.connection.execute('DELETE FROM queue;')
+            db.connection.executemany('INSERT INTO queue(position, episodeID) VALUES(?,?);', values)
+        db.write(write)
+
+    def enqueue(self, e: Episode):
+        """
+        Add an episode to the end of the queue.
+        """
+        self._last += 1
+        self._items.append((self._last, e))
+        sql = 'INSERT INTO queue(position, episodeID) VALUES(?,?);'
+        values = (self._last, e.id)
+        db.write(lambda: db.connection.execute(sql, values))
+
+    def advance(self) -> Optional[Episode]:
+        """
+        Drop the current episode, moving on to the next.
+        :return: The new current episode, if any
+        """
+        if self._items:
+            p, _ = self._items.popleft()
+            self._delete(p)
+        return self.current
+
+    def remove(self, index: int) -> Episode:
+        """
+        Remove an episode from the queue, 0 being the current one.
+        :return: The removed episode
+        """
+        p, e = self._items[index]
+        del self._items[index]
+        self._delete(p)
+        return e
+
+    @staticmethod
+    def _delete(position: int):
+        sql = 'DELETE FROM queue WHERE position=?;'
+        db.write(lambda: db.connection.execute(sql, (position,)))
@@ -0,0 +1,244 @@
+"""
+Adaptive refresh scheduling.
+
+Rather than polling every feed on a fixed interval, each feed's next check is
+worked out from the gaps between its episodes: it isn't checked at all until
+shortly before a new episode could plausibly be out, then is checked more &
+more often (up to `patience` apart) until one shows up. Feeds that have been
+quiet far longer than usual, keep answering 304, or keep failing are backed
+off, up to `max_interval` apart.
+
+The time of each feed's next check is stored in feeds.next_check, so the
+schedule carries over between runs.
+"""
+from __future__ import annotations
+import heapq
+from threading import Event, Lock, Thread
+from time import time
+
+import db
+from feed import Feed
+
+from typing import(
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+# Shortest & longest time between checks of a feed, in seconds
+min_interval = 15 * 60
+max_interval = 7 * 24 * 60 * 60
+# Longest time between checks of a feed that's due a new episode, which is
+# also how often feeds without enough history to go on are checked
+patience = 60 * 60
+# How long to wait before retrying a failed feed, doubled for each failure in a row
+retry = 5 * 60
+# Number of most recent episodes the cadence of a feed is learned from
+history = 20
+# Checking for a new episode starts this much of the spread of a feed's recent
+# gaps between episodes before its shortest gap is up, so regular feeds are
+# left alone for most of their gap; erratic ones, whose spread can dwarf it,
+# are still left alone for this much less than their shortest gap
+early = 0.5
+# Only feeds left alone for this many times patience first have their checks
+# start at min_interval and ramp up, as otherwise the ramp costs more checks
+# than waiting saved; the rest are checked every patience once due, so never
+# more often than on a fixed interval of it
+ramp_after = 4
+# A feed quiet for this many times its longest recent gap is considered
+# dormant, and checked at a tenth of the time it has been quiet for
+dormant = 3
+
+
+def next_check(now: float, published: Sequence[int], failures: int = 0, unchanged: int = 0) -> int:
+    """
+    Work out when a feed should next be checked.
+    :param now: Timestamp of the check just made
+    :param published: Timestamps of the feed's most recent episodes, oldest first
+    :param failures: Number of checks in a row that have failed
+    :param unchanged: Number of checks in a row that found no new episodes
+    :return: Timestamp to next check the feed at
+    """
+    if failures:
+        return int(now + min(retry * 2 ** (failures - 1), max_interval))
+
+    gaps = sorted(b - a for a, b in zip(published, published[1:]) if b > a)
+    if not gaps:
+        return int(now + patience)
+    last = published[-1]
+
+    # Nothing new is likely until (nearly) the shortest gap has passed
+    wait = max(gaps[0] - early * (gaps[-1] - gaps[0]), (1 - early) * gaps[0])
+    start = last + wait
+    ramp = wait >= ramp_after * patience
+    if now + (min_interval if ramp else patience) < start:
+        return int(min(start, now + max_interval))
+
+    # Due, so check often at first, backing off until patience is reached
+    interval = min(min_interval * 2 ** unchanged, patience) if ramp else patience
+    quiet = now - last
+    if quiet > dormant * gaps[-1]:
+        interval = max(interval, quiet / 10)
+    return int(now + _clamp(interval, min_interval, max_interval))
+
+
+def counters(r: Feed.Result, failures: int, unchanged: int) -> Tuple[int, int]:
+    """
+    Update a feed's counts of failed & unchanged checks in a row with the
+    result of another check.
+    :return: The new failures & unchanged counts
+    """
+    if r.status == Feed.Result.FAILED:
+        return failures + 1, unchanged
+    if r.new:
+        return 0, 0
+    return 0, unchanged + 1
+
+
+def _clamp(v: float, lower: float, upper: float) -> float:
+    return max(lower, min(v, upper))
+
+
+class Scheduler:
+    """
+    Background thread updating feeds as they fall due, see next_check().
+    Due feeds are taken from a priority queue ordered by next check, so only
+    the soonest needs looking at to know how long to sleep for.
+    """
+    def __init__(self, on_update: Optional[Callable[[Tuple[Feed.Result, ...]], None]] = None,
+                 workers: int = 8, per_host: int = 2, stream: bool = True, rescan: float = 300):
+        """
+        :param on_update: Called (on the scheduler thread) with the results of
+                          each round of updates
+        :param workers: Maximum number of feeds fetched at once, see Feed.update_many()
+        :param per_host: Maximum number of feeds fetched at once from any one host
+        :param stream: Parse feeds incrementally, see Feed.update()
+        :param rescan: Seconds between checks of the db for newly added feeds
+        """
+        self.on_update = on_update
+        self.workers   = workers
+        self.per_host  = per_host
+        self.stream    = stream
+        self.rescan    = rescan
+
+        self._queue  : List[Tuple[int, int]] = []
+        self._next   : Dict[int, int] = {}
+        self._lock   : Lock = Lock()
+        self._wake   : Event = Event()
+        self._stop   : Event = Event()
+        self._thread : Optional[Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name='scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, wait: bool = True):
+        """
+        Stop the scheduler thread. Any round of updates in progress stops
+        fetching, only waiting on those already started, and the feeds it
+        didn't get to are left due, see Feed.update_many().
+        :param wait: Block until the thread has stopped
+        """
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        if wait:
+            thread.join()
+
+    def schedule(self, f: Feed, when: Optional[float] = None):
+        """
+        (Re)schedule a feed, e.g. one just added.
+        :param when: Timestamp to check the feed at, now if not given
+        """
+        when = int(time() if when is None else when)
+        self._push(f.id, when)
+        sql = 'UPDATE feeds SET next_check=? WHERE id=?;'
+        db.write(lambda: db.connection.execute(sql, (when, f.id)))
+        self._wake.set()
+
+    def due(self, now: Optional[float] = None) -> Tuple[Feed, ...]:
+        """
+        Take every feed due a check off the queue.
+        """
+        now = time() if now is None else now
+        ids = []
+        with self._lock:
+            while self._queue and self._queue[0][0] <= now:
+                when, id = heapq.heappop(self._queue)
+                # Entries superseded by a later schedule() are skipped
+                if self._next.get(id) == when:
+                    del self._next[id]
+                    ids.append(id)
+        return tuple(Feed(id) for id in ids)
+
+    def run_once(self, now: Optional[float] = None) -> Tuple[Feed.Result, ...]:
+        """
+        Update every feed that's due, and reschedule them.
+        """
+        now = time() if now is None else now
+        feeds = self.due(now)
+        if not feeds:
+            return ()
+        results = Feed.update_many(feeds, workers=self.workers, per_host=self.per_host, stream=self.stream,
+                                   stop=self._stop)
+        self.reschedule(results, now)
+        if self.on_update is not None:
+            self.on_update(results)
+        return results
+
+    def load(self):
+        """
+        Queue any feeds in the db that aren't queued yet, at their stored
+        next check (or now, for ones never checked).
+        """
+        now = int(time())
+        rows = db.connection.execute('SELECT id, next_check FROM feeds;').fetchall()
+        for x in rows:
+            if x['id'] not in self._next:
+                self._push(x['id'], now if x['next_check'] is None else x['next_check'])
+
+    def _push(self, id: int, when: int):
+        with self._lock:
+            self._next[id] = when
+            heapq.heappush(self._queue, (when, id))
+
+    def reschedule(self, results: Sequence[Feed.Result], now: Optional[float] = None):
+        """
+        Work out the next check of each feed from the results of updating it,
+        storing them in the db and queueing the feeds again.
+        """
+        now = time() if now is None else now
+        sql = 'SELECT failures, unchanged FROM feeds WHERE id=?;'
+        published_sql = 'SELECT published FROM episodes WHERE feedID=? ORDER BY published DESC LIMIT ?;'
+        updates = []
+        for r in results:
+            row = db.connection.execute(sql, (r.feed.id,)).fetchone()
+            failures, unchanged = counters(r, row['failures'], row['unchanged'])
+            published = [x[0] for x in db.connection.execute(published_sql, (r.feed.id, history))]
+            when = next_check(now, published[::-1], failures, unchanged)
+            updates.append((when, failures, unchanged, r.feed.id))
+        sql = 'UPDATE feeds SET next_check=?, failures=?, unchanged=? WHERE id=?;'
+        db.write(lambda: db.connection.executemany(sql, updates)).result()
+        for when, _, _, id in updates:
+            self._push(id, when)
+
+    def _run(self):
+        self.load()
+        scanned = time()
+        while not self._stop.is_set():
+            self.run_once()
+            if time() - scanned >= self.rescan:
+                self.load()
+                scanned = time()
+            with self._lock:
+                soonest = self._queue[0][0] if self._queue else time() + self.rescan
+            self._wake.wait(max(0, min(soonest, scanned + self.rescan) - time()))
+            self._wake.clear()
@@ -0,0 +1,29 @@
+CREATE VIRTUAL TABLE IF NOT EXISTS episodes_fts USING fts5(
+    title,
+    description,
+    content='episodes',
+    content_rowid='id',
+    prefix='2 3'
+);
+
+
+CREATE TRIGGER IF NOT EXISTS episodes__fts_insert AFTER INSERT ON episodes BEGIN
+    INSERT INTO episodes_fts(rowid, title, description)
+    VALUES (new.id, new.title, new.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS episodes__fts_delete AFTER DELETE ON episodes BEGIN
+    INSERT INTO episodes_fts(episodes_fts, rowid, title, description)
+    VALUES ('delete', old.id, old.title, old.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS episodes__fts_update AFTER UPDATE OF title, description ON episodes BEGIN
+    INSERT INTO episodes_fts(episodes_fts, rowid, title, description)
+    VALUES ('delete', old.id, old.title, old.description);
+    INSERT INTO episodes_fts(rowid, title, description)
+    VALUES (new.id, new.title, new.description);
+END;
+
+
+-- Title matches count for more than description matches
+INSERT INTO episodes_fts(episodes_fts, rank) VALUES('rank', 'bm25(10.0, 1.0)');
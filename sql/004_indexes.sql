@@ -0,0 +1,12 @@
+-- Episode.getbyfeed(): WHERE feedID=? ORDER BY published, without a sort step
+CREATE INDEX IF NOT EXISTS episodes__feed_published_index ON episodes (feedID, published);
+
+-- Superseded by the above, which covers lookups by feedID alone
+DROP INDEX IF EXISTS episodes__feed_index;
+
+-- Episode.addmany() & Feed._guids(): SELECT guid WHERE feedID=?, from the index alone
+CREATE INDEX IF NOT EXISTS episodes__feed_guid_index ON episodes (feedID, guid COLLATE NOCASE);
+
+-- Unplayed episodes of a feed, in published order
+CREATE INDEX IF NOT EXISTS episodes__unplayed_index ON episodes (feedID, published)
+    WHERE played IS NULL;
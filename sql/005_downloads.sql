@@ -0,0 +1,12 @@
+CREATE TABLE IF NOT EXISTS downloads(
+    episodeID   INTEGER PRIMARY KEY,
+    path        TEXT    NOT NULL,
+    size        INTEGER NOT NULL,
+    accessed    INTEGER NOT NULL,
+    FOREIGN KEY (episodeID) REFERENCES episodes(id)
+        ON DELETE CASCADE
+        ON UPDATE CASCADE
+);
+
+
+CREATE INDEX IF NOT EXISTS downloads__accessed_index ON downloads (accessed);
@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS queue(
+    position    INTEGER PRIMARY KEY,
+    episodeID   INTEGER NOT NULL,
+    FOREIGN KEY (episodeID) REFERENCES episodes(id)
+        ON DELETE CASCADE
+        ON UPDATE CASCADE
+);
@@ -0,0 +1 @@
+ALTER TABLE episodes ADD COLUMN position INTEGER;
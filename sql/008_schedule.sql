@@ -0,0 +1,5 @@
+ALTER TABLE feeds ADD COLUMN next_check INTEGER;
+ALTER TABLE feeds ADD COLUMN failures INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE feeds ADD COLUMN unchanged INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS feeds__next_check_index ON feeds (next_check);
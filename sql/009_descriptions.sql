@@ -0,0 +1,62 @@
+CREATE TABLE IF NOT EXISTS descriptions(
+    episodeID   INTEGER PRIMARY KEY,
+    html        BLOB,
+    text        TEXT,
+    FOREIGN KEY (episodeID) REFERENCES episodes(id)
+        ON DELETE CASCADE
+        ON UPDATE CASCADE
+);
+
+
+-- The search index moves from the raw HTML to the plain text descriptions
+DROP TRIGGER IF EXISTS episodes__fts_insert;
+DROP TRIGGER IF EXISTS episodes__fts_delete;
+DROP TRIGGER IF EXISTS episodes__fts_update;
+DROP TABLE IF EXISTS episodes_fts;
+
+CREATE VIEW IF NOT EXISTS episodes_text AS
+    SELECT episodes.id AS id, episodes.title AS title, descriptions.text AS description
+    FROM episodes LEFT JOIN descriptions ON descriptions.episodeID = episodes.id;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS episodes_fts USING fts5(
+    title,
+    description,
+    content='episodes_text',
+    content_rowid='id',
+    prefix='2 3'
+);
+
+
+-- Every episode has a descriptions row, even if empty, added along with it
+CREATE TRIGGER IF NOT EXISTS descriptions__fts_insert AFTER INSERT ON descriptions BEGIN
+    INSERT INTO episodes_fts(rowid, title, description)
+    SELECT id, title, new.text FROM episodes WHERE id = new.episodeID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS descriptions__fts_delete AFTER DELETE ON descriptions BEGIN
+    INSERT INTO episodes_fts(episodes_fts, rowid, title, description)
+    SELECT 'delete', id, title, old.text FROM episodes WHERE id = old.episodeID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS descriptions__fts_update AFTER UPDATE OF text ON descriptions BEGIN
+    INSERT INTO episodes_fts(episodes_fts, rowid, title, description)
+    SELECT 'delete', id, title, old.text FROM episodes WHERE id = old.episodeID;
+    INSERT INTO episodes_fts(rowid, title, description)
+    SELECT id, title, new.text FROM episodes WHERE id = new.episodeID;
+END;
+
+-- Removed before the episode, so the index entry can still be found by title
+CREATE TRIGGER IF NOT EXISTS episodes__descriptions_delete BEFORE DELETE ON episodes BEGIN
+    DELETE FROM descriptions WHERE episodeID = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS episodes__fts_update AFTER UPDATE OF title ON episodes BEGIN
+    INSERT INTO episodes_fts(episodes_fts, rowid, title, description)
+    SELECT 'delete', old.id, old.title, text FROM descriptions WHERE episodeID = old.id;
+    INSERT INTO episodes_fts(rowid, title, description)
+    SELECT new.id, new.title, text FROM descriptions WHERE episodeID = new.id;
+END;
+
+
+-- Title matches count for more than description matches
+INSERT INTO episodes_fts(episodes_fts, rank) VALUES('rank', 'bm25(10.0, 1.0)');
@@ -0,0 +1,72 @@
+-- Per feed aggregates of its episodes, kept up to date by the triggers below,
+-- so listing & sorting feeds never has to scan the episodes table
+CREATE TABLE IF NOT EXISTS feed_stats(
+    feedID      INTEGER PRIMARY KEY,
+    episodes    INTEGER NOT NULL DEFAULT 0,
+    unplayed    INTEGER NOT NULL DEFAULT 0,
+    latest      INTEGER,
+    last_played INTEGER,
+    FOREIGN KEY (feedID) REFERENCES feeds(id)
+        ON DELETE CASCADE
+        ON UPDATE CASCADE
+);
+
+INSERT OR REPLACE INTO feed_stats(feedID, episodes, unplayed, latest, last_played)
+    SELECT feeds.id, COUNT(episodes.id), COUNT(episodes.id) - COUNT(episodes.played),
+           MAX(episodes.published), MAX(episodes.played)
+    FROM feeds LEFT JOIN episodes ON episodes.feedID = feeds.id
+    GROUP BY feeds.id;
+
+
+CREATE TRIGGER IF NOT EXISTS feeds__stats_insert AFTER INSERT ON feeds BEGIN
+    INSERT INTO feed_stats(feedID) VALUES (new.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS feeds__stats_delete AFTER DELETE ON feeds BEGIN
+    DELETE FROM feed_stats WHERE feedID = old.id;
+END;
+
+-- MAX(COALESCE(a, b), COALESCE(b, a)) is the larger of a & b, ignoring NULLs
+CREATE TRIGGER IF NOT EXISTS episodes__stats_insert AFTER INSERT ON episodes BEGIN
+    UPDATE feed_stats SET
+        episodes    = episodes + 1,
+        unplayed    = unplayed + (new.played IS NULL),
+        latest      = MAX(COALESCE(latest, new.published), COALESCE(new.published, latest)),
+        last_played = MAX(COALESCE(last_played, new.played), COALESCE(new.played, last_played))
+    WHERE feedID = new.feedID;
+END;
+
+-- The maximums only need finding again if the episode held one of them
+CREATE TRIGGER IF NOT EXISTS episodes__stats_delete AFTER DELETE ON episodes BEGIN
+    UPDATE feed_stats SET
+        episodes    = episodes - 1,
+        unplayed    = unplayed - (old.played IS NULL),
+        latest      = CASE WHEN old.published >= latest
+                          THEN (SELECT MAX(published) FROM episodes WHERE feedID = old.feedID)
+                          ELSE latest END,
+        last_played = CASE WHEN old.played >= last_played
+                          THEN (SELECT MAX(played) FROM episodes WHERE feedID = old.feedID)
+                          ELSE last_played END
+    WHERE feedID = old.feedID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS episodes__stats_played AFTER UPDATE OF played ON episodes BEGIN
+    UPDATE feed_stats SET
+        unplayed    = unplayed + (new.played IS NULL) - (old.played IS NULL),
+        last_played = CASE WHEN old.played >= last_played AND (new.played IS NULL OR new.played < old.played)
+                          THEN (SELECT MAX(played) FROM episodes WHERE feedID = new.feedID)
+                          ELSE MAX(COALESCE(last_played, new.played), COALESCE(new.played, last_played)) END
+    WHERE feedID = new.feedID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS episodes__stats_published AFTER UPDATE OF published ON episodes BEGIN
+    UPDATE feed_stats SET
+        latest = CASE WHEN old.published >= latest AND new.published < old.published
+                     THEN (SELECT MAX(published) FROM episodes WHERE feedID = new.feedID)
+                     ELSE MAX(COALESCE(latest, new.published), COALESCE(new.published, latest)) END
+    WHERE feedID = new.feedID;
+END;
+
+
+-- Feed.maxtitlelength(): MAX(LENGTH(title)) from the end of the index alone
+CREATE INDEX IF NOT EXISTS feeds__title_length_index ON feeds (LENGTH(title));
@@ -0,0 +1,4 @@
+-- Episode.page() of the Unplayed playlist: unplayed episodes of every feed,
+-- in published order, from the index alone
+CREATE INDEX IF NOT EXISTS episodes__unplayed_published_index ON episodes (published)
+    WHERE played IS NULL;
@@ -0,0 +1,3 @@
+-- Hash of the last feed file downloaded, so an identical one needn't be
+-- parsed again, from hosts that don't do conditional GETs
+ALTER TABLE feeds ADD COLUMN body_hash TEXT;
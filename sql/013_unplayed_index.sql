@@ -0,0 +1,4 @@
+-- No query reads a feed's unplayed episodes in published order, and
+-- marking a feed played (WriteBuffer) finds its episodes just as well through
+-- episodes__feed_published_index, so this only slowed every insert & update
+DROP INDEX IF EXISTS episodes__unplayed_index;
@@ -0,0 +1,197 @@
+"""
+Background work for the UI.
+
+Anything that can block for long, fetching feeds above all, is run on a
+thread pool rather than on urwid's event loop, so a slow or dead host never
+freezes the interface, nor the vlc events passed through the loop. Results
+are handed back on the event loop's thread, where widgets can be touched.
+"""
+from __future__ import annotations
+import asyncio
+from concurrent.futures import Executor, Future
+import queue
+from threading import Event, Lock, Thread
+from time import monotonic
+
+from typing import(
+    Any,
+    Callable,
+    List,
+    Optional,
+    Tuple,
+)
+
+
+class Task:
+    """
+    A piece of work running, or waiting to run, on the pool.
+    """
+    def __init__(self, description: str):
+        self.description : str = description
+        self.started     : float = monotonic()
+        # Set once cancelled, for work that can stop part way to check
+        self.cancelled   : Event = Event()
+
+        self._future : Optional[asyncio.Future] = None
+
+    @property
+    def elapsed(self) -> float:
+        """
+        Seconds since the task was submitted.
+        """
+        return monotonic() - self.started
+
+    def cancel(self):
+        """
+        Cancel the task. If it hasn't started it never will, and if it has
+        its result (or error) is thrown away once it's done.
+        """
+        self.cancelled.set()
+        if self._future is not None:
+            self._future.cancel()
+
+
+class _Pool(Executor):
+    """
+    A thread pool like ThreadPoolExecutor, but of daemon threads, so a task
+    stalled on a slow or dead host never holds up quitting; the interpreter
+    waits on every ThreadPoolExecutor thread as it exits.
+    Tasks write through the db writer (see db.Writer), which is seen out at
+    exit, so have nothing left half done when abandoned.
+    """
+    def __init__(self, workers: int, name: str):
+        self._workers  : int = workers
+        self._name     : str = name
+        self._queue    : queue.SimpleQueue = queue.SimpleQueue()
+        self._threads  : List[Thread] = []
+        self._lock     : Lock = Lock()
+        self._shutdown : bool = False
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after shutdown')
+            future = Future()
+            self._queue.put((future, fn, args, kwargs))
+            if len(self._threads) < self._workers:
+                thread = Thread(target=self._run, name='{}_{}'.format(self._name, len(self._threads)), daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while True:
+                    try:
+                        job = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is not None:
+                        job[0].cancel()
+            for _ in self._threads:
+                self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            future, fn, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+
+class Tasks:
+    """
+    Runs tasks on a thread pool, calling back on an asyncio event loop (the
+    one urwid's AsyncioEventLoop runs on) as they finish.
+    Apart from the work itself, everything happens on the loop's thread, so
+    needs no locking.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, workers: int = 4,
+                 on_change: Optional[Callable[[], None]] = None):
+        """
+        :param loop: Event loop to call back on
+        :param workers: Maximum number of tasks run at once
+        :param on_change: Called whenever a task is submitted or finishes,
+                          after the task's own callbacks, e.g. to update a
+                          status line & redraw the screen
+        """
+        self.on_change = on_change
+
+        self._loop     : asyncio.AbstractEventLoop = loop
+        self._executor : _Pool = _Pool(workers, 'task')
+        self._tasks    : List[Task] = []
+
+    @property
+    def running(self) -> Tuple[Task, ...]:
+        """
+        Tasks not yet finished or cancelled, oldest first.
+        """
+        return tuple(self._tasks)
+
+    def submit(self, description: str, fn: Callable[[Task], Any],
+               done: Optional[Callable[[Any], None]] = None,
+               failed: Optional[Callable[[BaseException], None]] = None) -> Task:
+        """
+        Run fn(task) on the pool. Must be called on the loop's thread.
+        :param description: What the task is doing, for showing the user
+        :param done: Called on the loop with what fn returns
+        :param failed: Called on the loop with what fn raises; without it
+                       the error is raised on the loop, as any other error
+                       in a callback would be
+        """
+        task = Task(description)
+        task._future = self._loop.run_in_executor(self._executor, fn, task)
+        task._future.add_done_callback(lambda f: self._finished(task, done, failed))
+        self._tasks.append(task)
+        self._changed()
+        return task
+
+    def cancel(self, task: Optional[Task] = None):
+        """
+        Cancel a task, or the most recently submitted if none is given.
+        """
+        if task is None:
+            if not self._tasks:
+                return
+            task = self._tasks[-1]
+        task.cancel()
+
+    def shutdown(self):
+        """
+        Cancel every task, without waiting on those already running, which
+        don't hold up quitting either.
+        """
+        for task in self._tasks:
+            task.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _finished(self, task: Task, done: Optional[Callable], failed: Optional[Callable]):
+        self._tasks.remove(task)
+        try:
+            if task.cancelled.is_set():
+                return
+            e = task._future.exception()
+            if e is None:
+                if done is not None:
+                    done(task._future.result())
+            elif failed is not None:
+                failed(e)
+            else:
+                raise e
+        finally:
+            self._changed()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
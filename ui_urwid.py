@@ -1,17 +1,30 @@
+import asyncio
 from functools import reduce
+import os
 
 import urwid
 
+from typing import(
+    Optional,
+    Sequence,
+    Union,
+)
+
 from ui_interface import UIInterface
+import metrics
 from feed import Feed
 from episode import Episode
+from cache import AudioCache
+from scheduler import Scheduler
+from singleton import Singleton
+from tasks import Task, Tasks
 from urwid_widgets import(
     SelectionList,
     PackableLineBox,
     EditDialogue,
     InformationDialogue,
+    SearchBox,
 )
-from player import Player
 
 
 class UI(UIInterface):
@@ -24,19 +37,38 @@ class UI(UIInterface):
 
     def __init__(self):
         self.main_widget     : urwid.Widget
+        self.columns         : urwid.Columns
         self.feeds_box       : urwid.Widget
         self.feeds_list      : SelectionList
         self.episodes_box    : urwid.Widget
+        self.episodes_frame  : urwid.Frame
         self.episodes_list   : SelectionList
+        self.search_box      : Optional[SearchBox]
         self.information_box : urwid.Widget
+        self.information     : urwid.Text
         self.loop            : urwid.AsyncioEventLoop
+        self.scheduler       : Scheduler
+        self.tasks           : Tasks
+        self.status          : urwid.Text
+        self.feeds_sort      : str
+
+        self.feeds_sort = 'id'
+        self._refreshing = False
+        self._search_task : Optional[Task] = None
+        self._status_alarm = None
+        # Shown in the status line while nothing is running
+        self._status_note = ''
 
         self._construct_feeds()
         self._construct_episodes()
         self._construct_information()
 
-        columns = urwid.Columns((('pack', self.feeds_box), self.episodes_box))
-        pile = MainWidget((columns, (8, self.information_box)))
+        self.search_box = None
+        # Shows what's running in the background, see Tasks
+        self.status = urwid.Text('')
+
+        self.columns = urwid.Columns((('pack', self.feeds_box), self.episodes_box))
+        pile = MainWidget((self.columns, (8, self.information_box), ('pack', self.status)))
 
         self.main_widget = pile
 
@@ -46,8 +78,7 @@ class UI(UIInterface):
         urwid.signals.emit_signal(self.feeds_list.listwalker, 'modified')
 
     def _construct_feeds(self):
-        f = tuple((f.title, f.id) for f in Feed.getall())
-        self.feeds_list = SelectionList('norm', 'focussed', 'selected', f)
+        self.feeds_list = SelectionList('norm', 'focussed', 'selected', self._feed_rows())
         self.feeds_box = PackableLineBox(
             self.feeds_list,
             'Feeds',
@@ -64,10 +95,48 @@ class UI(UIInterface):
             self._feeds_modified_cb
         )
 
+    def _feed_rows(self):
+        # Smart playlists come first, with their names as their data rather
+        # than feed ids. Unplayed counts come along with the feeds, see Feed.Stats
+        feeds = Feed.getall(self.feeds_sort)
+        unplayed = {'Unplayed': sum(f.stats.unplayed for f in feeds)}
+        return tuple(
+            (_badge(name, unplayed.get(name)), name) for name in Episode.playlists
+        ) + tuple(
+            (_badge(f.title, f.stats.unplayed), f.id) for f in feeds
+        )
+
+    def refreshfeeds(self):
+        """
+        Reload the feeds list, for new unplayed counts or a new order,
+        keeping the same feed selected (so the episodes list is left as is).
+        """
+        selected = self.feeds_list.selected.data if self.feeds_list.selected else None
+        rows = self._feed_rows()
+        ids = [x[1] for x in rows]
+        self._refreshing = True
+        try:
+            self.feeds_list.clear()
+            self.feeds_list.add(rows)
+            if selected in ids:
+                self.feeds_list.set_focus(ids.index(selected))
+        finally:
+            self._refreshing = False
+
+    def sortfeeds(self):
+        """
+        Cycle through the orders the feeds list can be sorted in.
+        """
+        sorts = tuple(Feed.sorts)
+        self.feeds_sort = sorts[(sorts.index(self.feeds_sort) + 1) % len(sorts)]
+        self.refreshfeeds()
+
     def _construct_episodes(self):
-        self.episodes_list = EpisodesList('norm', 'focussed', 'selected')
+        self.episodes_list = EpisodesList('norm', 'focussed', 'selected', lazy=True)
+        # Header is used to hold the search box, when searching
+        self.episodes_frame = urwid.Frame(self.episodes_list)
         self.episodes_box = urwid.LineBox(
-            self.episodes_list,
+            self.episodes_frame,
             'Episodes',
             rline=None,
             bline=None,
@@ -81,8 +150,10 @@ class UI(UIInterface):
         )
 
     def _construct_information(self):
+        # The selected episode's description, or metrics while they're on
+        self.information = urwid.Text(self._metrics_text() if metrics.enabled else '')
         self.information_box = urwid.LineBox(
-            urwid.SolidFill('~'), # TODO: replace this placeholder
+            urwid.Filler(self.information, valign='top'),
             'Information',
             lline=None,
             rline=None,
@@ -92,15 +163,119 @@ class UI(UIInterface):
         )
 
 
-    def runloop(self):
+    @property
+    def player(self):
+        # Imported on first use, as loading vlc is slow
+        from player import Player
+        return Player(self.loop.event_loop)
+
+    def runloop(self, screen: Optional[urwid.BaseScreen] = None):
+        """
+        :param screen: Screen to draw on & take input from, the terminal by default
+        """
+        aio = asyncio.new_event_loop()
         self.loop = urwid.MainLoop(
             self.main_widget,
             self.palette,
+            screen=screen,
             # This event loop plays nicer with vlc callbacks
-            event_loop=urwid.AsyncioEventLoop(),
+            event_loop=urwid.AsyncioEventLoop(loop=aio),
             unhandled_input=self.handle_input,
         )
-        self.loop.run()
+        # Network & heavy db work is run off the loop, so it never stalls
+        self.tasks = Tasks(aio, on_change=self._update_status)
+        # Feeds are refreshed in the background as they fall due, with the
+        # scheduler thread passing the ids of feeds with new episodes back to
+        # the main loop through a pipe
+        pipe = self.loop.watch_pipe(self._scheduled_cb)
+        self.scheduler = Scheduler(
+            on_update=lambda results: os.write(pipe, b''.join(b'%d\n' % r.feed.id for r in results if r.new)),
+        )
+        self.scheduler.start()
+        self._update_information()
+        try:
+            self.loop.run()
+        finally:
+            # Any refresh in progress stops, leaving the feeds it didn't get to for next time
+            self.scheduler.stop(wait=False)
+            self.tasks.shutdown()
+            # As are any downloads, if playing anything started them
+            if AudioCache in Singleton._instances:
+                AudioCache().stop()
+            aio.close()
+
+    # Seconds between refreshes of the metrics in the information pane
+    information_interval = 1
+
+    def _update_information(self, *_):
+        if metrics.enabled:
+            self.information.set_text(self._metrics_text())
+            self.loop.set_alarm_in(self.information_interval, self._update_information)
+
+    @staticmethod
+    def _metrics_text() -> str:
+        m = metrics.snapshot()
+        t = m['totals']
+        lines = ['SQL: {} statements, {:.1f} ms'.format(m['sql']['statements'], m['sql']['ms'])]
+        for s in m['sql']['slowest'][:2]:
+            lines.append('  {:8.1f} ms {:>6}x  {}'.format(s['ms'], s['count'], ' '.join(s['sql'].split())))
+        lines.append(
+            'Fetches: {:.0f} ({:.0f} not modified), {:.0f} KB; request {:.0f} ms, '
+            'transfer {:.0f} ms, parse {:.0f} ms; writes {:.0f} ms, {:.0f} new episodes'.format(
+                t.get('fetch.count', 0),
+                t.get('fetch.status.304', 0),
+                t.get('fetch.bytes', 0) / 1024,
+                t.get('fetch.request_ms', 0),
+                t.get('fetch.transfer_ms', 0),
+                t.get('fetch.parse_ms', 0) + t.get('fetch.fetch_ms', 0),
+                t.get('apply.write_ms', 0),
+                t.get('apply.new', 0),
+            )
+        )
+        fetches = [e for e in m['recent'] if e['event'] == 'fetch']
+        if fetches:
+            e = fetches[-1]
+            lines.append('Last: {} {} {}'.format(
+                e['url'] if e['feed'] is None else Feed(e['feed']).title,
+                e['status'],
+                ', '.join('{} {:.0f}'.format(k, v) for k, v in e.items() if k.endswith(('_ms', 'bytes', 'entries'))),
+            ))
+        return '\n'.join(lines)
+
+    # Seconds between updates of the status line, while tasks are running
+    status_interval = 1
+
+    def _update_status(self, *_):
+        """
+        Show the tasks running in the status line, with how long each has
+        been going, updated every status_interval while there are any, or
+        any note about what's shown otherwise.
+        """
+        tasks = self.tasks.running
+        if tasks:
+            self.status.set_text(('reversed', '{}  (x to cancel)'.format(
+                '; '.join('{} {:.0f}s'.format(t.description, t.elapsed) for t in tasks)
+            )))
+            if self._status_alarm is None:
+                self._status_alarm = self.loop.set_alarm_in(self.status_interval, self._status_tick)
+        else:
+            self.status.set_text(self._status_note)
+            if self._status_alarm is not None:
+                self.loop.remove_alarm(self._status_alarm)
+                self._status_alarm = None
+        # Tasks finish outside of urwid's input handling & alarms, which is
+        # when it would otherwise redraw
+        self.loop.draw_screen()
+
+    def _status_tick(self, *_):
+        self._status_alarm = None
+        self._update_status()
+
+    def canceltask(self):
+        """
+        Cancel the most recently started background task.
+        """
+        self.tasks.cancel()
 
     def infodialogue(self, title, message):
         InformationDialogue(
@@ -119,49 +294,202 @@ class UI(UIInterface):
             edit_attr='normal',
         ).display()
 
-    def addfeed(self, url):
-        try:
-            f = Feed.add(url)
-            self.feeds_list.add(f.title, f.id)
-        except Feed.Error as e:
-            self.infodialogue(
-                'Error Adding Feed',
-                e.__str__(),
+    def searchdialogue(self):
+        """
+        Open a search box above the episodes list, showing matching
+        episodes in the list as the user types.
+        """
+        if self.search_box is None:
+            self.search_box = SearchBox(self.loop)
+            urwid.connect_signal(self.search_box, 'search', self._search_cb)
+            urwid.connect_signal(self.search_box, 'done', self._search_done_cb)
+            urwid.connect_signal(self.search_box, 'cancel', self.closesearch)
+            self.episodes_frame.header = urwid.AttrMap(self.search_box, 'normal')
+        self.main_widget.focus_position = 0
+        self.columns.focus_position = 1
+        self.episodes_frame.focus_position = 'header'
+
+    @property
+    def searching(self) -> bool:
+        """
+        Whether the search box is open and has the focus.
+        """
+        return (
+            self.search_box is not None
+            and self.main_widget.focus_position == 0
+            and self.columns.focus_position == 1
+            and self.episodes_frame.focus_position == 'header'
+        )
+
+    def _search_cb(self, query):
+        # Results of an earlier query are no longer wanted
+        self._cancel_search()
+        self._status_note = ''
+        if not query.strip():
+            self._feeds_modified_cb()
+            self._update_status()
+            return
+        # Ranking matches can take a while on a large library, so the first
+        # page is searched for off the loop, and the rest as it's scrolled to
+        page = self.episodes_list.listwalker.page
+        self._search_task = self.tasks.submit(
+            'Searching for "{}"'.format(query),
+            lambda task: (tuple((e.title, e) for e in Episode.search(query, page)), Episode.search_capped(query)),
+            done=lambda result: self._searched(query, *result),
+        )
+
+    def _searched(self, query, rows, capped):
+        self._search_task = None
+        self.episodes_list.search(query, rows)
+        if capped:
+            self._status_note = 'Over {0} matches: the newest {0} are ranked first, then the rest'.format(
+                Episode.search_candidates,
             )
 
-    def _feeds_modified_cb(self):
-        if not self.feeds_list.selected:
+    def _cancel_search(self):
+        if self._search_task is not None:
+            self._search_task.cancel()
+            self._search_task = None
+
+    def _search_done_cb(self):
+        self.episodes_frame.focus_position = 'body'
+
+    def closesearch(self):
+        """
+        Close the search box, returning the episodes list to the selected feed.
+        """
+        self._cancel_search()
+        self._status_note = ''
+        self._update_status()
+        self.search_box = None
+        self.episodes_frame.header = None
+        self.episodes_frame.focus_position = 'body'
+        self._feeds_modified_cb()
+
+    def addfeed(self, url):
+        """
+        Add a feed in the background, as downloading it may take a while.
+        """
+        self.tasks.submit(
+            'Adding {}'.format(url),
+            lambda task: Feed.add(url, task.cancelled),
+            done=lambda f: self.refreshfeeds(),
+            failed=self._addfeed_failed,
+        )
+
+    def _addfeed_failed(self, e: BaseException):
+        # Anything could go wrong fetching & parsing whatever url was typed
+        # in, and none of it should take the UI down with it
+        self.infodialogue(
+            'Error Adding Feed',
+            e.__str__() if isinstance(e, Feed.Error) else '{}: {}'.format(type(e).__name__, e),
+        )
+
+    def _feeds_modified_cb(self, focus: Optional[Episode] = None):
+        if self._refreshing or not self.feeds_list.selected:
             return
-        # TODO: add support for special non-id entries (like e.g. 'All')
-        f = Feed(self.feeds_list.selected.data)
-        self.episodes_list.display(Episode.getbyfeed(f))
+        data = self.feeds_list.selected.data
+        # Smart playlists are displayed by name
+        self.episodes_list.display(data if isinstance(data, str) else Feed(data), focus)
+
+    def _scheduled_cb(self, data: bytes):
+        # The episodes list only needs reloading if it's showing a feed that
+        # has new episodes, or a playlist, and a search is left as it is
+        ids = {int(x) for x in data.split()}
+        selected = self.feeds_list.selected
+        if self.search_box is None and selected and ids and (
+                isinstance(selected.data, str) or selected.data in ids):
+            # Without jumping away from whichever episode was focused
+            focused = self.episodes_list.selected
+            self._feeds_modified_cb(focused.data if focused else None)
+        # Unplayed counts have gone up
+        if ids:
+            self.refreshfeeds()
+        return True
+
+    # Most episodes queued by playing from the episodes list, as reading the
+    # whole rest of a large playlist would hold the loop up
+    play_length = 200
 
     def _episodes_modified_cb(self):
-        pass
+        # Metrics take the information pane over while they're on
+        if metrics.enabled:
+            return
+        selected = self.episodes_list.selected
+        self.information.set_text((selected.data.text or '') if selected else '')
 
     @staticmethod
     def handle_input(i):
         pass
 
 
+def _badge(title: str, count: Optional[int]) -> str:
+    return '{} ({})'.format(title, count) if count else title
+
+
 class MainWidget(urwid.Pile):
     def keypress(self, size, key):
         ui = UI()
-        if key in ('q', 'esc'):
+        # Text typed into the search box mustn't trigger the shortcuts below
+        if ui.searching:
+            return super().keypress(size, key)
+        if key == 'esc' and ui.search_box is not None:
+            ui.closesearch()
+        elif key in ('q', 'esc'):
             raise urwid.ExitMainLoop
         elif key is 'a':
             ui.addfeeddialogue()
+        elif key == '/':
+            ui.searchdialogue()
+        elif key == 's':
+            ui.sortfeeds()
+        elif key == 'x':
+            ui.canceltask()
         elif key is 'p':
-            p = Player(ui.loop.event_loop)
-            # Play from the selected episode to the last episode
-            i = ui.episodes_list.data.index(ui.episodes_list.selected.data)
-            p.play(ui.episodes_list.data[i:])
+            # Play from the selected episode on, see UI.play_length
+            i = ui.episodes_list.focus_position
+            ui.player.play(ui.episodes_list.data[i:i + ui.play_length])
+        elif key == 'e':
+            ui.player.enqueue(ui.episodes_list.selected.data)
+        elif key == 'n':
+            ui.player.skip()
+        elif key == 'r':
+            ui.player.resume()
+        elif key == ' ':
+            ui.player.pause()
         else:
             return super().keypress(size, key)
 
 
 class EpisodesList(SelectionList):
-    def display(self, episodes):
-        self.clear()
-        for e in episodes:
-            self.add(e.title, e)
+    def display(self, f: Union[Feed, str], focus: Optional[Episode] = None):
+        """
+        Show the episodes of a feed or smart playlist, read from the db a
+        page at a time, see Episode.page().
+        :param focus: Episode to keep the focus on, e.g. as the list is
+                      reloaded, wherever it now is in the list
+        """
+        self.listwalker.reset(
+            lambda limit, after, backward=False: tuple(
+                (e.title, e) for e in Episode.page(f, after, limit, backward)
+            ),
+            key=lambda e: e.key,
+            count=lambda: Episode.count(f),
+            backward=True,
+        )
+        if focus is not None:
+            try:
+                self.listwalker.seek(Episode.count(f, focus.key), focus.key)
+            except IndexError:
+                # Gone from the end of a playlist, so left at the top
+                pass
+
+    def search(self, query: str, first: Optional[Sequence] = None):
+        """
+        Show the episodes matching a search, best matches first.
+        :param first: The first page of (title, episode) rows, if already searched for
+        """
+        self.listwalker.reset(
+            lambda limit, offset: tuple((e.title, e) for e in Episode.search(query, limit, offset)),
+            first=first,
+        )
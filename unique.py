@@ -1,9 +1,157 @@
+from collections import OrderedDict
+from threading import RLock
+from weakref import WeakValueDictionary
+
+from typing import(
+    Any,
+    Dict,
+    Hashable,
+    Optional,
+    Tuple,
+)
+
+
+class IdentityMap:
+    """
+    Maps ids to the one live instance for that id.
+    Every instance is held weakly, so is dropped once nothing else uses it,
+    but the `size` most recently used are also held strongly in an LRU so
+    that browsing back & forth doesn't rebuild them from the db each time.
+    """
+    def __init__(self, size: int):
+        self.size      : int = size
+        self.lock      : RLock = RLock()
+        self.hits      : int = 0
+        self.misses    : int = 0
+        self.evictions : int = 0
+
+        self._weak   : WeakValueDictionary = WeakValueDictionary()
+        self._strong : OrderedDict = OrderedDict()
+
+    def __len__(self):
+        return len(self._weak)
+
+    def __contains__(self, key: Hashable):
+        return key in self._weak
+
+    def values(self) -> Tuple[Any, ...]:
+        with self.lock:
+            return tuple(self._weak.values())
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            obj = self._weak.get(key)
+            if obj is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touch(key, obj)
+            return obj
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Like get(), but without counting the lookup or touching the LRU."""
+        return self._weak.get(key)
+
+    def put(self, key: Hashable, obj: Any):
+        with self.lock:
+            self._weak[key] = obj
+            self._touch(key, obj)
+
+    def discard(self, key: Hashable):
+        with self.lock:
+            self._weak.pop(key, None)
+            self._strong.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self._weak.clear()
+            self._strong.clear()
+
+    def resize(self, size: int):
+        with self.lock:
+            self.size = size
+            self._trim()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits'      : self.hits,
+            'misses'    : self.misses,
+            'evictions' : self.evictions,
+            'live'      : len(self._weak),
+            'strong'    : len(self._strong),
+            'size'      : self.size,
+        }
+
+    def _touch(self, key: Hashable, obj: Any):
+        self._strong[key] = obj
+        self._strong.move_to_end(key)
+        self._trim()
+
+    def _trim(self):
+        while len(self._strong) > self.size:
+            self._strong.popitem(last=False)
+            self.evictions += 1
+
+
 class Unique(type):
+    """
+    Metaclass ensuring only one instance exists per id (the first argument
+    to the constructor), via an IdentityMap per class.
+    Classes can set `cachesize` to size the strong LRU tier of their map.
+    """
     _instances = dict()
 
+    cachesize = 1024
+
+    def __init__(cls, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        Unique._instances[cls] = IdentityMap(cls.cachesize)
+
     def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = dict()
-        if args[0] not in cls._instances[cls]:
-            cls._instances[cls][args[0]] = super().__call__(*args, **kwargs)
-        return cls._instances[cls][args[0]]
+        m = Unique._instances[cls]
+        # Held while constructing, so threads building the same id at once
+        # all end up with the same instance
+        with m.lock:
+            obj = m.get(args[0])
+            if obj is None:
+                obj = super().__call__(*args, **kwargs)
+                m.put(args[0], obj)
+            return obj
+
+    def invalidate(cls, id: Optional[Hashable] = None):
+        """
+        Forget the cached instance for id (or all instances if no id is given),
+        so the next construction reloads it from the db.
+        Anything still holding the old instance keeps it, stale.
+        """
+        if id is None:
+            Unique._instances[cls].clear()
+        else:
+            Unique._instances[cls].discard(id)
+
+    def refresh(cls, id: Hashable):
+        """
+        Reload the fields of the cached instance for id from the db, in place.
+        :return: The refreshed instance, or None if it wasn't cached
+        """
+        m = Unique._instances[cls]
+        with m.lock:
+            obj = m.peek(id)
+            if obj is not None:
+                obj.__init__(id)
+            return obj
+
+    def cached(cls) -> Tuple:
+        """
+        :return: Every instance currently live
+        """
+        return Unique._instances[cls].values()
+
+    def setcachesize(cls, size: int):
+        Unique._instances[cls].resize(size)
+
+    def cachestats(cls) -> Dict[str, int]:
+        """
+        :return: hit/miss/eviction counters & current sizes of the identity map
+        """
+        return Unique._instances[cls].stats()
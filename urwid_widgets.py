@@ -1,16 +1,35 @@
+from __future__ import annotations
+from collections import Counter
+
 import urwid
 
 from typing import(
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
     Tuple,
 )
 
 class SelectionList(urwid.ListBox):
-    def __init__(self, attr, focussed_attr, selected_attr, items = None, mousescroll=4):
+    def __init__(self, attr, focussed_attr, selected_attr, items = None, mousescroll=4, lazy=False):
         self.attr = attr
         self.focussed_attr = focussed_attr
         self.selected_attr = selected_attr
-        self.listwalker = urwid.SimpleFocusListWalker([])
+        if lazy:
+            self.listwalker = LazyListWalker(
+                lambda text, data: self.SelectableRow(text, self.attr, self.focussed_attr, data)
+            )
+        else:
+            self.listwalker = urwid.SimpleFocusListWalker([])
+            # Keep the packing size up to date as rows are added/removed/changed,
+            # rather than scanning every row on every render
+            self.listwalker.set_validate_contents_modified(self._rows_modified)
         self.mousescroll = mousescroll
+        self._widths = Counter()
+        self._lines = 0
 
         super().__init__(self.listwalker)
 
@@ -28,7 +47,9 @@ class SelectionList(urwid.ListBox):
             self.add(items)
 
     @property
-    def data(self) -> Tuple:
+    def data(self) -> Sequence:
+        if isinstance(self.listwalker, LazyListWalker):
+            return self.listwalker.data
         return tuple(d.data for d in self.listwalker)
 
     def add(self, text, data = None):
@@ -44,19 +65,42 @@ class SelectionList(urwid.ListBox):
         Clears the list held in the underlying list walker
         """
         self.listwalker.clear()
+        self._widths.clear()
+        self._lines = 0
 
     def pack(self, size, focus=False):
         """
         Calculates packing size based on that of the children.
         Columns is the max() column size of the children, rows is the sum.
         """
-        col = 0
-        row = 0
-        for x in self.listwalker:
-            p = x.pack(size)
-            col = max(col, p[0])
-            row += p[1]
-        return col, row
+        col = max(self._widths) if self._widths else 0
+        if isinstance(self.listwalker, LazyListWalker) or (size and size[0] < col):
+            # Rows will wrap, so the number of rows depends on the width
+            col = 0
+            row = 0
+            for x in self.listwalker:
+                p = x.pack(size)
+                col = max(col, p[0])
+                row += p[1]
+            return col, row
+        return col, self._lines
+
+    def _rows_modified(self, indices, new_items):
+        """
+        Validation callback of the list walker, called before its contents change.
+        """
+        if not isinstance(indices, slice):
+            indices = slice(*indices)
+        for x in self.listwalker[indices]:
+            w, l = x.pack(None)
+            self._widths[w] -= 1
+            if not self._widths[w]:
+                del self._widths[w]
+            self._lines -= l
+        for x in new_items:
+            w, l = x.pack(None)
+            self._widths[w] += 1
+            self._lines += l
 
     def mouse_event(self, size, event, button, col, row, focus):
         """
@@ -88,6 +132,249 @@ class SelectionList(urwid.ListBox):
             self.data = data
 
 
+class LazyListWalker(urwid.ListWalker):
+    """
+    List walker that pages rows in from a source on demand, rather than
+    holding a widget for every row.
+    The source is a callable taking (limit, offset) and returning a sequence
+    of (text, data) tuples, which is read a page at a time. Widgets are only
+    built for rows that are actually asked for, and rows & widgets more than
+    `window` pages from the focus are discarded as the focus moves.
+    Given a key function as well, the source is paged by key instead: it
+    takes (limit, after), after being the key of the data of the row before
+    the first wanted (None for the first page), and the key each page ends
+    on is remembered for reading the next.
+    Jumping to the end (see positions()) needs the number of rows, which is
+    found by reading to the end unless a count function is given. Keyed
+    sources that can be read backwards, taking (limit, before, True) for
+    the rows before the key of the row after them (None for the last rows),
+    have pages near the end read back from there instead of from the start.
+    """
+    def __init__(self, make_row: Callable[[str, Any], urwid.Widget],
+                 source: Optional[Callable[[int, int], Sequence[Tuple[str, Any]]]] = None,
+                 page: int = 64,
+                 window: int = 1,
+                 ):
+        self.make_row = make_row
+        self.page = page
+        self.window = window
+
+        self.focus     : int = 0
+        self._source   : Optional[Callable] = None
+        self._key      : Optional[Callable[[Any], Any]] = None
+        self._count    : Optional[Callable[[], int]] = None
+        self._backward : bool = False
+        self._pages    : Dict[int, List[Tuple[str, Any]]] = {}
+        self._widgets  : Dict[int, urwid.Widget] = {}
+        # Key of the row before each page, & of the row after each page,
+        # for keyed sources
+        self._after    : Dict[int, Any] = {}
+        self._before   : Dict[int, Any] = {}
+        # Position of the last row, once it's been found
+        self._last     : Optional[int] = None
+
+        self.reset(source)
+
+    def reset(self, source: Optional[Callable[[int, Any], Sequence[Tuple[str, Any]]]],
+              key: Optional[Callable[[Any], Any]] = None,
+              first: Optional[Sequence[Tuple[str, Any]]] = None,
+              count: Optional[Callable[[], int]] = None,
+              backward: bool = False):
+        """
+        Replace the source, dropping everything read from the old one.
+        :param key: Function giving the key of a row's data, if the source
+                    is paged by key rather than offset
+        :param first: The first page of the source, if it's already been
+                      read, e.g. off the event loop
+        :param count: Function giving the number of rows in the source
+        :param backward: Whether the (keyed) source can be read backwards
+        """
+        self._source = source
+        self._key = key
+        self._count = count
+        self._backward = backward and key is not None
+        self._pages.clear()
+        self._widgets.clear()
+        self._after = {0: None}
+        self._before = {}
+        self._last = None
+        if first is not None:
+            self._pages[0] = list(first)
+            if key is not None and len(first) >= self.page:
+                self._after[1] = key(first[self.page - 1][1])
+        self.focus = 0
+        self._modified()
+
+    def clear(self):
+        self.reset(None)
+
+    @property
+    def data(self) -> LazyListWalker.Data:
+        return self.Data(self)
+
+    def row(self, position: int) -> Tuple[str, Any]:
+        """
+        :return: (text, data) of the row at position, reading its page if needed
+        """
+        if self._source is None or position < 0:
+            raise IndexError(position)
+        p = position // self.page
+        if p not in self._pages:
+            self._pages[p] = self._read_page(p)
+        rows = self._pages[p]
+        if position - p * self.page >= len(rows):
+            raise IndexError(position)
+        return rows[position - p * self.page]
+
+    def _read_page(self, p: int) -> List[Tuple[str, Any]]:
+        """
+        Read page p, backwards from the page after it if that's where the
+        nearest known key is.
+        """
+        if not self._backward or p in self._after:
+            return self._read(self.page, p * self.page)
+        if p in self._before:
+            rows = list(self._source(self.page, self._before[p], True))
+        elif self._last is not None and p == self._last // self.page:
+            rows = list(self._source(self._last - p * self.page + 1, None, True))
+        else:
+            return self._read(self.page, p * self.page)
+        if rows:
+            self._before.setdefault(p - 1, self._key(rows[0][1]))
+            if len(rows) == self.page:
+                self._after.setdefault(p + 1, self._key(rows[-1][1]))
+        return rows
+
+    def _read(self, limit: int, offset: int) -> List[Tuple[str, Any]]:
+        """
+        Read rows from the source, however it's paged.
+        :param limit: Maximum number of rows, -1 for no limit
+        """
+        if self._key is None:
+            return list(self._source(limit, offset))
+        # Start from the nearest page whose preceding key is known, which is
+        # the page itself unless reading out of order
+        p = max(x for x in self._after if x * self.page <= offset)
+        skip = offset - p * self.page
+        rows = list(self._source(-1 if limit < 0 else limit + skip, self._after[p]))
+        for i in range(self.page, len(rows) + 1, self.page):
+            self._after.setdefault(p + i // self.page, self._key(rows[i - 1][1]))
+        return rows[skip:]
+
+    def __getitem__(self, position: int) -> urwid.Widget:
+        if position not in self._widgets:
+            self._widgets[position] = self.make_row(*self.row(position))
+        return self._widgets[position]
+
+    def next_position(self, position: int) -> int:
+        self.row(position + 1)
+        return position + 1
+
+    def prev_position(self, position: int) -> int:
+        self.row(position - 1)
+        return position - 1
+
+    def positions(self, reverse=False):
+        if reverse:
+            last = self.last()
+            return iter(()) if last is None else range(last, -1, -1)
+        return self._forward()
+
+    def _forward(self):
+        i = 0
+        while True:
+            try:
+                self.row(i)
+            except IndexError:
+                return
+            yield i
+            i += 1
+
+    def last(self) -> Optional[int]:
+        """
+        :return: Position of the last row, None if there are none
+        """
+        if self._source is None:
+            return None
+        if self._count is not None:
+            n = self._count()
+        else:
+            # Read a page at a time until one comes up short
+            p = max(self._pages, default=0)
+            while True:
+                if p not in self._pages:
+                    self._pages[p] = self._read_page(p)
+                if len(self._pages[p]) < self.page:
+                    break
+                p += 1
+            n = p * self.page + len(self._pages[p])
+        self._last = n - 1 if n else None
+        return self._last
+
+    def seek(self, position: int, key: Any):
+        """
+        Focus the row at position, given the key of its data, without reading
+        the pages before it: for sources that can be read backwards, the key
+        of the row before its page is read back from it in one go.
+        :param key: Key of the row's data, or of where it would be in the
+                    source, were it no longer there
+        """
+        p = position // self.page
+        if self._backward and p not in self._after:
+            skip = position - p * self.page
+            rows = self._source(skip + 1, key, True)
+            if len(rows) == skip + 1:
+                self._after[p] = self._key(rows[0][1])
+        self.set_focus(position)
+
+    def set_focus(self, position: int):
+        self.row(position)
+        self.focus = position
+        self._trim()
+        self._modified()
+
+    def _trim(self):
+        """
+        Discard pages & widgets outside the window around the focus.
+        """
+        p = self.focus // self.page
+        low = (p - self.window) * self.page
+        high = (p + self.window + 1) * self.page
+        for x in [x for x in self._pages if abs(x - p) > self.window]:
+            del self._pages[x]
+        for x in [x for x in self._widgets if not low <= x < high]:
+            del self._widgets[x]
+
+    class Data:
+        """
+        Read-only view of the data of every row, read from the source as needed.
+        Slicing reads the whole slice from the source in one go.
+        """
+        def __init__(self, walker: LazyListWalker):
+            self._walker = walker
+
+        def __getitem__(self, i):
+            if isinstance(i, slice):
+                if i.step not in (None, 1) or (i.start or 0) < 0 or (i.stop or 0) < 0:
+                    raise ValueError('Only forward slices from the start are supported')
+                start = i.start or 0
+                limit = -1 if i.stop is None else max(i.stop - start, 0)
+                if self._walker._source is None or limit == 0:
+                    return ()
+                return tuple(d for _, d in self._walker._read(limit, start))
+            return self._walker.row(i)[1]
+
+        def __iter__(self):
+            for i in self._walker.positions():
+                yield self._walker.row(i)[1]
+
+        def index(self, value) -> int:
+            for i, d in enumerate(self):
+                if d == value:
+                    return i
+            raise ValueError(value)
+
+
 class PackableLineBox(urwid.LineBox):
     # TODO: calculate amount of padding needed by sides being used
     def pack(self, size=None, focus=False):
@@ -95,6 +382,50 @@ class PackableLineBox(urwid.LineBox):
         return max(s[0], len(self.title_widget.text)+4), s[1]+1
 
 
+class SearchBox(urwid.Edit):
+    """
+    Single line edit for search-as-you-type.
+    Emits 'search' with the text once typing pauses for `delay` seconds,
+    'done' when enter is pressed and 'cancel' when escape is pressed.
+    """
+    signals = urwid.Edit.signals + ['search', 'done', 'cancel']
+
+    def __init__(self, loop, caption='/', delay=0.2):
+        super().__init__(caption)
+        self._loop = loop
+        self.delay = delay
+        self._alarm = None
+        self._text = ''
+        urwid.connect_signal(self, 'change', self._changed)
+
+    def _changed(self, _, text):
+        self._text = text
+        self._cancel_alarm()
+        self._alarm = self._loop.set_alarm_in(self.delay, lambda *_: self._search())
+
+    def _cancel_alarm(self):
+        if self._alarm is not None:
+            self._loop.remove_alarm(self._alarm)
+            self._alarm = None
+
+    def _search(self):
+        self._alarm = None
+        urwid.emit_signal(self, 'search', self._text)
+
+    def keypress(self, size, key):
+        if key == 'enter':
+            # Don't wait on the delay if the user is done typing
+            if self._alarm is not None:
+                self._cancel_alarm()
+                self._search()
+            urwid.emit_signal(self, 'done')
+        elif key == 'esc':
+            self._cancel_alarm()
+            urwid.emit_signal(self, 'cancel')
+        else:
+            return super().keypress(size, key)
+
+
 class EditDialogue(urwid.Overlay):
     def __init__(self, title, loop, ok_callback,
         text='',
@@ -0,0 +1,120 @@
+import atexit
+from concurrent.futures import Future
+from threading import Lock, Timer
+
+import db
+from singleton import Singleton
+
+from typing import(
+    Dict,
+    Optional,
+)
+
+
+class WriteBuffer(metaclass=Singleton):
+    """
+    Write-behind buffer for playback state: resume positions & played marks.
+    Repeated updates to the same episode are merged, and everything is written
+    in one transaction on an interval (or when flushed, e.g. on pause/stop and
+    at exit), rather than each update being committed as it happens.
+    """
+    def __init__(self, interval: float = 10):
+        """
+        :param interval: Seconds to hold updates before writing them
+        """
+        self.interval = interval
+
+        self._lock = Lock()
+        self._timer : Optional[Timer] = None
+        self._positions    : Dict[int, Optional[int]] = {}
+        self._played       : Dict[int, Optional[float]] = {}
+        self._feeds_played : Dict[int, float] = {}
+
+        atexit.register(self.flush)
+
+    def position(self, id: int, position: Optional[int]):
+        """
+        Set the resume position of an episode.
+        :param id: Episode id
+        :param position: Milliseconds into the episode, or None to clear it
+        """
+        with self._lock:
+            self._positions[id] = position
+            self._schedule()
+
+    def played(self, id: int, timestamp: Optional[float]):
+        """
+        Set when an episode was played, or None to mark it unplayed.
+        """
+        with self._lock:
+            self._played[id] = timestamp
+            self._schedule()
+
+    def feedplayed(self, id: int, timestamp: float):
+        """
+        Mark every unplayed episode of a feed as played, in one statement.
+        :param id: Feed id
+        """
+        with self._lock:
+            self._feeds_played[id] = timestamp
+            self._schedule()
+
+    def flush(self) -> Future:
+        """
+        Write everything buffered so far, on the db writer thread.
+        Should the write fail, what it held is buffered again to be retried,
+        behind anything newer for the same episodes.
+        :return: Future resolving once written
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            positions, self._positions = self._positions, {}
+            played, self._played = self._played, {}
+            feeds_played, self._feeds_played = self._feeds_played, {}
+
+        if not (positions or played or feeds_played):
+            future = Future()
+            future.set_result(None)
+            return future
+
+        def write():
+            c = db.connection
+            c.executemany('UPDATE episodes SET played=? WHERE feedID=? AND played IS NULL;',
+                          ((v, k) for k, v in feeds_played.items()))
+            c.executemany('UPDATE episodes SET played=? WHERE id=?;', ((v, k) for k, v in played.items()))
+            c.executemany('UPDATE episodes SET position=? WHERE id=?;', ((v, k) for k, v in positions.items()))
+
+        # Only resolved once anything failing has been buffered again
+        flushed = Future()
+
+        def done(future: Future):
+            error = future.exception()
+            if error is not None:
+                self._restore(positions, played, feeds_played)
+                flushed.set_exception(error)
+            else:
+                flushed.set_result(None)
+
+        db.write(write).add_done_callback(done)
+        return flushed
+
+    def _restore(self, positions: Dict[int, Optional[int]], played: Dict[int, Optional[float]],
+                 feeds_played: Dict[int, float]):
+        """
+        Buffer again the updates of a failed write, keeping any made to the
+        same episodes (or feeds) since, and schedule another go.
+        """
+        with self._lock:
+            for buffer, old in ((self._positions, positions), (self._played, played),
+                                (self._feeds_played, feeds_played)):
+                for k, v in old.items():
+                    buffer.setdefault(k, v)
+            self._schedule()
+
+    def _schedule(self):
+        if self._timer is None:
+            self._timer = Timer(self.interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()